@@ -2,6 +2,8 @@
 Flask application factory.
 """
 
+import os
+
 from celery.app import Celery
 from celery.app.task import Task
 from flask import Flask
@@ -64,32 +66,72 @@ def create_app(config=DEFAULT_CONFIG):
     ext.init_app(app)
     talisman.init_app(app, content_security_policy=app.config["CSP_POLICY"])
 
-    from app.utils.gtex_db import FakeGTExDatabase, NullGTExDatabase, RealGTExDatabase
-
     is_production = app.config.get("APP_ENV") == "production"
 
-    if app.config.get("MONGO_URI"):
+    if app.config.get("GTEX_PARQUET_PATH"):
+        if app.config.get("MONGO_URI"):
+            mongo.init_app(app)
+        from app.utils.gtex_db import ParquetGTExDatabase
+
+        app.logger.debug(f"Using GTEx Parquet dataset at {app.config['GTEX_PARQUET_PATH']}")
+        app.extensions["gtex_db"] = ParquetGTExDatabase(app.config["GTEX_PARQUET_PATH"])
+    elif app.config.get("MONGO_URI"):
         mongo.init_app(app)
         try:
             app.logger.debug("MongoDB connection test")
             _version = mongo.cx.server_info().get("version")
             app.logger.debug(f"Connected to MongoDB {_version}")
+            # The client reconnects on first use. Closing it here keeps the test's sockets and
+            # monitor threads out of processes forked from this one (gunicorn --preload, Celery
+            # prefork), which are not fork-safe; each process opens its own instead.
+            mongo.cx.close()
+            from app.utils.gtex_db import RealGTExDatabase
+
             app.extensions["gtex_db"] = RealGTExDatabase(mongo.cx)
         except Exception as e:
             if is_production:
                 raise RuntimeError("MongoDB connection failed in production") from e
             app.logger.error(f"MongoDB connection failed: {e}")
             app.logger.warning("Falling back to FakeGTExDatabase (synthetic GTEx data)")
+            from app.utils.gtex_db import FakeGTExDatabase
+
             app.extensions["gtex_db"] = FakeGTExDatabase()
     else:
         if is_production:
             raise RuntimeError("MONGO_CONNECTION_STRING is required in production")
         app.logger.warning("No MONGO_CONNECTION_STRING set; using FakeGTExDatabase (synthetic GTEx data)")
+        from app.utils.gtex_db import FakeGTExDatabase
+
         app.extensions["gtex_db"] = FakeGTExDatabase()
 
+    from app.utils.gtex_fetcher import GTExFetcher
+
+    app.extensions["gtex_fetcher"] = GTExFetcher(app.config["GTEX_FETCH_WORKERS"])
+
     celery_init_app(app)
     cache.init_app(app)
 
+    if app.config.get("LIFTOVER_CACHE_PATH"):
+        from app.utils.liftover_cache import LiftoverCache
+
+        app.extensions["liftover_cache"] = LiftoverCache(app.config["LIFTOVER_CACHE_PATH"])
+
+    if app.config["CACHE_TYPE"] != "NullCache" and app.config.get("EQTL_CACHE_MAX_BYTES"):
+        from app.utils.eqtl_cache import SharedEQTLCache
+
+        lock_path = None
+        if app.config["CACHE_TYPE"] == "FileSystemCache":
+            lock_path = os.path.join(app.config["CACHE_DIR"], "eqtl-ledger.lock")
+        app.extensions["eqtl_cache"] = SharedEQTLCache(
+            cache, app.config["EQTL_CACHE_MAX_BYTES"], lock_path
+        )
+
+    if app.config.get("PRELOAD_GENCODE"):
+        from app.utils.gencode import preload_gencode
+
+        app.logger.debug("Preloading GENCODE gene tables")
+        preload_gencode()
+
     if app.config["CACHE_TYPE"] == "NullCache":
         app.logger.debug("Cache is disabled")
     else:
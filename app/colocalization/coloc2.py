@@ -0,0 +1,592 @@
+"""
+In-process COLOC2 colocalization.
+
+A NumPy port of what `app/scripts/run_coloc2.R` computes with
+`coloc.eqtl.biom(..., p12 = 1e-6, useBETA = TRUE, match_snpid = TRUE)` from
+`app/scripts/coloc2/functions_coloc_likelihood_summary_integrated2.R`:
+
+1. eQTL variants with MAF <= 0.001 are dropped, and each ProbeID is matched
+   with the GWAS variants in its region (chromosome, min-max eQTL position).
+2. Per ProbeID and variant, approximate Bayes factors are computed from the
+   GWAS and eQTL effect sizes, and summed into per-locus log likelihoods
+   of the 5 COLOC hypotheses (H0-H4).
+3. The hypothesis priors are fitted across all ProbeIDs by maximum a posteriori
+   (Nelder-Mead, as R's `optim`), and give each ProbeID's PP.H4.
+
+Steps 1 and 2 are independent per ProbeID, and can be run on several processes
+(see `parallel_probe_likelihoods`); each is done on arrays of all ProbeIDs' variants at once.
+"""
+
+import atexit
+import math
+import os
+import threading
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# MAF filter applied to the eQTL data
+MAF_FILTER = 0.001
+# ProbeIDs with this many shared variants or fewer are skipped
+MIN_SNPS = 50
+# Priors of a variant being associated with the GWAS trait, the eQTL, and both,
+# for the PP*.coloc.priors columns
+P1 = 1e-4
+P2 = 1e-4
+P12 = 1e-6
+
+# Prior standard deviations of the effect sizes
+GWAS_SD_PRIOR = 0.15
+EQTL_SD_PRIOR_VARIANCES = (0.01, 0.1, 0.5)
+# Starting point of the prior fit, and the normal priors on its (log-scale) parameters
+ALPHAS_START = (2.0, -2.0, -2.0, -2.0, -2.0)
+ALPHAS_PRIOR_MEANS = (2.0, -2.0, -2.0, -2.0, -2.0)
+ALPHAS_PRIOR_SD = 3.0
+
+# Chunks of ProbeIDs per worker when computing likelihoods in parallel, and the
+# fewest eQTL rows in a chunk (smaller jobs are not worth starting processes for)
+CHUNKS_PER_WORKER = 4
+MIN_CHUNK_ROWS = 50_000
+
+GWAS_COLUMNS = ["SNPID", "CHR", "POS", "PVAL", "BETA", "SE", "N"]
+EQTL_COLUMNS = ["SNPID", "CHR", "POS", "PVAL", "BETA", "SE", "ProbeID", "N", "MAF"]
+ALLELE_COLUMNS = ["A1", "A2"]
+HYPOTHESES = ["lH0.abf", "lH1.abf", "lH2.abf", "lH3.abf", "lH4.abf"]
+_COMPLEMENT = {"A": "T", "T": "A", "G": "C", "C": "G"}
+
+
+def _logsumexp_groups(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """
+    Return log(sum(exp(values))) of each group of consecutive values beginning at starts
+    (R's `logsum`, for every group at once).
+    """
+    maxes = np.maximum.reduceat(values, starts)
+    sizes = np.diff(np.append(starts, len(values)))
+    sums = np.add.reduceat(np.exp(values - np.repeat(maxes, sizes)), starts)
+    return maxes + np.log(sums)
+
+
+def _logdiff(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Return log(|exp(x) - exp(y)|), elementwise (R's `logdiff`)."""
+    high = np.maximum(x, y)
+    with np.errstate(divide="ignore"):
+        return high + np.log(np.abs(np.exp(x - high) - np.exp(y - high)))
+
+
+def _labf(z: np.ndarray, V: np.ndarray, prior_variance: float) -> np.ndarray:
+    """Log approximate Bayes factor of an association with effect estimate z-score z and variance V."""
+    r = prior_variance / (prior_variance + V)
+    return 0.5 * (np.log(1 - r) + r * z**2)
+
+
+def nelder_mead(
+    fn: Callable[[np.ndarray], float],
+    x0: Sequence[float],
+    maxit: int = 500,
+    reltol: float = math.sqrt(np.finfo(float).eps),
+    alpha: float = 1.0,
+    beta: float = 0.5,
+    gamma: float = 2.0,
+) -> Tuple[np.ndarray, float]:
+    """
+    Minimize fn from x0 with the Nelder-Mead simplex method, step for step as R's
+    `optim(method = "Nelder-Mead")` (nmmin in R's src/appl/optim.c) with its default controls.
+
+    Returns the best point found and its value.
+    """
+    big = 1.0e35
+    n = len(x0)
+    bvec = np.array(x0, dtype=float)
+    f = fn(bvec)
+    if not np.isfinite(f):
+        raise ValueError("function cannot be evaluated at initial parameters")
+    funcount = 1
+    convtol = reltol * (abs(f) + reltol)
+    # Vertices are the columns 0..n of P, with their values in values; column n + 1 is the centroid
+    P = np.zeros((n, n + 2))
+    values = np.zeros(n + 2)
+    P[:, 0] = bvec
+    values[0] = f
+
+    step = max(0.1 * abs(b) for b in bvec)
+    if step == 0.0:
+        step = 0.1
+    size = 0.0
+    for j in range(1, n + 1):
+        P[:, j] = bvec
+        trystep = step
+        while P[j - 1, j] == bvec[j - 1]:
+            P[j - 1, j] = bvec[j - 1] + trystep
+            trystep *= 10
+        size += trystep
+    oldsize = size
+    L = 0
+    calcvert = True
+    C = n + 1
+
+    def evaluate(x: np.ndarray) -> float:
+        value = fn(x)
+        return value if np.isfinite(value) else big
+
+    while True:
+        if calcvert:
+            for j in range(n + 1):
+                if j != L:
+                    values[j] = evaluate(P[:, j].copy())
+                    funcount += 1
+            calcvert = False
+
+        VL = values[L]
+        VH = VL
+        H = L
+        for j in range(n + 1):
+            if j != L:
+                f = values[j]
+                if f < VL:
+                    L = j
+                    VL = f
+                if f > VH:
+                    H = j
+                    VH = f
+        if VH <= VL + convtol:
+            break
+
+        P[:, C] = (P[:, : n + 1].sum(axis=1) - P[:, H]) / n
+        bvec = (1.0 + alpha) * P[:, C] - alpha * P[:, H]
+        f = evaluate(bvec)
+        funcount += 1
+        VR = f
+        if VR < VL:
+            # Reflection was the best so far: try extending it
+            values[C] = f
+            extended = gamma * bvec + (1 - gamma) * P[:, C]
+            P[:, C] = bvec
+            bvec = extended
+            f = evaluate(bvec)
+            funcount += 1
+            if f < VR:
+                P[:, H] = bvec
+                values[H] = f
+            else:
+                P[:, H] = P[:, C]
+                values[H] = VR
+        else:
+            if VR < VH:
+                P[:, H] = bvec
+                values[H] = VR
+            bvec = (1 - beta) * P[:, H] + beta * P[:, C]
+            f = evaluate(bvec)
+            funcount += 1
+            if f < values[H]:
+                P[:, H] = bvec
+                values[H] = f
+            elif VR >= VH:
+                # Shrink the simplex towards the lowest vertex
+                calcvert = True
+                size = 0.0
+                for j in range(n + 1):
+                    if j != L:
+                        P[:, j] = beta * (P[:, j] - P[:, L]) + P[:, L]
+                        size += np.abs(P[:, j] - P[:, L]).sum()
+                if size < oldsize:
+                    oldsize = size
+                else:
+                    break
+        if funcount > maxit:
+            break
+
+    return P[:, L].copy(), values[L]
+
+
+def _log_dnorm(x: np.ndarray, mean: np.ndarray, sd: float) -> np.ndarray:
+    return np.log(np.exp(-0.5 * ((x - mean) / sd) ** 2) / (sd * math.sqrt(2 * math.pi)))
+
+
+def fit_hypothesis_priors(likelihoods: np.ndarray) -> np.ndarray:
+    """
+    Fit the prior probabilities of hypotheses H0-H4 to the per-locus log likelihoods
+    (a loci x 5 array), maximizing the posterior under normal priors on their log scale.
+
+    Returns the 5 prior probabilities.
+    """
+    means = np.array(ALPHAS_PRIOR_MEANS)
+
+    def negative_log_posterior(a: np.ndarray) -> float:
+        suma = np.exp(a).sum()
+        lkl = likelihoods + np.log(np.exp(a) / suma)
+        # The log likelihood of H0 is 0 at every locus
+        lkl[:, 0] = np.log(np.exp(a[0]) / suma)
+        maxes = lkl.max(axis=1)
+        sumlkl = (maxes + np.log(np.exp(lkl - maxes[:, None]).sum(axis=1))).sum()
+        return -(sumlkl + _log_dnorm(a, means, ALPHAS_PRIOR_SD).sum())
+
+    a, _ = nelder_mead(negative_log_posterior, ALPHAS_START)
+    return np.exp(a) / np.exp(a).sum()
+
+
+def _posteriors(log_abfs: np.ndarray, log_priors: np.ndarray) -> np.ndarray:
+    """Return the posterior probabilities of each row of log Bayes factors (loci x 5) under log_priors."""
+    lpost = log_abfs + log_priors
+    lpost -= lpost.max(axis=1, keepdims=True)
+    post = np.exp(lpost)
+    return post / post.sum(axis=1, keepdims=True)
+
+
+def _drop_one_duplicate(
+    df: pd.DataFrame, by: List[str], rank: Callable[[pd.DataFrame], pd.Series]
+) -> pd.DataFrame:
+    """
+    For each group of rows with the same values of by, drop the row ranking highest by
+    rank(rows) (the first of them in case of ties), as COLOC2 does to resolve duplicated variants.
+    """
+    duplicated = df[df.duplicated(by, keep=False)]
+    if len(duplicated) == 0:
+        return df
+    ranked = duplicated.assign(_rank=rank(duplicated)).sort_values(
+        "_rank", ascending=False, kind="stable"
+    )
+    return df.drop(ranked.drop_duplicates(by).index)
+
+
+def _alleles_length(df: pd.DataFrame) -> pd.Series:
+    return df["A1"].astype(str).str.len() + df["A2"].astype(str).str.len()
+
+
+def _match_regions(gwas_df: pd.DataFrame, eqtl_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Pair every ProbeID with the GWAS rows in its region. Returns the GWAS rows, repeated
+    per ProbeID, with the "probe" code of each, in ProbeID then GWAS row order.
+    """
+    regions = eqtl_df.groupby("probe", sort=True).agg(
+        CHR=("CHR", "first"), START=("POS", "min"), STOP=("POS", "max")
+    )
+    gwas_sorted = gwas_df.sort_values(["CHR", "POS"], kind="stable")
+    gwas_positions = gwas_sorted["POS"].to_numpy()
+    chrom_bounds = {
+        chrom: (rows[0], rows[-1] + 1)
+        for chrom, rows in gwas_sorted.reset_index(drop=True).groupby("CHR").indices.items()
+    }
+    starts = np.zeros(len(regions), dtype=np.int64)
+    stops = np.zeros(len(regions), dtype=np.int64)
+    for i, (chrom, start, stop) in enumerate(
+        zip(regions["CHR"], regions["START"], regions["STOP"])
+    ):
+        lo, hi = chrom_bounds.get(chrom, (0, 0))
+        starts[i] = lo + np.searchsorted(gwas_positions[lo:hi], start, side="left")
+        stops[i] = lo + np.searchsorted(gwas_positions[lo:hi], stop, side="right")
+    sizes = stops - starts
+    rows = np.concatenate(
+        [np.arange(start, stop) for start, stop in zip(starts, stops)]
+        or [np.zeros(0, dtype=np.int64)]
+    )
+    matched = gwas_sorted.iloc[rows].assign(probe=np.repeat(regions.index, sizes))
+    return matched.sort_values(["probe", "_row"], kind="stable")
+
+
+def _alleles_match(merged: pd.DataFrame) -> np.ndarray:
+    """Return whether the GWAS and eQTL alleles of each variant agree, allowing for flips and strand."""
+    columns = ["A1.biom", "A2.biom", "A1.eqtl", "A2.eqtl"]
+    # Compare alleles by code, so that the few distinct alleles are only uppercased and complemented once
+    codes, alleles = pd.factorize(
+        pd.concat([merged[column] for column in columns], ignore_index=True).astype(str)
+    )
+    upper_codes, upper_alleles = pd.factorize(pd.Index(alleles).str.upper())
+    complement_codes = upper_alleles.get_indexer(
+        [_COMPLEMENT.get(allele, allele) for allele in upper_alleles]
+    )
+    a1_gwas, a2_gwas, a1_eqtl, a2_eqtl = upper_codes[codes].reshape(len(columns), -1)
+    a1_comp, a2_comp = complement_codes[a1_eqtl], complement_codes[a2_eqtl]
+    return (
+        ((a1_gwas == a1_eqtl) & (a2_gwas == a2_eqtl))
+        | ((a1_gwas == a2_eqtl) & (a2_gwas == a1_eqtl))
+        | ((a1_gwas == a1_comp) & (a2_gwas == a2_comp))
+        | ((a1_gwas == a2_comp) & (a2_gwas == a1_comp))
+    )
+
+
+def merge_coloc2_inputs(
+    gwas_df: pd.DataFrame,
+    eqtl_df: pd.DataFrame,
+    maf_filter: float = MAF_FILTER,
+) -> Tuple[pd.DataFrame, List[str]]:
+    """
+    Match the GWAS variants with the eQTL variants of each ProbeID, filtered as COLOC2 does.
+
+    gwas_df needs the columns SNPID, CHR, POS, PVAL, BETA, SE and N, and eqtl_df those and
+    ProbeID and MAF. When both have A1 and A2 columns, variants with different alleles are dropped.
+    Variants are matched by SNPID within the region (CHR, min-max POS) of each ProbeID.
+
+    Returns the matched variants, one row per ProbeID and variant, with a "probe" column
+    indexing the ProbeIDs (in order of first appearance in eqtl_df), and the ProbeIDs.
+    """
+    with_alleles = all(
+        column in df for column in ALLELE_COLUMNS for df in (gwas_df, eqtl_df)
+    )
+    for name, df, columns in [
+        ("GWAS", gwas_df, GWAS_COLUMNS),
+        ("eQTL", eqtl_df, EQTL_COLUMNS),
+    ]:
+        missing = [column for column in columns if column not in df]
+        if missing:
+            raise ValueError(
+                f"These columns are missing from the COLOC2 {name} data: {', '.join(missing)}"
+            )
+
+    gwas_columns = GWAS_COLUMNS + (ALLELE_COLUMNS if with_alleles else [])
+    eqtl_columns = EQTL_COLUMNS + (ALLELE_COLUMNS if with_alleles else [])
+    # Rows are told apart by index below, and concatenated inputs may repeat it
+    eqtl_df = eqtl_df.loc[eqtl_df["MAF"] > maf_filter, eqtl_columns].dropna()
+    eqtl_df = eqtl_df.reset_index(drop=True)
+    gwas_df = gwas_df[gwas_columns].dropna().reset_index(drop=True)
+
+    gwas_df = gwas_df.assign(
+        CHR=gwas_df["CHR"].astype(str).str.replace("chr", "", regex=False),
+        _row=np.arange(len(gwas_df)),
+    )
+    probe_codes, probe_ids = pd.factorize(eqtl_df["ProbeID"].astype(str))
+    eqtl_df = eqtl_df.assign(
+        CHR=eqtl_df["CHR"].astype(str).str.replace("chr", "", regex=False),
+        probe=probe_codes,
+        _row=np.arange(len(eqtl_df)),
+    )
+
+    # Duplicated variants within a ProbeID's region: drop the one with the longest
+    # alleles (likely an indel), or with the highest MAF without alleles
+    gwas_region = _match_regions(gwas_df, eqtl_df).reset_index(drop=True)
+    if with_alleles:
+        gwas_region = _drop_one_duplicate(gwas_region, ["probe", "SNPID"], _alleles_length)
+        eqtl_df = _drop_one_duplicate(eqtl_df, ["probe", "SNPID"], _alleles_length)
+    else:
+        eqtl_df = _drop_one_duplicate(eqtl_df, ["probe", "SNPID"], lambda df: df["MAF"])
+
+    merged = gwas_region.merge(
+        eqtl_df.rename(columns={"MAF": "MAF.eqtl"}),
+        on=["probe", "SNPID"],
+        suffixes=(".biom", ".eqtl"),
+    )
+    merged = merged.sort_values(["probe", "_row.biom", "_row.eqtl"], kind="stable")
+    merged = merged[(merged["PVAL.biom"] > 0) & (merged["PVAL.eqtl"] > 0)]
+    if with_alleles:
+        merged = merged[_alleles_match(merged)]
+    merged = _drop_one_duplicate(
+        merged.reset_index(drop=True), ["probe", "SNPID"], lambda df: df["MAF.eqtl"]
+    )
+    return merged.reset_index(drop=True), list(probe_ids)
+
+
+def locus_likelihoods(merged: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compute the log approximate Bayes factors of every matched variant (from `merge_coloc2_inputs`,
+    sorted by probe), and sum them per probe.
+
+    Returns the probe codes, the number of variants of each, and the log Bayes factors
+    of each probe's locus under hypotheses H1-H4 relative to H0 (probes x 3: H1, H2 and H1+H2 summed).
+    """
+    probes = merged["probe"].to_numpy()
+    starts = np.flatnonzero(np.r_[True, probes[1:] != probes[:-1]])
+    nsnps = np.diff(np.append(starts, len(probes)))
+
+    # GWAS: one prior on the effect size
+    V1 = merged["SE.biom"].to_numpy(dtype=float) ** 2
+    z1 = merged["BETA.biom"].to_numpy(dtype=float) / np.sqrt(V1)
+    l1 = _labf(z1, V1, GWAS_SD_PRIOR**2)
+
+    # eQTL: the average over three priors, with the variance estimated from z, N and MAF
+    with np.errstate(invalid="ignore"):
+        z2 = merged["BETA.eqtl"].to_numpy(dtype=float) / merged["SE.eqtl"].to_numpy(dtype=float)
+    z2[np.isnan(z2)] = 0
+    maf = merged["MAF.eqtl"].to_numpy(dtype=float)
+    N2 = merged["N.eqtl"].to_numpy(dtype=float)
+    V2 = 1 / (2 * maf * (1 - maf) * (N2 + z2**2))
+    l2_priors = np.stack([_labf(z2, V2, variance) for variance in EQTL_SD_PRIOR_VARIANCES])
+    l2_max = l2_priors.max(axis=0)
+    l2 = l2_max + np.log(np.exp(l2_priors - l2_max).sum(axis=0)) - np.log(3)
+
+    sums = np.column_stack(
+        [
+            _logsumexp_groups(l1, starts),
+            _logsumexp_groups(l2, starts),
+            _logsumexp_groups(l1 + l2, starts),
+        ]
+    )
+    return probes[starts], nsnps, sums
+
+
+def probe_likelihoods(
+    gwas_df: pd.DataFrame, eqtl_df: pd.DataFrame, maf_filter: float = MAF_FILTER
+) -> pd.DataFrame:
+    """
+    Return the ProbeID, number of shared variants (nsnps) and summed log Bayes factors
+    (lsum1, lsum2, lsum12: see `locus_likelihoods`) of each ProbeID in eqtl_df with shared variants.
+
+    ProbeIDs are independent of each other here, so eqtl_df can be split by ProbeID
+    and the results concatenated.
+    """
+    merged, probe_ids = merge_coloc2_inputs(gwas_df, eqtl_df, maf_filter)
+    if len(merged) == 0:
+        probes, nsnps, sums = np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros((0, 3))
+    else:
+        probes, nsnps, sums = locus_likelihoods(merged)
+    return pd.DataFrame(
+        {
+            "ProbeID": [probe_ids[probe] for probe in probes],
+            "nsnps": nsnps,
+            "lsum1": sums[:, 0],
+            "lsum2": sums[:, 1],
+            "lsum12": sums[:, 2],
+        }
+    )
+
+
+def split_by_probe(eqtl_df: pd.DataFrame, n_chunks: int) -> List[pd.DataFrame]:
+    """
+    Split eqtl_df into up to n_chunks DataFrames of whole ProbeIDs, with about the same number
+    of rows each. ProbeIDs and rows keep their order.
+    """
+    codes, probe_ids = pd.factorize(eqtl_df["ProbeID"].astype(str))
+    order = np.argsort(codes, kind="stable")
+    # Row offset at which each ProbeID starts in order
+    probe_starts = np.searchsorted(codes[order], np.arange(len(probe_ids) + 1))
+    targets = np.linspace(0, len(eqtl_df), max(1, n_chunks) + 1)[1:-1]
+    bounds = np.unique(
+        np.concatenate([[0], probe_starts[np.searchsorted(probe_starts, targets)], [len(eqtl_df)]])
+    )
+    return [eqtl_df.iloc[order[lo:hi]] for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+
+# Process pool of `parallel_probe_likelihoods`, kept for the life of the process
+_pool = None
+_pool_key: Optional[Tuple[int, int]] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int):
+    """
+    Return this process's pool of worker processes, starting it on first use.
+
+    It is a billiard (Celery's fork of multiprocessing) pool, so that Celery's pool
+    processes, which are daemonic, can start it. Its processes are forked by a
+    forkserver, which has imported this module, rather than by this process,
+    which may be running threads (eg. the GTEx fetcher's).
+    """
+    global _pool, _pool_key
+    import billiard
+
+    with _pool_lock:
+        key = (os.getpid(), workers)
+        if _pool is None or _pool_key != key:
+            # A pool of the same process with another size is replaced; a parent's pool is not ours to stop
+            if _pool is not None and _pool_key is not None and _pool_key[0] == os.getpid():
+                _pool.terminate()
+            context = billiard.get_context("forkserver")
+            context.set_forkserver_preload([__name__])
+            _pool = context.Pool(workers)
+            _pool_key = key
+        return _pool
+
+
+def close_pool() -> None:
+    """
+    Stop this process's pool, if it started one. Called when the process exits,
+    and when a Celery pool process shuts down (which skips atexit handlers).
+    """
+    global _pool, _pool_key
+    with _pool_lock:
+        # A parent's pool is not ours to stop
+        if _pool is not None and _pool_key is not None and _pool_key[0] == os.getpid():
+            _pool.terminate()
+            _pool.join()
+        _pool = None
+        _pool_key = None
+
+
+atexit.register(close_pool)
+
+
+def _chunk_probe_likelihoods(
+    args: Tuple[pd.DataFrame, pd.DataFrame, float]
+) -> pd.DataFrame:
+    return probe_likelihoods(*args)
+
+
+def parallel_probe_likelihoods(
+    gwas_df: pd.DataFrame,
+    eqtl_df: pd.DataFrame,
+    maf_filter: float = MAF_FILTER,
+    workers: int = 1,
+) -> pd.DataFrame:
+    """
+    `probe_likelihoods`, with the ProbeIDs split across up to workers processes.
+
+    The work is split in a few chunks per worker, so that workers finishing early take on more.
+    The pool is started by the first call of a process (about a second) and then reused.
+    """
+    n_chunks = min(workers * CHUNKS_PER_WORKER, len(eqtl_df) // MIN_CHUNK_ROWS)
+    chunks = split_by_probe(eqtl_df, n_chunks)
+    if workers <= 1 or len(chunks) <= 1:
+        return probe_likelihoods(gwas_df, eqtl_df, maf_filter)
+
+    pool = _get_pool(workers)
+    results = pool.map(
+        _chunk_probe_likelihoods, [(gwas_df, chunk, maf_filter) for chunk in chunks], chunksize=1
+    )
+    return pd.concat(results, ignore_index=True)
+
+
+def compute_coloc2(
+    gwas_df: pd.DataFrame,
+    eqtl_df: pd.DataFrame,
+    p12: float = P12,
+    maf_filter: float = MAF_FILTER,
+    min_snps: int = MIN_SNPS,
+    workers: int = 1,
+) -> pd.DataFrame:
+    """
+    Run COLOC2 for a GWAS dataset against the eQTL datasets of every ProbeID in eqtl_df.
+    See `merge_coloc2_inputs` for the required columns. Both datasets are analysed as
+    quantitative traits from BETA and SE (the "type" column is not used).
+    The ProbeIDs' likelihoods are computed on up to workers processes; the priors
+    are then fitted to all of them together.
+
+    Returns a DataFrame with a row per ProbeID with more than min_snps shared variants:
+    ProbeID, PPH4abf (the posterior of colocalization under the fitted priors),
+    nsnps, the per-locus log likelihoods lH0.abf-lH4.abf, and PP0-PP4.coloc.priors
+    (the posteriors under the fixed priors P1, P2 and p12).
+    Raise ValueError if there are no such ProbeIDs.
+    """
+    probes = parallel_probe_likelihoods(gwas_df, eqtl_df, maf_filter, workers)
+    probes = probes[probes["nsnps"] > min_snps].reset_index(drop=True)
+    if len(probes) == 0:
+        raise ValueError(
+            f"COLOC2: no ProbeIDs have more than {min_snps} variants in both the GWAS and eQTL data"
+        )
+    nsnps = probes["nsnps"].to_numpy()
+    lsum1, lsum2, lsum12 = (probes[column].to_numpy() for column in ["lsum1", "lsum2", "lsum12"])
+    lsum_indep = _logdiff(lsum1 + lsum2, lsum12)
+    log_n = np.log(nsnps)
+
+    # Per-locus likelihoods, averaged over the causal variant(s)
+    likelihoods = np.column_stack(
+        [
+            np.zeros(len(probes)),
+            lsum1 - log_n,
+            lsum2 - log_n,
+            lsum_indep - np.log(nsnps.astype(float) ** 2),
+            lsum12 - log_n,
+        ]
+    )
+    pp_fitted = _posteriors(likelihoods, np.log(fit_hypothesis_priors(likelihoods)))
+
+    # Posteriors under fixed per-variant priors
+    abfs = np.column_stack([np.zeros(len(probes)), lsum1, lsum2, lsum_indep, lsum12])
+    pp_fixed = _posteriors(abfs, np.log([1.0, P1, P2, P1 * P2, p12]))
+
+    result = pd.DataFrame(
+        {"ProbeID": probes["ProbeID"], "PPH4abf": pp_fitted[:, 4], "nsnps": nsnps}
+    )
+    for i, hypothesis in enumerate(HYPOTHESES):
+        result[hypothesis] = likelihoods[:, i]
+    for i in range(5):
+        result[f"PP{i}.coloc.priors"] = pp_fixed[:, i]
+    return result
@@ -12,6 +12,7 @@ from app.colocalization.constants import (
     VALID_COORDINATES,
     VALID_POPULATIONS,
 )
+from app.utils.eqtl_cache import EQTLCache
 from app.utils.errors import InvalidUsage
 from app.utils.gtex import get_gtex_snp_matches, gene_names
 from app.utils import (
@@ -148,13 +149,13 @@ class SessionPayload:
         None  # Original, unlifted-over GWAS data
     )
     # the indices of rows that failed liftover, refers to rows in gwas_data_original
-    unlifted_over_indices: pd.Series = field(default_factory=pd.Series)
+    unlifted_over_indices: List[int] = field(default_factory=list)
     gwas_data: Optional[pd.DataFrame] = None  # working GWAS data (possibly lifted over)
     gwas_indices_kept: pd.Series = field(
         default_factory=pd.Series
     )  # Boolean Array of GWAS SNPs kept (excludes non-lifted over rows as well, if applicatble)
     ld_matrix: Optional[np.matrix] = None
-    secondary_datasets: Optional[Dict[str, dict]] = None
+    secondary_datasets: Optional[Dict[str, pd.DataFrame]] = None
     secondary_datasets_unlifted_indices: Optional[Dict[str, List[int]]] = None
     file: SessionFiles = field(init=False)
 
@@ -179,6 +180,8 @@ class SessionPayload:
     )  # only used for reporting, use get_gtex_selection() instead
     gene: Optional[str] = None
     std_snp_list: pd.Series = field(default_factory=pd.Series)
+    # eQTL query results, shared by the stages of this job
+    eqtl_cache: EQTLCache = field(default_factory=EQTLCache, repr=False)
 
     def __post_init__(self):
         # Runs after init, initializes SessionFiles object
@@ -542,7 +545,7 @@ class SessionPayload:
         if self.secondary_datasets is not None:
             data["secondary_dataset_titles"] = list(self.secondary_datasets.keys())
             for dataset_title, table in self.secondary_datasets.items():
-                data[dataset_title] = table
+                data[dataset_title] = table.to_dict(orient="records")
         else:
             data["secondary_dataset_titles"] = []
 
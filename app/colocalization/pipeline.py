@@ -10,6 +10,7 @@ from app.utils import get_session_filepath
 from app.pipeline import Pipeline
 from app.pipeline.pipeline_stage import PipelineStage
 from app.colocalization import stages
+from app.utils.eqtl_cache import EQTLCache
 from app.utils.errors import LocusFocusError
 
 
@@ -24,9 +25,8 @@ class ColocalizationPipeline(Pipeline):
             stages.CreateSessionStage(),
             stages.CollectUserInputStage(),
             stages.ReadGWASFileStage(enforce_one_chrom=False),
-            stages.LiftoverGWASFile(),
             stages.ReadSecondaryDatasetsStage(),
-            stages.LiftoverSecondaryDatasets(),
+            stages.LiftoverDatasetsStage(),
             stages.ReportGTExDataStage(),
             stages.SimpleSumSubsetGWASStage(),
             stages.GetLDMatrixStage(),
@@ -52,6 +52,7 @@ class ColocalizationPipeline(Pipeline):
             request_form=request_form,
             uploaded_files=uploaded_files,
             session_id=self.id,
+            eqtl_cache=EQTLCache(app.extensions.get("eqtl_cache")),
         )
 
         return super().process(initial_payload)  # type: ignore
@@ -83,6 +84,7 @@ class ColocalizationPipeline(Pipeline):
     def post_pipeline(self, payload: SessionPayload):
         # Timer for the entire pipeline (stop time - start time)
         self.timers["pipeline"] = timeit.default_timer() - self.timers["pipeline"]
+        app.logger.debug(f"eQTL cache: {payload.eqtl_cache.stats()}")
 
         # Save timers to file
         timing_file_path = get_session_filepath(f"times-{payload.session_id}.txt")
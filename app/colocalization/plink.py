@@ -5,7 +5,7 @@ Functions for interacting with PLINK.
 import os
 import shutil
 import subprocess
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import pandas as pd
 import numpy as np
@@ -16,9 +16,44 @@ from app.utils import write_list, x_to_23
 from app.colocalization.constants import VALID_POPULATIONS
 
 
+# 1000 Genomes .bim tables loaded by `preload_plink_bims`, keyed by plink file path
+_preloaded_bims: Dict[str, pd.DataFrame] = {}
+
+
 ### FUNCTIONS ###
 
 
+def read_plink_bim(plink_filepath: str) -> pd.DataFrame:
+    """
+    Return the .bim table of a 1000 Genomes plink dataset, from memory if it was preloaded.
+
+    Preloaded tables are shared, so they must not be modified.
+    """
+    bim_df = _preloaded_bims.get(plink_filepath)
+    if bim_df is None:
+        bim_df = pd.read_csv(plink_filepath + ".bim", sep="\t", header=None)
+    return bim_df
+
+
+def preload_plink_bims(build: str, pop: str) -> int:
+    """
+    Load the .bim tables of every chromosome of a 1000 Genomes dataset into memory.
+
+    Chromosomes without a .bim file are skipped. Returns the number of tables loaded.
+    """
+    loaded = 0
+    for chrom in range(1, 24):
+        plink_filepath = resolve_plink_filepath(build, pop, chrom)
+        if plink_filepath not in _preloaded_bims and os.path.exists(
+            plink_filepath + ".bim"
+        ):
+            _preloaded_bims[plink_filepath] = pd.read_csv(
+                plink_filepath + ".bim", sep="\t", header=None
+            )
+            loaded += 1
+    return loaded
+
+
 def find_plink_1kg_overlap(
     plink_filepath: str,
     snp_positions: List[int],
@@ -38,9 +73,7 @@ def find_plink_1kg_overlap(
             file for the given 1000 Genomes population.
     """
     # Ensure lead snp is also present in 1KG; if not, choose next best lead SNP
-    the1kg_snps_df = pd.read_csv(
-        plink_filepath + ".bim", sep="\t", header=None
-    )  # .iloc[:, 1]
+    the1kg_snps_df = read_plink_bim(plink_filepath)
 
     # Find lowest P-value position in snp_positions that is also in 1KG
     gwas_positions_df = pd.DataFrame({"pos": snp_positions, "p": snp_pvalues})
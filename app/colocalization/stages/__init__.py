@@ -6,6 +6,7 @@ Expected order:
 - collect_user_input
 - read_gwas_file
 - read_secondary_datasets
+- liftover_datasets
 - report_gtex_data
 - ss_subset_gwas
 - get_ld_matrix
@@ -26,6 +27,7 @@ from app.colocalization.stages.liftover_gwas_file import LiftoverGWASFile
 from app.colocalization.stages.liftover_secondary_datasets import (
     LiftoverSecondaryDatasets,
 )
+from app.colocalization.stages.liftover_datasets import LiftoverDatasetsStage
 
 
 __all__ = [
@@ -35,6 +37,7 @@ __all__ = [
     "LiftoverGWASFile",
     "ReadSecondaryDatasetsStage",
     "LiftoverSecondaryDatasets",
+    "LiftoverDatasetsStage",
     "ReportGTExDataStage",
     "GetLDMatrixStage",
     "SimpleSumSubsetGWASStage",
@@ -1,8 +1,10 @@
 import json
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 import numpy as np
 import pandas as pd
+from flask import current_app
 
+from app.colocalization.coloc2 import compute_coloc2
 from app.colocalization.constants import LD_MAT_DIAG_CONSTANT
 from app.colocalization.payload import SessionPayload, DataExclusionReason
 from app.utils import clean_snps, standardize_snps, write_list, write_matrix
@@ -10,6 +12,7 @@ from app.pipeline.pipeline_stage import PipelineStage
 from app.scripts import ScriptError, coloc2, simple_sum
 from app.utils.errors import InvalidUsage, ServerError
 from app.utils.gtex import get_gtex_data
+from app.utils.variant_index import VariantIndex
 
 
 def check_data_overlap(data_df, threshold, p_col="pval"):
@@ -60,6 +63,34 @@ class ColocSimpleSumStage(PipelineStage):
     COLOC2_EQTL_COLNAMES = COLOC2_COLNAMES + ["ProbeID"]
     COLOC2_GWAS_COLNAMES = COLOC2_COLNAMES + ["type"]
 
+    # GTEx eQTL fields needed for Simple Sum only, and for COLOC2
+    GTEX_SS_COLUMNS = ["pval"]
+    GTEX_COLOC2_COLUMNS = [
+        "rs_id",
+        "chr",
+        "pos",
+        "ref",
+        "alt",
+        "pval",
+        "beta",
+        "se",
+        "sample_maf",
+        "ma_count",
+    ]
+    # Renaming of GTEx eQTL fields to COLOC2 columns
+    GTEX_TO_COLOC2_COLUMNS = {
+        "rs_id": "SNPID",
+        "pval": "PVAL",
+        "beta": "BETA",
+        "se": "SE",
+        "sample_maf": "MAF",
+        "chr": "CHR",
+        "variant_pos": "POS",
+        "pos": "POS",
+        "ref": "A2",
+        "alt": "A1",
+    }
+
     def name(self) -> str:
         return "simple-sum"
 
@@ -107,7 +138,7 @@ class ColocSimpleSumStage(PipelineStage):
 
     def _build_pvalue_matrix(
         self, payload: SessionPayload
-    ) -> Tuple[np.matrix, Optional[pd.DataFrame]]:
+    ) -> Tuple[np.ndarray, Optional[pd.DataFrame]]:
         """
         Create a P-value matrix required for Simple Sum colocalization,
         as well as a COLOC2 dataframe if COLOC2 is enabled.
@@ -118,6 +149,9 @@ class ColocSimpleSumStage(PipelineStage):
 
         N is also equal to the side-length of the square LD matrix.
 
+        The matrix is preallocated as float64 and filled row by row; rows of
+        datasets that are skipped (eg. for lack of overlap) are left as NaN.
+
         The first row contains the P values of the provided GWAS dataset
         (after subsetting, cleaning, etc.).
 
@@ -146,84 +180,65 @@ class ColocSimpleSumStage(PipelineStage):
         """
         assert payload.gwas_data is not None
 
-        p_value_matrix = []
         gtex_version = payload.get_gtex_version()
         regionstr = payload.get_locus()
         coordinate = payload.get_coordinate()
         overlap_threshold = payload.get_overlap_threshold()
 
-        coloc2eqtl_df = pd.DataFrame({})
+        # COLOC2 eQTL rows of each dataset, concatenated once at the end
+        coloc2eqtl_blocks: List[pd.DataFrame] = []
 
-        # 1. GWAS Data
-        p_value_matrix.append(list(payload.gwas_data_kept["P"]))  # type: ignore
-
-        # 2. GTEx secondary datasets
         std_snp_list = pd.Series(
             clean_snps(list(payload.std_snp_list), regionstr, coordinate)
         )
         ss_std_snp_list = std_snp_list.loc[payload.gwas_indices_kept]
+        # Shared index that GTEx and uploaded datasets are aligned against
+        gwas_index = VariantIndex(ss_std_snp_list)
         gtex_tissues, gtex_genes = payload.get_gtex_selection()
+        gtex_columns = (
+            self.GTEX_COLOC2_COLUMNS if payload.coloc2 else self.GTEX_SS_COLUMNS
+        )
 
-        if len(gtex_tissues) > 0:
-            for tissue in gtex_tissues:
-                for agene in gtex_genes:
-                    gtex_eqtl_df = get_gtex_data(
-                        gtex_version, tissue, agene, ss_std_snp_list
-                    )
-
-                    # check overlap with GWAS
-                    skip, reason = check_data_overlap(gtex_eqtl_df, overlap_threshold)
-                    if skip:
-                        payload.secondary_exclude.gtex_tissue_gene[(tissue, agene)] = reason
-                        pvalues = np.repeat(np.nan, len(ss_std_snp_list))
-                        p_value_matrix.append(pvalues)
-                        continue
+        num_datasets = 1 + len(gtex_tissues) * len(gtex_genes)
+        if payload.secondary_datasets is not None:
+            num_datasets += len(payload.secondary_datasets)
+        p_value_matrix = np.full((num_datasets, len(gwas_index)), np.nan)
 
-                    pvalues = list(gtex_eqtl_df["pval"])
-                    if payload.coloc2:
-                        tempdf = gtex_eqtl_df.rename(
-                            columns={
-                                "rs_id": "SNPID",
-                                "pval": "PVAL",
-                                "beta": "BETA",
-                                "se": "SE",
-                                "sample_maf": "MAF",
-                                "chr": "CHR",
-                                "variant_pos": "POS",
-                                "pos": "POS",
-                                "ref": "A2",
-                                "alt": "A1",
-                            }
-                        )
-                        tempdf.dropna(inplace=True)
-                        if len(tempdf.index) != 0:
-                            numsamples = round(
-                                tempdf["ma_count"].tolist()[0]
-                                / tempdf["MAF"].tolist()[0]
-                            )
-                            numsampleslist = np.repeat(
-                                numsamples, tempdf.shape[0]
-                            ).tolist()
-                            tempdf = pd.concat(
-                                [tempdf, pd.Series(numsampleslist, name="N")],
-                                axis=1,
-                            )
-                            probeid = str(tissue) + ":" + str(agene)
-                            probeidlist = np.repeat(
-                                probeid, tempdf.shape[0]
-                            ).tolist()
-                            tempdf = pd.concat(
-                                [tempdf, pd.Series(probeidlist, name="ProbeID")],
-                                axis=1,
-                            )
-                            tempdf = tempdf.reindex(
-                                columns=self.COLOC2_EQTL_COLNAMES
-                            )
-                            coloc2eqtl_df = pd.concat(
-                                [coloc2eqtl_df, tempdf], axis=0
-                            )
+        # 1. GWAS Data
+        row = 0
+        p_value_matrix[row] = payload.gwas_data_kept["P"]
 
-                    p_value_matrix.append(pvalues)
+        # 2. GTEx secondary datasets
+        if len(gtex_tissues) > 0:
+            # Fetch concurrently; results keep the tissue-then-gene row order
+            gtex_pairs = [(tissue, agene) for tissue in gtex_tissues for agene in gtex_genes]
+            gtex_eqtl_dfs = current_app.extensions["gtex_fetcher"].map(
+                lambda pair: get_gtex_data(
+                    gtex_version,
+                    pair[0],
+                    pair[1],
+                    gwas_index,
+                    columns=gtex_columns,
+                    cache=payload.eqtl_cache,
+                ),
+                gtex_pairs,
+            )
+            for (tissue, agene), gtex_eqtl_df in zip(gtex_pairs, gtex_eqtl_dfs):
+                row += 1
+
+                # check overlap with GWAS
+                skip, reason = check_data_overlap(gtex_eqtl_df, overlap_threshold)
+                if skip:
+                    payload.secondary_exclude.gtex_tissue_gene[(tissue, agene)] = reason
+                    continue
+
+                p_value_matrix[row] = gtex_eqtl_df["pval"]
+                if payload.coloc2:
+                    block = self._coloc2_gtex_block(
+                        gtex_eqtl_df, str(tissue) + ":" + str(agene)
+                    )
+                    if block is not None:
+                        coloc2eqtl_blocks.append(block)
 
         # 3. Uploaded secondary datasets
         if (
@@ -236,7 +251,8 @@ class ColocSimpleSumStage(PipelineStage):
                     dataset_title,
                     secondary_dataset,
                 ) in payload.secondary_datasets.items():
-                    secondary_dataset = pd.DataFrame(secondary_dataset)
+                    row += 1
+                    secondary_dataset = secondary_dataset.copy()
                     try:
                         if not set(self.COLOC2_EQTL_COLNAMES).issubset(
                             secondary_dataset
@@ -244,56 +260,27 @@ class ColocSimpleSumStage(PipelineStage):
                             raise InvalidUsage(
                                 f"You have chosen to run COLOC2. COLOC2 assumes eQTL data as secondary dataset, and you must have all of the following column names: {self.COLOC2_EQTL_COLNAMES}"
                             )
-                        secondary_dataset["SNPID"] = clean_snps(
-                            secondary_dataset["SNPID"].tolist(), regionstr, coordinate
-                        )
-                        # secondary_dataset.set_index('SNPID', inplace=True)
-                        idx = pd.Index(list(secondary_dataset["SNPID"]))
-                        secondary_dataset = (
-                            secondary_dataset.loc[~idx.duplicated()]
-                            .reset_index()
-                            .drop(columns=["index"])
-                        )
-                        # merge to keep only SNPs already present in the GWAS/primary dataset (SS subset):
+                        secondary_snps = secondary_dataset["SNPID"].tolist()
                         secondary_data_std_snplist = standardize_snps(
-                            secondary_dataset["SNPID"].tolist(), regionstr, coordinate
+                            secondary_snps, regionstr, coordinate
                         )
-                        secondary_dataset = pd.concat(
-                            [
-                                secondary_dataset,
-                                pd.DataFrame(
-                                    secondary_data_std_snplist, columns=["SNPID.tmp"]
-                                ),
-                            ],
-                            axis=1,
+                        secondary_dataset["SNPID"] = clean_snps(
+                            secondary_snps,
+                            regionstr,
+                            coordinate,
+                            std_varlist=secondary_data_std_snplist,
                         )
-                        snp_df = pd.DataFrame(ss_std_snp_list, columns=["SNPID.tmp"])
-                        secondary_data = (
-                            snp_df.reset_index()
-                            .merge(
-                                secondary_dataset,
-                                on="SNPID.tmp",
-                                how="left",
-                                sort=False,
-                            )
-                            .sort_values("index")
+                        # keep only SNPs already present in the GWAS/primary dataset (SS subset):
+                        secondary_data = gwas_index.align(
+                            secondary_dataset, secondary_data_std_snplist
                         )
                         skip, reason = check_data_overlap(secondary_data, overlap_threshold, p_col="PVAL")
                         if skip:
                             payload.secondary_exclude.uploaded[dataset_title] = reason
-                            pvalues = np.repeat(np.nan, len(ss_std_snp_list))
-                            p_value_matrix.append(pvalues)
                             continue
-                        pvalues = list(secondary_data["PVAL"])
-                        p_value_matrix.append(pvalues)
-                        coloc2eqtl_df = pd.concat(
-                            [
-                                coloc2eqtl_df,
-                                secondary_data.reindex(
-                                    columns=self.COLOC2_EQTL_COLNAMES
-                                ),
-                            ],
-                            axis=0,
+                        p_value_matrix[row] = secondary_data["PVAL"]
+                        coloc2eqtl_blocks.append(
+                            secondary_data.reindex(columns=self.COLOC2_EQTL_COLNAMES)
                         )
                     except InvalidUsage as e:
                         e.message = f"[secondary dataset '{dataset_title}'] {e.message}"
@@ -303,61 +290,73 @@ class ColocSimpleSumStage(PipelineStage):
                     dataset_title,
                     secondary_dataset,
                 ) in payload.secondary_datasets.items():
-                    secondary_dataset = pd.DataFrame(secondary_dataset)
+                    row += 1
                     if secondary_dataset.shape[0] == 0:
                         # print(f'No data for table {table_titles[i]}')
-                        pvalues = np.repeat(np.nan, len(ss_std_snp_list))
-                        p_value_matrix.append(pvalues)
                         continue
-                    # remove duplicate SNPs
                     try:
-                        secondary_dataset["SNP"] = clean_snps(
-                            secondary_dataset["SNP"].tolist(), regionstr, coordinate
-                        )
-                        idx = pd.Index(list(secondary_dataset["SNP"]))
-                        secondary_dataset = (
-                            secondary_dataset.loc[~idx.duplicated()]
-                            .reset_index()
-                            .drop(columns=["index"])
-                        )
-                        # merge to keep only SNPs already present in the GWAS/primary dataset (SS subset):
+                        # keep only SNPs already present in the GWAS/primary dataset (SS subset);
+                        # duplicate SNPs are resolved to their first occurrence
                         secondary_data_std_snplist = standardize_snps(
                             secondary_dataset["SNP"].tolist(), regionstr, coordinate
                         )
-                        std_snplist_df = pd.DataFrame(
-                            secondary_data_std_snplist, columns=["SNP" + ".tmp"]
-                        )
-                        secondary_dataset = pd.concat(
-                            [secondary_dataset, std_snplist_df], axis=1
-                        )
-                        snp_df = pd.DataFrame(ss_std_snp_list, columns=["SNP" + ".tmp"])
-                        secondary_data = (
-                            snp_df.reset_index()
-                            .merge(
-                                secondary_dataset,
-                                on="SNP" + ".tmp",
-                                how="left",
-                                sort=False,
-                            )
-                            .sort_values("index")
+                        secondary_data = gwas_index.align(
+                            secondary_dataset, secondary_data_std_snplist
                         )
                         skip, reason = check_data_overlap(secondary_data, overlap_threshold, p_col="P")
                         if skip:
                             payload.secondary_exclude.uploaded[dataset_title] = reason
-                            pvalues = np.repeat(np.nan, len(ss_std_snp_list))
-                            p_value_matrix.append(pvalues)
                             continue
-                        pvalues = list(secondary_data["P"])
-                        p_value_matrix.append(pvalues)
+                        p_value_matrix[row] = secondary_data["P"]
                     except InvalidUsage as e:
                         e.message = f"[secondary dataset '{dataset_title}'] {e.message}"
                         raise e
 
-        return np.matrix(p_value_matrix), coloc2eqtl_df
+        coloc2eqtl_df = self._concat_coloc2_blocks(coloc2eqtl_blocks)
+        return p_value_matrix, coloc2eqtl_df
+
+    @classmethod
+    def _coloc2_gtex_block(
+        cls, gtex_eqtl_df: pd.DataFrame, probeid: str
+    ) -> Optional[pd.DataFrame]:
+        """
+        Return the COLOC2 eQTL rows (COLOC2_EQTL_COLNAMES) of a GTEx tissue/gene dataset
+        aligned to the GWAS, or None if it has no complete rows.
+
+        N is estimated from the minor allele count and MAF of the first row.
+        """
+        complete = gtex_eqtl_df.notna().all(axis=1).to_numpy()
+        num_rows = int(complete.sum())
+        if num_rows == 0:
+            return None
+        columns = {
+            coloc2_column: gtex_eqtl_df[gtex_column].to_numpy()[complete]
+            for gtex_column, coloc2_column in cls.GTEX_TO_COLOC2_COLUMNS.items()
+            if gtex_column in gtex_eqtl_df
+        }
+        ma_count = gtex_eqtl_df["ma_count"].to_numpy()[complete]
+        numsamples = round(ma_count[0] / columns["MAF"][0])
+        columns["N"] = np.full(num_rows, numsamples)
+        columns["ProbeID"] = np.full(num_rows, probeid, dtype=object)
+        return pd.DataFrame(
+            {
+                column: columns.get(column, np.full(num_rows, np.nan))
+                for column in cls.COLOC2_EQTL_COLNAMES
+            }
+        )
+
+    @classmethod
+    def _concat_coloc2_blocks(cls, blocks: List[pd.DataFrame]) -> pd.DataFrame:
+        """
+        Concatenate the COLOC2 eQTL rows of all datasets, in one pass.
+        """
+        if len(blocks) == 0:
+            return pd.DataFrame(columns=cls.COLOC2_EQTL_COLNAMES)
+        return pd.concat(blocks, axis=0, ignore_index=True)
 
     def _run_simple_sum(
         self,
-        p_value_matrix: np.matrix,
+        p_value_matrix: np.ndarray,
         payload: SessionPayload,
         coloc2eqtl_df: Optional[pd.DataFrame] = None,
     ):
@@ -378,7 +377,7 @@ class ColocSimpleSumStage(PipelineStage):
         if len(payload.gwas_data_kept) == 0:
             raise InvalidUsage("No SNPs in Simple Sum subset")
 
-        SS_positions = payload.gwas_data_kept["POS"].to_list()
+        SS_positions = payload.gwas_data_kept["POS"].to_numpy()
 
         # Handle LD matrix
         ld_matrix = payload.ld_matrix
@@ -387,11 +386,10 @@ class ColocSimpleSumStage(PipelineStage):
 
         np.fill_diagonal(ld_matrix, np.diag(ld_matrix) + LD_MAT_DIAG_CONSTANT)
 
-        p_matrix_indices = [
-            i for i, e in enumerate(SS_positions) if e in ld_mat_positions
-        ]
+        # Keep the Simple Sum SNPs that are in the LD matrix (sort-based, not a list scan)
+        p_matrix_indices = np.flatnonzero(np.isin(SS_positions, ld_mat_positions))
 
-        p_value_matrix = p_value_matrix[:, p_matrix_indices]  # type: ignore
+        p_value_matrix = p_value_matrix[:, p_matrix_indices]
 
         non_nan_ld_rows = ~np.isnan(ld_matrix).all(axis=1).getA().flatten()
 
@@ -507,32 +505,42 @@ class ColocSimpleSumStage(PipelineStage):
             ).reindex(columns=self.COLOC2_GWAS_COLNAMES)
 
             # Calculating COLOC2 stats
-            coloc2_gwasdf.dropna().to_csv(
-                payload.file.coloc2_gwas_filepath,
-                index=False,
-                encoding="utf-8",
-                sep="\t",
-            )
             if coloc2_gwasdf.shape[0] == 0 or coloc2eqtl_df.shape[0] == 0:
                 raise InvalidUsage(
                     f"Empty datasets for coloc2. Cannot proceed. GWAS numRows: {coloc2_gwasdf.shape[0]}; eQTL numRows: {coloc2eqtl_df.shape[0]}. May be due to inability to match with GTEx variants. Please check position, REF/ALT allele correctness, and or SNP names."
                 )
-            coloc2eqtl_df.dropna().to_csv(
-                payload.file.coloc2_eqtl_filepath,
-                index=False,
-                encoding="utf-8",
-                sep="\t",
-            )
 
             # Run COLOC2
-            try:
-                coloc2df = coloc2(
+            if current_app.config["COLOC2_ENGINE"] == "r":
+                coloc2_gwasdf.dropna().to_csv(
                     payload.file.coloc2_gwas_filepath,
+                    index=False,
+                    encoding="utf-8",
+                    sep="\t",
+                )
+                coloc2eqtl_df.dropna().to_csv(
                     payload.file.coloc2_eqtl_filepath,
-                    payload.file.coloc2_results_filepath,
+                    index=False,
+                    encoding="utf-8",
+                    sep="\t",
                 )
-            except ScriptError as e:
-                raise InvalidUsage(e.stdout, status_code=410)
+                try:
+                    coloc2df = coloc2(
+                        payload.file.coloc2_gwas_filepath,
+                        payload.file.coloc2_eqtl_filepath,
+                        payload.file.coloc2_results_filepath,
+                    )
+                except ScriptError as e:
+                    raise InvalidUsage(e.stdout, status_code=410)
+            else:
+                try:
+                    coloc2df = compute_coloc2(
+                        coloc2_gwasdf.dropna(),
+                        coloc2eqtl_df.dropna(),
+                        workers=current_app.config["COLOC2_WORKERS"],
+                    ).fillna(-1)
+                except ValueError as e:
+                    raise InvalidUsage(str(e), status_code=410)
 
             # save as json:
             coloc2_dict = {
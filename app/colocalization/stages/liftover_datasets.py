@@ -0,0 +1,85 @@
+from flask import current_app
+
+from app.colocalization.payload import SessionPayload
+from app.colocalization.stages.liftover_gwas_file import LiftoverGWASFile
+from app.colocalization.stages.liftover_secondary_datasets import (
+    LiftoverSecondaryDatasets,
+)
+from app.pipeline.pipeline_stage import PipelineStage
+from app.utils.errors import InvalidUsage
+from app.utils.liftover import LiftoverTable, run_liftover_batch
+
+GWAS_TABLE = ("gwas", None)
+
+
+class LiftoverDatasetsStage(PipelineStage):
+    """
+    Lift over the GWAS and all secondary datasets that need it in one batched liftover pass,
+    then update the payload as `LiftoverGWASFile` and `LiftoverSecondaryDatasets` would.
+
+    Prerequisites:
+    - gwas_data is loaded
+    - secondary_datasets are loaded
+    """
+
+    def __init__(self):
+        self.gwas_stage = LiftoverGWASFile()
+        self.secondary_stage = LiftoverSecondaryDatasets()
+
+    def name(self) -> str:
+        return "liftover-datasets"
+
+    def description(self) -> str:
+        return "Checking if GWAS and secondary datasets need to be lifted over"
+
+    def invoke(self, payload: SessionPayload) -> object:
+        if payload.get_gtex_version() == "V7":
+            raise InvalidUsage(
+                "GTEx V7 is no longer available. Please use GTEx V8 or GTEx V10."
+            )
+        else:
+            liftover_target = "hg38"
+
+        gwas_needs_liftover = (
+            payload.gwas_data is not None
+            and payload.get_coordinate() != liftover_target
+        )
+        secondary_needs_liftover = (
+            payload.secondary_datasets is not None
+            and payload.get_secondary_coordinate() != liftover_target
+        )
+
+        # Tag every table with its source so results can be split back after one pass
+        tables = {}
+        if gwas_needs_liftover:
+            tables[GWAS_TABLE] = LiftoverTable(
+                payload.gwas_data, chrom_col="CHROM", pos_col="POS"  # type: ignore
+            )
+        if secondary_needs_liftover:
+            for table_title, table in self.secondary_stage.liftover_tables(payload).items():
+                tables[("secondary", table_title)] = table
+
+        if len(tables) == 0:
+            current_app.logger.debug("No liftover needed")
+            return payload
+
+        current_app.logger.debug(
+            f"Lifting over {len(tables)} table(s) in a single pass"
+        )
+        liftover_cache = current_app.extensions.get("liftover_cache")
+        results = run_liftover_batch(tables, liftover_target, cache=liftover_cache)
+        if liftover_cache is not None:
+            current_app.logger.info(f"Liftover cache: {liftover_cache.stats()}")
+
+        if gwas_needs_liftover:
+            self.gwas_stage.apply_liftover(
+                payload, liftover_target, *results.pop(GWAS_TABLE)
+            )
+        if secondary_needs_liftover:
+            self.secondary_stage.apply_liftover(
+                payload,
+                liftover_target,
+                {table_title: result for (_, table_title), result in results.items()},
+            )
+
+        return payload
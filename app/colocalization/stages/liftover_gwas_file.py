@@ -41,64 +41,70 @@ class LiftoverGWASFile(PipelineStage):
                 current_app.logger.debug("Lifting over GWAS data")
 
                 lifted_over, unlifted_over = run_liftover(
-                    payload.gwas_data, liftover_target, chrom_col="CHROM", pos_col="POS"
+                    payload.gwas_data,
+                    liftover_target,
+                    chrom_col="CHROM",
+                    pos_col="POS",
+                    cache=current_app.extensions.get("liftover_cache"),
                 )
-                current_app.logger.debug(
-                    f"Original: {len(payload.gwas_data)} -> Lifted over: {len(lifted_over)}, unlifted over: {len(unlifted_over)}"
-                )
-
-                # Handle lead SNP
-                lead_snp_is_user_defined = payload.get_lead_snp_name() != ""
-                lead_snp_is_rsid = payload.gwas_data.iloc[payload.get_lead_snp_index()][
-                    "SNP"
-                ].startswith("rs")
-                lead_snp_lifted_over = payload.get_lead_snp_index() not in unlifted_over
-
-                if lead_snp_is_user_defined:
-                    if not lead_snp_lifted_over:
-                        # clear the lead SNP name, warn the user
-                        old_lead_snp = payload.get_lead_snp_name()
-                        new_lead_snp = lifted_over[lifted_over["P"].argmin()][
-                            "SNP"
-                        ]  # lowest p-value
-                        payload.liftover_lead_snp_warning = f"The specified lead SNP '{old_lead_snp}' was not lifted over. The lifted SNP with the lowest p-value is used instead: '{new_lead_snp}'."
-                        payload.lead_snp_name = ""
-
-                lifted_over = adjust_snp_column(lifted_over, liftover_target)
-
-                # lifted_over and gwas_data are not the same size so we need to be careful
-                changed_indices = payload.gwas_data.index[
-                    ~payload.gwas_data.index.isin(unlifted_over)
-                ]
-                payload.gwas_data.loc[changed_indices] = lifted_over.values  # type: ignore
-
-                if (
-                    lead_snp_is_user_defined
-                    and lead_snp_lifted_over
-                    and not lead_snp_is_rsid
-                ):
-                    # update the lead SNP name if it changed due to liftover
-                    assert payload.gwas_data_original is not None  # type checker
-                    lead_snp_index = payload.gwas_data.index[
-                        payload.gwas_data_original["SNP"] == payload.get_lead_snp_name()
-                    ].tolist()[0]
-                    payload.lead_snp_name = str(
-                        payload.gwas_data.iloc[lead_snp_index]["SNP"]
-                    )
-
-                payload.gwas_indices_kept = self.update_indices_kept(
-                    payload, unlifted_over
-                )
-                payload.lifted_over_coordinate = liftover_target
-
-                # update snp list
-                payload.std_snp_list = get_std_snp_list(payload, payload.gwas_data)
-
+                self.apply_liftover(payload, liftover_target, lifted_over, unlifted_over)
             else:
                 current_app.logger.debug("No liftover needed")
 
         return payload
 
+    def apply_liftover(
+        self,
+        payload: SessionPayload,
+        liftover_target: str,
+        lifted_over: pd.DataFrame,
+        unlifted_over: List[int],
+    ):
+        """
+        Update the GWAS data, lead SNP and kept indices from the result of `run_liftover`.
+        """
+        assert payload.gwas_data is not None
+
+        current_app.logger.debug(
+            f"Original: {len(payload.gwas_data)} -> Lifted over: {len(lifted_over)}, unlifted over: {len(unlifted_over)}"
+        )
+
+        # Handle lead SNP
+        lead_snp_is_user_defined = payload.get_lead_snp_name() != ""
+        lead_snp_is_rsid = payload.gwas_data.iloc[payload.get_lead_snp_index()]["SNP"].startswith("rs")
+        lead_snp_lifted_over = payload.get_lead_snp_index() not in unlifted_over
+
+        if lead_snp_is_user_defined:
+            if not lead_snp_lifted_over:
+                # clear the lead SNP name, warn the user
+                old_lead_snp = payload.get_lead_snp_name()
+                new_lead_snp = lifted_over[lifted_over["P"].argmin()]["SNP"]  # lowest p-value
+                payload.liftover_lead_snp_warning = f"The specified lead SNP '{old_lead_snp}' was not lifted over. The lifted SNP with the lowest p-value is used instead: '{new_lead_snp}'."
+                payload.lead_snp_name = ""
+
+        lifted_over = adjust_snp_column(lifted_over, liftover_target)
+
+        # lifted_over and gwas_data are not the same size so we need to be careful
+        changed_indices = payload.gwas_data.index[
+            ~payload.gwas_data.index.isin(unlifted_over)
+        ]
+        payload.gwas_data.loc[changed_indices] = lifted_over.values  # type: ignore
+
+        if lead_snp_is_user_defined and lead_snp_lifted_over and not lead_snp_is_rsid:
+            # update the lead SNP name if it changed due to liftover
+            assert payload.gwas_data_original is not None  # type checker
+            lead_snp_index = payload.gwas_data.index[
+                payload.gwas_data_original["SNP"] == payload.get_lead_snp_name()
+            ].tolist()[0]
+            payload.lead_snp_name = str(payload.gwas_data.iloc[lead_snp_index]["SNP"])
+
+        payload.gwas_indices_kept = self.update_indices_kept(payload, unlifted_over)
+        payload.lifted_over_coordinate = liftover_target
+
+        # update snp list
+        payload.std_snp_list = get_std_snp_list(payload, payload.gwas_data)
+        payload.unlifted_over_indices = unlifted_over
+
     def update_indices_kept(
         self,
         payload: SessionPayload,
@@ -1,9 +1,12 @@
+from typing import Dict, List, Tuple
+
 import pandas as pd
+from flask import current_app
 
 from app.colocalization.payload import SessionPayload
 from app.pipeline.pipeline_stage import PipelineStage
 from app.utils.helpers import adjust_snp_column
-from app.utils.liftover import run_liftover
+from app.utils.liftover import LiftoverTable, run_liftover_batch
 from app.utils.errors import InvalidUsage
 
 
@@ -32,30 +35,48 @@ class LiftoverSecondaryDatasets(PipelineStage):
         needs_liftover = payload.get_secondary_coordinate() != liftover_target
 
         if needs_liftover:
-            payload.secondary_datasets_unlifted_indices = {}
-
-            for table_title, table in payload.secondary_datasets.items():
-                dataset = pd.DataFrame(table)
-
-                if dataset.shape[0] == 0:
-                    continue
-
-                lifted_over, unlifted_over = run_liftover(
-                    dataset, liftover_target, chrom_col="CHROM", pos_col="BP"
-                )
+            results = run_liftover_batch(
+                self.liftover_tables(payload),
+                liftover_target,
+                cache=current_app.extensions.get("liftover_cache"),
+            )
+            self.apply_liftover(payload, liftover_target, results)
 
-                lifted_over = adjust_snp_column(
-                    lifted_over,
-                    liftover_target,
-                    ignore_alleles=True,
-                )
+        return payload
 
-                payload.secondary_datasets[table_title] = lifted_over.fillna(
-                    -1
-                ).to_dict(  # type: ignore
-                    orient="records"
-                )
+    def liftover_tables(self, payload: SessionPayload) -> Dict[str, LiftoverTable]:
+        """
+        Return the non-empty secondary datasets to be lifted over, keyed by table title.
+        """
+        assert payload.secondary_datasets is not None
+
+        return {
+            table_title: LiftoverTable(dataset, chrom_col="CHROM", pos_col="BP")
+            for table_title, dataset in payload.secondary_datasets.items()
+            if dataset.shape[0] > 0
+        }
+
+    def apply_liftover(
+        self,
+        payload: SessionPayload,
+        liftover_target: str,
+        results: Dict[str, Tuple[pd.DataFrame, List[int]]],
+    ):
+        """
+        Replace each lifted secondary dataset and record its unlifted indices.
+        """
+        assert payload.secondary_datasets is not None
+
+        payload.secondary_datasets_unlifted_indices = {}
+
+        for table_title, (lifted_over, unlifted_over) in results.items():
+            lifted_over = adjust_snp_column(
+                lifted_over,
+                liftover_target,
+                pos_col="BP",
+                ignore_alleles=True,
+            )
 
-                payload.secondary_datasets_unlifted_indices[table_title] = unlifted_over
+            payload.secondary_datasets[table_title] = lifted_over.fillna(-1)
 
-        return payload
+            payload.secondary_datasets_unlifted_indices[table_title] = unlifted_over
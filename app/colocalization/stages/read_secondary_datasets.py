@@ -1,10 +1,12 @@
-from bs4 import BeautifulSoup as bs
-import numpy as np
+import os
+from typing import Dict, Iterator, Optional, Tuple, Union
 
-import app.utils.htmltableparser as htmltableparser
+import pandas as pd
 
 from app.colocalization.payload import SessionPayload
 from app.utils import get_file_with_ext
+from app.utils.htmltableparser import iter_html_tables
+from app.utils.secondary_datasets import iter_parquet_tables, iter_tar_tables
 from app.pipeline.pipeline_stage import PipelineStage
 from app.utils.errors import InvalidUsage
 
@@ -13,8 +15,14 @@ class ReadSecondaryDatasetsStage(PipelineStage):
     """
     Stage responsible for reading user-uploaded secondary dataset files
     and storing them in the session payload, if they exist.
+
+    Secondary datasets may be uploaded as a merged HTML file, a Parquet file
+    with a `dataset_title` column, or a tar archive of TSV files.
     """
 
+    VALID_SECONDARY_EXTENSIONS = ["html", "parquet", "tar"]
+    VALID_HTML_PREFIXES = ("<h3>", "<html>", "<table>", "<!DOCTYPE html>")
+
     def name(self):
         return "read-secondary-datasets"
 
@@ -27,47 +35,64 @@ class ReadSecondaryDatasetsStage(PipelineStage):
 
         return payload
 
-    def _read_dataset_file(self, payload: SessionPayload):
+    def _read_dataset_file(
+        self, payload: SessionPayload
+    ) -> Optional[Dict[str, pd.DataFrame]]:
         """
-        Check if the secondary dataset file exists, and then parse the HTML for dataset tables.
+        Check if a secondary dataset file exists, and then read each of its dataset tables.
+
+        Tables are kept as typed DataFrames; tables that could not be read are left empty.
         """
 
-        html_filepath = get_file_with_ext(payload.uploaded_files, ["html"])
+        dataset_filepath = get_file_with_ext(
+            payload.uploaded_files, self.VALID_SECONDARY_EXTENSIONS
+        )
 
-        if html_filepath is None or html_filepath == "":
+        if dataset_filepath is None or dataset_filepath == "":
             return None
 
         secondary_datasets = dict()
 
-        with open(html_filepath, encoding="utf-8", errors="replace") as f:
-            html = f.read()
-            if (
-                (not html.startswith("<h3>"))
-                and (not html.startswith("<html>"))
-                and (
-                    not html.startswith("<table>")
-                    and (not html.startswith("<!DOCTYPE html>"))
-                )
-            ):
-                raise InvalidUsage(
-                    "Secondary dataset(s) provided are not formatted correctly. Please use the merge_and_convert_to_html.py script for formatting.",
-                    status_code=410,
-                )
-        soup = bs(html, "lxml")
-        table_titles = soup.find_all("h3")
-        table_titles = [x.text for x in table_titles]
-        tables = soup.find_all("table")
-        hp = htmltableparser.HTMLTableParser()
-        for i in np.arange(len(tables)):
+        for table_title, table in self._iter_tables(dataset_filepath):
+            if isinstance(table, Exception):
+                secondary_datasets[table_title] = pd.DataFrame()
+                continue
             try:
-                table = hp.parse_html_table(tables[i])
-                secondary_datasets[table_titles[i]] = table.fillna(-1).astype({
+                secondary_datasets[table_title] = table.fillna(-1).astype({
                     "CHROM": int,
                     "BP": int,
-                }).to_dict(
-                    orient="records"
-                )
+                })
             except Exception:
-                secondary_datasets[table_titles[i]] = []
+                secondary_datasets[table_title] = pd.DataFrame()
 
         return secondary_datasets
+
+    def _iter_tables(
+        self, dataset_filepath: os.PathLike
+    ) -> Iterator[Tuple[str, Union[pd.DataFrame, Exception]]]:
+        """
+        Yield (title, table) pairs from the secondary dataset file, based on its extension.
+        """
+        if str(dataset_filepath).endswith("parquet"):
+            yield from iter_parquet_tables(dataset_filepath)
+            return
+        if str(dataset_filepath).endswith("tar"):
+            yield from iter_tar_tables(dataset_filepath)
+            return
+
+        with open(dataset_filepath, encoding="utf-8", errors="replace") as f:
+            html_start = f.read(len(max(self.VALID_HTML_PREFIXES, key=len)))
+            if not html_start.startswith(self.VALID_HTML_PREFIXES):
+                raise InvalidUsage(
+                    "Secondary dataset(s) provided are not formatted correctly. Please use the merge_and_convert_to_html.py script for formatting.",
+                    status_code=410,
+                )
+
+        with open(dataset_filepath, "rb") as f:
+            for table_title, table in iter_html_tables(f):
+                if table_title is None:
+                    raise InvalidUsage(
+                        "Secondary dataset table found without an <h3> title. Please use the merge_and_convert_to_html.py script for formatting.",
+                        status_code=410,
+                    )
+                yield table_title, table
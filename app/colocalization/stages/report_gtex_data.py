@@ -1,15 +1,11 @@
 import json
-from tqdm import tqdm
+from flask import current_app
 from app.colocalization.payload import SessionPayload
 from app.pipeline.pipeline_stage import PipelineStage
-from app.utils.gtex import (
-    get_gtex_data,
-    collapsed_genes_df_hg38,
-)
+from app.utils.gencode import get_gene_interval_index
+from app.utils.gtex import get_gtex_data
 from app.utils.errors import InvalidUsage
 
-import numpy as np
-
 
 class ReportGTExDataStage(PipelineStage):
     """
@@ -54,11 +50,19 @@ class ReportGTExDataStage(PipelineStage):
         snp_list = [asnp.split(";")[0] for asnp in payload.gwas_data_kept["SNP"]]
 
         if len(gtex_tissues) > 0:
-            for tissue in tqdm(gtex_tissues):
-                # for the full region (not just the SS region)
-                eqtl_df = get_gtex_data(
-                    gtex_version, tissue, gene, snp_list, raiseErrors=True
-                )
+            # for the full region (not just the SS region)
+            eqtl_dfs = current_app.extensions["gtex_fetcher"].map(
+                lambda tissue: get_gtex_data(
+                    gtex_version,
+                    tissue,
+                    gene,
+                    snp_list,
+                    raiseErrors=True,
+                    cache=payload.eqtl_cache,
+                ),
+                gtex_tissues,
+            )
+            for tissue, eqtl_df in zip(gtex_tissues, eqtl_dfs):
                 if len(eqtl_df) > 0:
                     eqtl_df.fillna(-1, inplace=True)
                 gtex_data[tissue] = eqtl_df.to_dict(orient="records")
@@ -93,40 +97,8 @@ class ReportGTExDataStage(PipelineStage):
                 "GTEx V7 is no longer available. Please use GTEx V8 or V10."
             )
         else:
-            collapsed_genes_df = collapsed_genes_df_hg38
-
-        genes_to_draw = collapsed_genes_df.loc[
-            (collapsed_genes_df["chrom"] == ("chr" + str(chrom).replace("23", "X")))
-            & (
-                (
-                    (collapsed_genes_df["txStart"] >= startbp)
-                    & (collapsed_genes_df["txStart"] <= endbp)
-                )
-                | (
-                    (collapsed_genes_df["txEnd"] >= startbp)
-                    & (collapsed_genes_df["txEnd"] <= endbp)
-                )
-                | (
-                    (collapsed_genes_df["txStart"] <= startbp)
-                    & (collapsed_genes_df["txEnd"] >= endbp)
-                )
-            )
-        ]
-        genes_data = []
-        for i in np.arange(genes_to_draw.shape[0]):
-            genes_data.append(
-                {
-                    "name": list(genes_to_draw["name"])[i],
-                    "txStart": list(genes_to_draw["txStart"])[i],
-                    "txEnd": list(genes_to_draw["txEnd"])[i],
-                    "exonStarts": [
-                        int(bp)
-                        for bp in list(genes_to_draw["exonStarts"])[i].split(",")
-                    ],
-                    "exonEnds": [
-                        int(bp) for bp in list(genes_to_draw["exonEnds"])[i].split(",")
-                    ],
-                }
-            )
+            gene_index = get_gene_interval_index("hg38")
+
+        genes_data = gene_index.genes_data(chrom, startbp, endbp)
 
         json.dump(genes_data, open(payload.file.genes_session_filepath, "w"))
@@ -67,7 +67,7 @@ class BaseConfig:
     )
     # Flask-Uploads
     UPLOADED_FILES_DEST = UPLOAD_FOLDER
-    UPLOADED_FILES_ALLOW = set(["txt", "tsv", "ld", "html"])
+    UPLOADED_FILES_ALLOW = set(["txt", "tsv", "ld", "html", "parquet", "tar"])
     MAX_CONTENT_LENGTH = 500 * 1024 * 1024  # 500MB limit
 
     SEND_FILE_MAX_AGE_DEFAULT = 300  # 5 min cache
@@ -85,6 +85,8 @@ class BaseConfig:
         "broker_url": (lambda url, pw: url if not pw else url.replace("redis://", f"redis://{pw}@"))(os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0"), REDIS_PASSWORD),  # pylint: disable=C3002
         "result_backend": f"file://{os.path.join(SESSION_FOLDER, 'celery_results')}",
         "broker_connection_retry_on_startup": True,
+        # Pool processes preload reference data before taking tasks (see make_celery.py)
+        "worker_proc_alive_timeout": 60,
     }
 
     DISABLE_CELERY = os.environ.get("DISABLE_CELERY", "False").lower() == "true"
@@ -95,6 +97,58 @@ class BaseConfig:
     CACHE_DEFAULT_TIMEOUT = 60 * 60 * 24 * 7  # 1 week
     CACHE_DIR = os.path.join(LF_DATA_FOLDER, "cache")
     CACHE_KEY_PREFIX = "locusfocus-"
+    # Persistent (SQLite) cache of lifted-over coordinates, shared across jobs
+    LIFTOVER_CACHE_PATH = (
+        None if DISABLE_CACHE else os.path.join(CACHE_DIR, "liftover_cache.sqlite")
+    )
+
+    # Number of GTEx tissue/gene queries run concurrently per process (1 = sequential)
+    GTEX_FETCH_WORKERS = int(os.environ.get("GTEX_FETCH_WORKERS", 8))
+
+    # Byte budget of eQTL query results reused across jobs (0 disables)
+    EQTL_CACHE_MAX_BYTES = int(os.environ.get("EQTL_CACHE_MAX_BYTES", 256 * 1024**2))
+
+    # COLOC2 implementation: "python" (in-process, app/colocalization/coloc2.py)
+    # or "r" (Rscript app/scripts/run_coloc2.R)
+    COLOC2_ENGINE = os.environ.get("COLOC2_ENGINE", "python").lower()
+    # Number of processes the python COLOC2 engine splits ProbeIDs across (1 = in-process).
+    # Each Celery pool process starts its own, and Celery already runs a pool process per CPU,
+    # so more than 1 only helps with a lower --concurrency (up to CPUs // concurrency).
+    COLOC2_WORKERS = int(os.environ.get("COLOC2_WORKERS", 1))
+
+    # Long-lived R processes per app or Celery process that run the R scripts
+    # (see app/scripts/r_worker.py); 0 (the default) starts a one-shot Rscript for every run.
+    # Add "r_workers" to WORKER_PRELOAD to start them with each Celery pool process.
+    R_WORKERS = int(os.environ.get("R_WORKERS", 0))
+    # Jobs an R worker runs before it is replaced, to bound the memory R holds on to
+    R_WORKER_MAX_JOBS = int(os.environ.get("R_WORKER_MAX_JOBS", 50))
+
+    # Local Parquet export of the GTEx databases (see app/utils/gtex_db/export.py).
+    # When set, it is used instead of MongoDB for GTEx queries.
+    GTEX_PARQUET_PATH = os.environ.get("GTEX_PARQUET_PATH")
+
+    # Load the GENCODE tables in create_app rather than on first use, so that
+    # processes forked from the app (gunicorn --preload, Celery prefork) share them
+    PRELOAD_GENCODE = os.environ.get("PRELOAD_GENCODE", "False").lower() == "true"
+
+    # Reference data (and R workers) loaded when a Celery worker starts (see app/utils/preload.py),
+    # as comma-separated lists of targets, builds and 1000 Genomes populations (for "bim")
+    WORKER_PRELOAD = [
+        target
+        for target in os.environ.get(
+            "WORKER_PRELOAD", "gencode,chrom_lengths,liftover,dbsnp"
+        ).split(",")
+        if target
+    ]
+    WORKER_PRELOAD_BUILDS = [
+        build for build in os.environ.get("WORKER_PRELOAD_BUILDS", "hg19,hg38").split(",") if build
+    ]
+    WORKER_PRELOAD_POPULATIONS = [
+        pop for pop in os.environ.get("WORKER_PRELOAD_POPULATIONS", "").split(",") if pop
+    ]
+    # File created once a Celery worker has preloaded its reference data and is
+    # consuming tasks, and removed when it shuts down (eg. for a health check)
+    WORKER_READY_FILE = os.environ.get("WORKER_READY_FILE")
 
 
 class DevConfig(BaseConfig):
@@ -115,3 +169,4 @@ class ProdConfig(BaseConfig):
 
     MONGO_URI = os.environ.get("MONGO_CONNECTION_STRING")
     CACHE_TYPE = "FileSystemCache"
+    PRELOAD_GENCODE = os.environ.get("PRELOAD_GENCODE", "True").lower() == "true"
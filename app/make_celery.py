@@ -1,4 +1,73 @@
+import os
+
+from celery.signals import (
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown,
+    worker_ready,
+    worker_shutdown,
+)
+
 from app import create_app
+from app.colocalization.coloc2 import close_pool
+from app.utils.preload import (
+    PROCESS_PRELOAD_TARGETS,
+    SHARED_PRELOAD_TARGETS,
+    preload_reference_data,
+)
 
 flask_app = create_app()
 celery_app = flask_app.extensions["celery"]
+
+
+def _preload(targets):
+    config = flask_app.config
+    with flask_app.app_context():
+        preload_reference_data(
+            [target for target in config["WORKER_PRELOAD"] if target in targets],
+            config["WORKER_PRELOAD_BUILDS"],
+            config["WORKER_PRELOAD_POPULATIONS"],
+        )
+
+
+@worker_init.connect
+def preload_shared_reference_data(**kwargs):
+    """
+    Load reference data in the main worker process, before the pool is forked,
+    so that pool processes share it copy-on-write.
+    """
+    _preload(SHARED_PRELOAD_TARGETS)
+
+
+@worker_process_init.connect
+def preload_process_reference_data(**kwargs):
+    """
+    Open per-process handles in each pool process. Celery does not send tasks to
+    a pool process until it has finished this.
+    """
+    _preload(PROCESS_PRELOAD_TARGETS)
+
+
+@worker_process_shutdown.connect
+def close_coloc2_pool(**kwargs):
+    """
+    Stop the COLOC2 process pool a pool process may have started; pool processes
+    exit without running atexit handlers.
+    """
+    close_pool()
+
+
+@worker_ready.connect
+def mark_worker_ready(**kwargs):
+    if flask_app.config.get("WORKER_READY_FILE"):
+        with open(flask_app.config["WORKER_READY_FILE"], "w") as f:
+            f.write(str(os.getpid()))
+
+
+@worker_shutdown.connect
+def unmark_worker_ready(**kwargs):
+    if flask_app.config.get("WORKER_READY_FILE"):
+        try:
+            os.remove(flask_app.config["WORKER_READY_FILE"])
+        except FileNotFoundError:
+            pass
@@ -4,12 +4,10 @@ import json
 import pandas as pd
 import numpy as np
 import os
-from tqdm import tqdm
 import uuid
 import subprocess
 from datetime import datetime
 import re
-import pysam
 import glob
 import tarfile
 from typing import Dict, Optional, Tuple, List, Union
@@ -29,11 +27,15 @@ from markupsafe import Markup
 from pymongo.errors import ConnectionFailure
 
 from app.tasks import get_is_celery_running, run_pipeline_async
-from app.utils import download_file
-from app.utils.gencode import get_genes_by_location
-from app.utils.gtex import get_gtex, get_gtex_data
+from app.colocalization.plink import read_plink_bim
+from app.scripts import ScriptError, set_based_test
+from app.utils import download_file, get_chrom_lengths, get_dbsnp_tabix
+from app.utils.gencode import get_gene_name_index, get_genes_by_location
+from app.utils.eqtl_cache import EQTLCache
+from app.utils.gtex import gene_names, get_gtex, get_gtex_data, get_gtex_variants
 from app.utils.errors import InvalidUsage, ServerError
 from app.utils.numpy_encoder import NumpyEncoder
+from app.utils.variant_index import VariantIndex
 
 from app import ext, mongo
 from app.cache import cache
@@ -46,7 +48,7 @@ fileSizeLimit = 500 * 1024 * 1024  # in Bytes
 
 MYDIR = os.path.dirname(__file__)  # app directory
 APP_STATIC = os.path.join(MYDIR, "static")
-ALLOWED_EXTENSIONS = set(["txt", "tsv", "ld", "html"])
+ALLOWED_EXTENSIONS = set(["txt", "tsv", "ld", "html", "parquet", "tar"])
 ALLOWED_SBT_EXTENSIONS = set(["txt", "tsv", "ld"])
 
 
@@ -125,20 +127,6 @@ COLUMN_NAMES: Dict[str, str] = {
 ################
 ################
 
-collapsed_genes_df_hg19 = pd.read_csv(
-    os.path.join(app.config["LF_DATA_FOLDER"], "collapsed_gencode_v19_hg19.gz"),
-    compression="gzip",
-    sep="\t",
-    encoding="utf-8",
-)
-collapsed_genes_df_hg38 = pd.read_csv(
-    os.path.join(app.config["LF_DATA_FOLDER"], "collapsed_gencode_v26_hg38.gz"),
-    compression="gzip",
-    sep="\t",
-    encoding="utf-8",
-)
-
-collapsed_genes_df = collapsed_genes_df_hg19  # For now
 LD_MAT_DIAG_CONSTANT = 1e-6
 
 available_gtex_versions = ["V8", "V10"]
@@ -163,12 +151,7 @@ def parseRegionText(regiontext, build):
     pos = regiontext.split(":")[1]
     startbp = pos.split("-")[0].replace(",", "")
     endbp = pos.split("-")[1].replace(",", "")
-    chromLengths = pd.read_csv(
-        os.path.join(app.config["LF_DATA_FOLDER"], build + "_chrom_lengths.txt"),
-        sep="\t",
-        encoding="utf-8",
-    )
-    chromLengths.set_index("sequence", inplace=True)
+    chromLengths = get_chrom_lengths(build)
     if chrom in ["X", "x"] or chrom == "23":
         chrom = 23
         maxChromLength = chromLengths.loc["chrX", "length"]
@@ -261,20 +244,7 @@ def writeMat(aMat, filename):
 
 def genenames(genename, build):
     # Given either ENSG gene name or HUGO gene name, returns both HUGO and ENSG names
-    ensg_gene = genename
-    if build.lower() in ["hg19", "grch37"]:
-        collapsed_genes_df = collapsed_genes_df_hg19
-    elif build.lower() in ["hg38", "grch38"]:
-        collapsed_genes_df = collapsed_genes_df_hg38
-    if genename in list(collapsed_genes_df["name"]):
-        ensg_gene = collapsed_genes_df["ENSG_name"][
-            list(collapsed_genes_df["name"]).index(genename)
-        ]
-    if genename in list(collapsed_genes_df["ENSG_name"]):
-        genename = collapsed_genes_df["name"][
-            list(collapsed_genes_df["ENSG_name"]).index(genename)
-        ]
-    return genename, ensg_gene
+    return gene_names(genename, build)
 
 
 def classify_files(filenames):
@@ -396,21 +366,13 @@ def fetchSNV(chrom, bp, ref, build):
     chrom, startbp, endbp = parseRegionText(regiontxt, build)
     chrom = str(chrom).replace("chr", "").replace("23", "X")
 
-    # Load dbSNP151 SNP names from region indicated
-    dbsnp_filepath = ""
     if build.lower() in ["hg38", "grch38"]:
         suffix = "b38"
-        dbsnp_filepath = os.path.join(
-            app.config["LF_DATA_FOLDER"], "dbSNP151", "GRCh38p7", "All_20180418.vcf.gz"
-        )
     else:
         suffix = "b37"
-        dbsnp_filepath = os.path.join(
-            app.config["LF_DATA_FOLDER"], "dbSNP151", "GRCh37p13", "All_20180423.vcf.gz"
-        )
 
     # Load variant info from dbSNP151
-    tbx = pysam.TabixFile(dbsnp_filepath)
+    tbx = get_dbsnp_tabix(build)
     varlist = []
     for row in tbx.fetch(str(chrom), bp - 1, bp):
         rowlist = str(row).split("\t")
@@ -850,9 +812,7 @@ def find_plink_1kg_overlap(
             file for the given 1000 Genomes population.
     """
     # Ensure lead snp is also present in 1KG; if not, choose next best lead SNP
-    the1kg_snps_df = pd.read_csv(
-        plink_filepath + ".bim", sep="\t", header=None
-    )  # .iloc[:, 1]
+    the1kg_snps_df = read_plink_bim(plink_filepath)
 
     # Find lowest P-value position in snp_positions that is also in 1KG
     gwas_positions_df = pd.DataFrame({"pos": snp_positions, "p": snp_pvalues})
@@ -1248,9 +1208,9 @@ def getDBStatus():
         mongo.cx.admin.command("ping")
     except ConnectionFailure:  # db is down
         print("Server not available")
-        return jsonify({"status": "error"})
+        return jsonify({"status": "error", "gtex_fetcher": app.extensions["gtex_fetcher"].stats()})
     else:  # db is up
-        return jsonify({"status": "ok"})
+        return jsonify({"status": "ok", "gtex_fetcher": app.extensions["gtex_fetcher"].stats()})
 
 
 @app.route("/populations")
@@ -1263,11 +1223,7 @@ def get1KGPopulations():
 
 @app.route("/genenames/<build>")
 def getGeneNames(build):
-    if build.lower() == "hg38":
-        collapsed_genes_df = collapsed_genes_df_hg38
-    elif build.lower() == "hg19":
-        collapsed_genes_df = collapsed_genes_df_hg19
-    return jsonify(list(collapsed_genes_df["name"]))
+    return jsonify(get_gene_name_index(build).names)
 
 
 @app.route("/genenames/<build>/<chrom>/<startbp>/<endbp>")
@@ -1300,15 +1256,12 @@ def get_gtex_route(version, tissue, gene_id):
 
 @app.route("/gtex/<version>/<tissue>/<gene_id>/<variant>")
 def get_gtex_variant(version, tissue, gene_id, variant):
-    x = get_gtex(version, tissue, gene_id)
-    response_df = x
-    result = []
-    if variant.startswith("rs"):
-        result = response_df.loc[response_df["rs_id"] == variant]
-    elif variant.endswith("_b37") or variant.endswith("_b38"):
-        result = response_df.loc[response_df["variant_id"] == variant]
-    else:
-        raise InvalidUsage(f"variant name {variant} not found", status_code=410)
+    # variant may also be a comma-separated list of variants
+    variants = variant.split(",")
+    for v in variants:
+        if not (v.startswith("rs") or v.endswith("_b37") or v.endswith("_b38")):
+            raise InvalidUsage(f"variant name {v} not found", status_code=410)
+    result = get_gtex_variants(version, tissue, gene_id, variants)
     if result.shape[0] == 0:
         raise InvalidUsage(f"variant name {variant} not found", status_code=410)
     return jsonify(result.to_dict(orient="records"))
@@ -1449,9 +1402,12 @@ def update_colocalizing_gene(session_id, newgene):
     if gtex_version.upper() not in available_gtex_versions:
         gtex_version = "V10"
     # gtex_data = {}
-    for tissue in tqdm(gtex_tissues):
+    eqtl_dfs = app.extensions["gtex_fetcher"].map(
+        lambda tissue: get_gtex_data(gtex_version, tissue, newgene, snp_list),
+        gtex_tissues,
+    )
+    for tissue, eqtl_df in zip(gtex_tissues, eqtl_dfs):
         data[tissue] = pd.DataFrame({})
-        eqtl_df = get_gtex_data(gtex_version, tissue, newgene, snp_list)
         # eqtl_filepath = os.path.join(APP_STATIC, f'session_data/eqtl_df-{tissue}-{newgene}-{session_id}.txt')
         # if os.path.isfile(eqtl_filepath):
         if len(eqtl_df) > 0:
@@ -1463,6 +1419,72 @@ def update_colocalizing_gene(session_id, newgene):
     return jsonify(data)
 
 
+# eQTL columns drawn by the colocalization plot
+GENE_SWITCH_COLUMNS = ["pos", "pval", "rs_id"]
+
+
+@cache.memoize(timeout=60 * 60)
+def get_gene_switch_state(session_id):
+    """
+    Return the SNP list, GTEx tissues and GTEx version of a session, as needed to switch the plotted gene.
+    """
+    if secure_filename(session_id) != session_id:
+        raise InvalidUsage(f"Invalid session ID {session_id}")
+    sessionfilepath = os.path.join(APP_STATIC, f"session_data/form_data-{session_id}.json")
+    if not os.path.isfile(sessionfilepath):
+        raise InvalidUsage(f"Could not locate session {session_id}", status_code=404)
+    with open(sessionfilepath, "r") as f:
+        data = json.load(f)
+    gtex_version = data["gtex_version"]
+    if gtex_version.upper() not in available_gtex_versions:
+        gtex_version = "V10"
+    return {
+        "snps": data["snps"],
+        "gtex_tissues": data["gtex_tissues"],
+        "gtex_version": gtex_version,
+    }
+
+
+@app.route("/update/<session_id>/<newgene>/eqtl")
+def update_colocalizing_gene_eqtl(session_id, newgene):
+    """
+    Return the eQTLs of newgene in each of the session's GTEx tissues, for redrawing the colocalization plot.
+
+    Columnar, and only for SNPs in the session's SNP list that have eQTL data:
+    {"gene": ..., "tissues": {tissue: {"index": [...], "pos": [...], "pval": [...], "rs_id": [...]}}},
+    where "index" is the position of each SNP in the session's SNP list.
+    """
+    state = get_gene_switch_state(session_id)
+    snp_index = VariantIndex(state["snps"])
+    eqtl_cache = EQTLCache(app.extensions.get("eqtl_cache"))
+    eqtl_dfs = app.extensions["gtex_fetcher"].map(
+        lambda tissue: get_gtex_data(
+            state["gtex_version"],
+            tissue,
+            newgene,
+            snp_index,
+            columns=GENE_SWITCH_COLUMNS,
+            cache=eqtl_cache,
+        ),
+        state["gtex_tissues"],
+    )
+
+    tissues = {}
+    for tissue, eqtl_df in zip(state["gtex_tissues"], eqtl_dfs):
+        if len(eqtl_df) > 0:
+            eqtl_df = eqtl_df.dropna(subset=["pos", "pval"])
+        else:
+            eqtl_df = pd.DataFrame(columns=["index"] + GENE_SWITCH_COLUMNS)
+        tissues[tissue] = {
+            "index": eqtl_df["index"].astype(int).tolist(),
+            "pos": eqtl_df["pos"].astype(int).tolist(),
+            "pval": eqtl_df["pval"].astype(float).tolist(),
+            "rs_id": eqtl_df["rs_id"].fillna(".").tolist(),
+        }
+
+    return jsonify({"gene": newgene, "tissues": tissues})
+
+
 @app.route("/regionCheck/<build>/<regiontext>")
 def regionCheck(build, regiontext):
     message = dict({"response": "OK"})
@@ -1481,12 +1503,7 @@ def regionCheck(build, regiontext):
     pos = regiontext.split(":")[1]
     startbp = pos.split("-")[0].replace(",", "")
     endbp = pos.split("-")[1].replace(",", "")
-    chromLengths = pd.read_csv(
-        os.path.join(app.config["LF_DATA_FOLDER"], build + "_chrom_lengths.txt"),
-        sep="\t",
-        encoding="utf-8",
-    )
-    chromLengths.set_index("sequence", inplace=True)
+    chromLengths = get_chrom_lengths(build)
     if chrom in ["X", "x"] or chrom == "23":
         chrom = 23
         maxChromLength = chromLengths.loc["chrX", "length"]
@@ -1537,7 +1554,7 @@ def index():
     # name, required, extensions, description
     FILE_CONTROLS = [
         ("gwas-file", True, ["txt", "tsv"], "GWAS file"),
-        ("html-file", False, ["html"], "Secondary dataset HTML file"),
+        ("html-file", False, ["html", "parquet", "tar"], "Secondary dataset file"),
         ("ld-file", False, ["ld"], "LD matrix file"),
     ]
 
@@ -1760,26 +1777,12 @@ def setbasedtest():
                     "static",
                     f"session_data/SSPvalues-{my_session_id}-{i + 1:03}-{len(regions):03}.txt",
                 )
-                Rscript_args = [
-                    "Rscript",
-                    os.path.join(MYDIR, "getSimpleSumStats.R"),
-                    sep_Pvalues_filepath,
-                    sep_ldmatrix_filepath,
-                    "--set_based_p",
-                    "default",
-                    "--outfilename",
-                    SSresult_path,
-                    "--first_stage_only",
-                ]
-                RscriptRun = subprocess.run(
-                    args=Rscript_args,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    universal_newlines=True,
-                )
-                if RscriptRun.returncode != 0:
-                    raise InvalidUsage(RscriptRun.stdout, status_code=410)
-                SSdf = pd.read_csv(SSresult_path, sep="\t", encoding="utf-8")
+                try:
+                    SSdf = set_based_test(
+                        sep_Pvalues_filepath, sep_ldmatrix_filepath, SSresult_path
+                    )
+                except ScriptError as e:
+                    raise InvalidUsage(e.stdout + e.stderr, status_code=410)
 
                 first_stages.extend(SSdf["first_stages"].tolist())
                 first_stage_p.extend(SSdf["first_stage_p"].tolist())
@@ -1848,26 +1851,12 @@ def setbasedtest():
                     "static",
                     f"session_data/SSPvalues-{my_session_id}-{i + 1:03}-{len(regions):03}.txt",
                 )
-                Rscript_args = [
-                    "Rscript",
-                    os.path.join(MYDIR, "getSimpleSumStats.R"),
-                    sep_Pvalues_filepath,
-                    sep_ldmatrix_filepath,
-                    "--set_based_p",
-                    "default",
-                    "--outfilename",
-                    SSresult_path,
-                    "--first_stage_only",
-                ]
-                RscriptRun = subprocess.run(
-                    args=Rscript_args,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    universal_newlines=True,
-                )
-                if RscriptRun.returncode != 0:
-                    raise InvalidUsage(RscriptRun.stdout, status_code=410)
-                SSdf = pd.read_csv(SSresult_path, sep="\t", encoding="utf-8")
+                try:
+                    SSdf = set_based_test(
+                        sep_Pvalues_filepath, sep_ldmatrix_filepath, SSresult_path
+                    )
+                except ScriptError as e:
+                    raise InvalidUsage(e.stdout + e.stderr, status_code=410)
 
                 first_stages.extend(SSdf["first_stages"].tolist())
                 first_stage_p.extend(SSdf["first_stage_p"].tolist())
@@ -2005,35 +1994,15 @@ def setbasedtest():
         Pvalues_filepath = os.path.join(MYDIR, "static", Pvalues_file)
         writeMat(PvaluesMat, Pvalues_filepath)
 
-        Rscript_code_path = os.path.join(MYDIR, "getSimpleSumStats.R")
-        # Rscript_path = subprocess.run(args=["which","Rscript"], stdout=subprocess.PIPE, universal_newlines=True).stdout.replace('\n','')
         SSresult_path = os.path.join(
             MYDIR, "static", f"session_data/SSPvalues_setbasedtest-{my_session_id}.txt"
         )
-        Rscript_args = [
-            "Rscript",
-            Rscript_code_path,
-            Pvalues_filepath,
-            ldmatrix_filepath,
-            "--set_based_p",
-            "default",
-            "--outfilename",
-            SSresult_path,
-            "--first_stage_only",
-        ]
-        if combine_lds:
-            Rscript_args.append("--combine_lds")
-
-        RscriptRun = subprocess.run(
-            args=Rscript_args,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-        )
-        if RscriptRun.returncode != 0:
-            print(f"R Script failed: {Rscript_args}")
-            raise InvalidUsage(RscriptRun.stdout, status_code=410)
-        SSdf = pd.read_csv(SSresult_path, sep="\t", encoding="utf-8")
+        try:
+            SSdf = set_based_test(
+                Pvalues_filepath, ldmatrix_filepath, SSresult_path, combine_lds=combine_lds
+            )
+        except ScriptError as e:
+            raise InvalidUsage(e.stdout + e.stderr, status_code=410)
 
         first_stages = SSdf["first_stages"].tolist()
         first_stage_p = SSdf["first_stage_p"].tolist()
@@ -4,8 +4,12 @@ R scripts for LocusFocus. Functions for running R scripts and returning results.
 
 import os
 import subprocess
-from typing import Union
+from typing import Sequence, Union
 import pandas as pd
+from flask import current_app as app
+
+from app.scripts import r_worker
+from app.scripts.r_worker import RWorkerError, RWorkersBusy, get_r_worker_pool
 
 # All R scripts are in app/scripts/, so we can import them here
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -26,6 +30,35 @@ class ScriptError(Exception):
         return f"Script returned non-zero exit code.\nStdout: {self.stdout}\nStderr: {self.stderr}"
 
 
+def run_r_script(
+    script_path: os.PathLike, args: Sequence[Union[str, os.PathLike]]
+) -> subprocess.CompletedProcess:
+    """
+    Run an R script with the given command line arguments, and return its exit status and output.
+
+    The script runs in a worker of the R worker pool (see r_worker.py) if it is enabled,
+    and otherwise, or if no worker can take it, with a one-shot Rscript.
+    """
+    script_path = str(script_path)
+    args = [str(arg) for arg in args]
+    pool = get_r_worker_pool()
+    if pool is not None:
+        try:
+            return pool.run(script_path, args)
+        except RWorkersBusy:
+            pass
+        except RWorkerError as e:
+            app.logger.warning(
+                f"R worker could not run {os.path.basename(script_path)}, using Rscript: {e}"
+            )
+    return subprocess.run(
+        args=[r_worker.RSCRIPT, script_path, *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+
+
 def simple_sum(
     p_values_filepath: os.PathLike,
     ldmatrix_filepath: os.PathLike,
@@ -43,8 +76,6 @@ def simple_sum(
     """
     SCRIPT_PATH = os.path.join(BASE_DIR, "getSimpleSumStats.R")
     args = [
-        "Rscript",
-        SCRIPT_PATH,
         p_values_filepath,
         ldmatrix_filepath,
         "--set_based_p",
@@ -53,12 +84,7 @@ def simple_sum(
         results_filepath,
     ]
 
-    process_runner = subprocess.run(
-        args=args,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        universal_newlines=True,
-    )
+    process_runner = run_r_script(SCRIPT_PATH, args)
     if process_runner.returncode != 0:
         raise ScriptError(process_runner.stdout, process_runner.stderr)
 
@@ -80,20 +106,13 @@ def coloc2(
     """
     SCRIPT_PATH = os.path.join(BASE_DIR, "run_coloc2.R")
     args = [
-        "Rscript",
-        SCRIPT_PATH,
         coloc2_gwas_filepath,
         coloc2_eqtl_filepath,
         "--outfilename",
         results_filepath,
     ]
 
-    process_runner = subprocess.run(
-        args=args,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        universal_newlines=True,
-    )
+    process_runner = run_r_script(SCRIPT_PATH, args)
     if process_runner.returncode != 0:
         raise ScriptError(process_runner.stdout, process_runner.stderr)
 
@@ -102,11 +121,41 @@ def coloc2(
     return coloc2_df
 
 
-def set_based_test():
+def set_based_test(
+    p_values_filepath: os.PathLike,
+    ldmatrix_filepath: os.PathLike,
+    results_filepath: os.PathLike,
+    combine_lds: bool = False,
+) -> pd.DataFrame:
     """
-    Run the set-based test using the getSimpleSumStats.R script.
+    Run the first-stage set-based test of each row of p-values using the getSimpleSumStats.R script.
+
+    With combine_lds, ldmatrix_filepath is the first of the numbered LD matrix files
+    of a session ("ldmat-<id>-001-<total>.txt"), and the script combines them all.
 
     Does not perform any pre-processing or validation before running the script
     with the provided parameters.
+
+    Return the DataFrame created by the R script as a result.
+    Raise error if the script fails to run.
     """
-    raise NotImplementedError()
+    SCRIPT_PATH = os.path.join(BASE_DIR, "getSimpleSumStats.R")
+    args = [
+        p_values_filepath,
+        ldmatrix_filepath,
+        "--set_based_p",
+        "default",
+        "--outfilename",
+        results_filepath,
+        "--first_stage_only",
+    ]
+    if combine_lds:
+        args.append("--combine_lds")
+
+    process_runner = run_r_script(SCRIPT_PATH, args)
+    if process_runner.returncode != 0:
+        raise ScriptError(process_runner.stdout, process_runner.stderr)
+
+    set_based_test_df = pd.read_csv(results_filepath, sep="\t", encoding="utf-8")
+
+    return set_based_test_df
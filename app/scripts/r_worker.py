@@ -0,0 +1,295 @@
+"""
+Pool of long-lived R processes that run the R scripts in app/scripts/ as jobs.
+
+A one-shot Rscript spends most of a Simple Sum or COLOC2 run loading packages
+(and, for COLOC2, sourcing the coloc2/ functions). Each worker (r_worker.R)
+loads them once, then runs scripts with the same arguments Rscript would get,
+so jobs pass file paths as before.
+
+The worker reads one request per line on its stdin, with tab-separated fields::
+
+    PING
+    RUN <script> <arg> ...
+
+and answers each on a pipe of its own (passed as the file descriptor number
+argument of r_worker.R) with a line "<status>\t<stdout bytes>\t<stderr bytes>",
+followed by the job's stdout and stderr. R's console output, which the replies
+must not be mixed with, goes to this process's stderr.
+"""
+
+import os
+import select
+import subprocess
+import threading
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from flask import current_app as app, has_app_context
+
+RSCRIPT = "Rscript"
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "r_worker.R")
+# Seconds a new worker may take to load its packages
+STARTUP_TIMEOUT = 120.0
+# Seconds a worker may take to answer a health check
+PING_TIMEOUT = 10.0
+# Workers idle for longer than this many seconds are health checked before their next job
+HEALTH_CHECK_INTERVAL = 60.0
+# Seconds to run one-shot Rscripts for after a worker failed to start, before trying again
+RETRY_INTERVAL = 300.0
+
+
+class RWorkerError(Exception):
+    """An R worker could not run a job: it failed to start, stopped answering, or exited."""
+
+
+class RWorkersBusy(RWorkerError):
+    """Every worker of the pool is running a job."""
+
+
+class RWorker:
+    """
+    One R process running r_worker.R. Not thread-safe; the pool gives each worker to one thread at a time.
+    """
+
+    def __init__(
+        self, worker_script: str = WORKER_SCRIPT, startup_timeout: float = STARTUP_TIMEOUT
+    ):
+        self._replies, reply_fd = os.pipe()
+        try:
+            self.process = subprocess.Popen(
+                [RSCRIPT, worker_script, str(reply_fd)],
+                stdin=subprocess.PIPE,
+                # R's console output goes to our stderr (fd 2), and replies to their own pipe
+                stdout=2,
+                pass_fds=(reply_fd,),
+            )
+        except OSError as e:
+            os.close(self._replies)
+            raise RWorkerError(f"Could not start {RSCRIPT}: {e}") from e
+        finally:
+            # Only the worker writes replies, so that reading them ends when it exits
+            os.close(reply_fd)
+        self.jobs_run = 0
+        self.last_used = time.monotonic()
+        self._buffer = bytearray()
+        try:
+            self.ping(startup_timeout)
+        except RWorkerError:
+            self.close()
+            raise
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def ping(self, timeout: Optional[float] = None) -> None:
+        """Raise RWorkerError if the worker does not answer within timeout seconds (default PING_TIMEOUT)."""
+        self._send(["PING"])
+        self._read_reply(PING_TIMEOUT if timeout is None else timeout)
+
+    def run(
+        self, script: str, args: Sequence[str], timeout: Optional[float] = None
+    ) -> subprocess.CompletedProcess:
+        """
+        Run script with args, and return its exit status and output like `subprocess.run`.
+
+        Raise RWorkerError if the worker exits or does not answer within timeout seconds (default: no limit).
+        """
+        self._send(["RUN", script, *args])
+        status, stdout, stderr = self._read_reply(timeout)
+        self.jobs_run += 1
+        self.last_used = time.monotonic()
+        return subprocess.CompletedProcess(
+            [RSCRIPT, script, *args], status, stdout, stderr
+        )
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Ask the worker to exit (by closing its stdin), and kill it if it does not within timeout seconds."""
+        try:
+            self.process.stdin.close()  # type: ignore
+            self.process.wait(timeout=timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        finally:
+            os.close(self._replies)
+
+    def _send(self, fields: List[str]) -> None:
+        try:
+            self.process.stdin.write(("\t".join(fields) + "\n").encode())  # type: ignore
+            self.process.stdin.flush()  # type: ignore
+        except OSError as e:
+            raise RWorkerError(f"R worker is not accepting jobs: {e}") from e
+
+    def _read_reply(self, timeout: Optional[float]) -> Tuple[int, str, str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        header = self._read(None, deadline)
+        try:
+            status, out_size, err_size = map(int, header.split(b"\t"))
+        except ValueError:
+            raise RWorkerError(f"Unexpected reply from R worker: {header!r}")
+        body = self._read(out_size + err_size, deadline)
+        return (
+            status,
+            body[:out_size].decode(errors="replace"),
+            body[out_size:].decode(errors="replace"),
+        )
+
+    def _read(self, size: Optional[int], deadline: Optional[float]) -> bytes:
+        """Read size bytes of the worker's replies, or a line if size is None."""
+        while True:
+            if size is None:
+                end = self._buffer.find(b"\n") + 1
+                complete = end > 0
+            else:
+                end = size
+                complete = len(self._buffer) >= size
+            if complete:
+                data = bytes(self._buffer[:end])
+                del self._buffer[:end]
+                return data
+
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            ready, _, _ = select.select([self._replies], [], [], remaining)
+            if not ready:
+                raise RWorkerError("R worker did not answer in time")
+            chunk = os.read(self._replies, 65536)
+            if not chunk:
+                raise RWorkerError(f"R worker exited with status {self.process.wait()}")
+            self._buffer += chunk
+
+
+class RWorkerPool:
+    """
+    Up to size R workers, started on demand and shared by the threads of a process.
+
+    Idle workers are health checked before reuse, and replaced after max_jobs jobs
+    (to bound the memory R holds on to). When every worker is busy, or a worker
+    cannot be started, `run` raises RWorkerError and the caller runs a one-shot Rscript.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        max_jobs: int,
+        worker_script: str = WORKER_SCRIPT,
+        startup_timeout: float = STARTUP_TIMEOUT,
+    ):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.worker_script = worker_script
+        self.startup_timeout = startup_timeout
+        self._idle: List[RWorker] = []
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._start_failed_at: Optional[float] = None
+
+    def run(
+        self, script: str, args: Sequence[str], timeout: Optional[float] = None
+    ) -> subprocess.CompletedProcess:
+        """Run script with args in a worker of the pool; see `RWorker.run`."""
+        if any("\t" in field or "\n" in field for field in [script, *args]):
+            raise RWorkerError("R worker arguments cannot contain tabs or newlines")
+        if not self._slots.acquire(blocking=False):
+            raise RWorkersBusy(f"All {self.size} R workers are busy")
+        try:
+            worker = self._acquire()
+            try:
+                result = worker.run(script, args, timeout)
+            except RWorkerError:
+                worker.close(timeout=0)
+                raise
+            self._release(worker)
+            return result
+        finally:
+            self._slots.release()
+
+    def start(self) -> None:
+        """Start a worker now rather than on the first job (eg. when a Celery worker starts)."""
+        with self._slots:
+            self._release(self._acquire())
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.close()
+
+    def _acquire(self) -> RWorker:
+        while True:
+            with self._lock:
+                worker = self._idle.pop() if self._idle else None
+            if worker is None:
+                return self._start_worker()
+            if not worker.is_alive():
+                worker.close()
+                continue
+            if time.monotonic() - worker.last_used > HEALTH_CHECK_INTERVAL:
+                try:
+                    worker.ping()
+                except RWorkerError:
+                    worker.close(timeout=0)
+                    continue
+            return worker
+
+    def _release(self, worker: RWorker) -> None:
+        if worker.jobs_run >= self.max_jobs:
+            worker.close()
+            return
+        with self._lock:
+            self._idle.append(worker)
+
+    def _start_worker(self) -> RWorker:
+        failed_at = self._start_failed_at
+        if failed_at is not None and time.monotonic() - failed_at < RETRY_INTERVAL:
+            raise RWorkerError("R workers failed to start recently")
+        try:
+            worker = RWorker(self.worker_script, self.startup_timeout)
+        except RWorkerError:
+            self._start_failed_at = time.monotonic()
+            raise
+        self._start_failed_at = None
+        return worker
+
+
+_pool: Optional[RWorkerPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def get_r_worker_pool() -> Optional[RWorkerPool]:
+    """
+    Return the R worker pool of this process, configured by R_WORKERS and R_WORKER_MAX_JOBS,
+    or None if it is disabled (R_WORKERS = 0) or there is no app context.
+    """
+    global _pool, _pool_pid
+    if not has_app_context() or app.config.get("R_WORKERS", 0) <= 0:
+        return None
+    with _pool_lock:
+        # A forked process must not share its parent's workers, whose pipes it inherited
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = RWorkerPool(
+                app.config["R_WORKERS"], app.config["R_WORKER_MAX_JOBS"], WORKER_SCRIPT
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def start_r_workers() -> None:
+    """
+    Start a worker of this process's pool in the background, so that the first job
+    does not wait for R to load. Jobs that come before it is ready use a one-shot Rscript.
+
+    This returns at once, so it does not hold up a Celery pool process's startup.
+    """
+    pool = get_r_worker_pool()
+    if pool is None:
+        return
+    logger = app.logger
+
+    def start():
+        try:
+            pool.start()
+        except RWorkerError as e:
+            logger.warning(f"Could not start an R worker: {e}")
+
+    threading.Thread(target=start, name="r-worker-start", daemon=True).start()
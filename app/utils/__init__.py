@@ -4,9 +4,11 @@ Common utility functions and classes shared by multiple routes in LocusFocus.
 
 import os
 import re
-from typing import List, Optional
+import threading
+from functools import lru_cache
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
 
-import pysam
 import pandas as pd
 import numpy as np
 from flask import current_app as app
@@ -14,11 +16,20 @@ from werkzeug.utils import secure_filename
 from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.datastructures import FileStorage
 
+from app.utils.dbsnp_index import DbSNPIndex, load_dbsnp_index
 from app.utils.errors import InvalidUsage
 from app.utils.variants import get_variants_by_region
 
 GENOMIC_WINDOW_LIMIT = 2e6
 
+# dbSNP151 VCFs (bgzipped and tabix-indexed) under LF_DATA_FOLDER
+DBSNP_FILES = {
+    "hg19": os.path.join("dbSNP151", "GRCh37p13", "All_20180423.vcf.gz"),
+    "hg38": os.path.join("dbSNP151", "GRCh38p7", "All_20180418.vcf.gz"),
+}
+
+_dbsnp_handles = threading.local()
+
 
 def get_session_filepath(filename: str) -> os.PathLike:
     """
@@ -78,6 +89,154 @@ def get_file_with_ext(
     return None
 
 
+def get_chrom_lengths(build: str) -> pd.DataFrame:
+    """
+    Return the chromosome lengths table for build ("hg19" or "hg38"), indexed by sequence name (eg. "chrX").
+
+    The table is read once per process and shared, so it must not be modified.
+    """
+    return _read_chrom_lengths(
+        os.path.join(app.config["LF_DATA_FOLDER"], build + "_chrom_lengths.txt")
+    )
+
+
+@lru_cache(maxsize=None)
+def _read_chrom_lengths(path: str) -> pd.DataFrame:
+    return pd.read_csv(path, sep="\t", encoding="utf-8").set_index("sequence")
+
+
+def get_dbsnp_tabix(build: str):
+    """
+    Return an open `pysam.TabixFile` of the dbSNP151 VCF for build (hg19/GRCh37 or hg38/GRCh38).
+
+    Opening the file reads its whole tabix index, so handles are kept open and
+    reused. Handles are not thread-safe and do not survive a fork, so each
+    thread of each process gets its own.
+    """
+    import pysam
+
+    build = "hg38" if build.lower() in ["hg38", "grch38"] else "hg19"
+    dbsnp_filepath = os.path.join(app.config["LF_DATA_FOLDER"], DBSNP_FILES[build])
+    if getattr(_dbsnp_handles, "pid", None) != os.getpid():
+        _dbsnp_handles.pid = os.getpid()
+        _dbsnp_handles.files = {}
+    if dbsnp_filepath not in _dbsnp_handles.files:
+        _dbsnp_handles.files[dbsnp_filepath] = pysam.TabixFile(dbsnp_filepath)  # type: ignore
+    return _dbsnp_handles.files[dbsnp_filepath]
+
+
+def get_dbsnp_index(build: str) -> Optional[DbSNPIndex]:
+    """
+    Return the rsID/position index of the dbSNP151 VCF for build, or None if it has not been built.
+
+    See app/utils/dbsnp_index.py for building it.
+    """
+    build = "hg38" if build.lower() in ["hg38", "grch38"] else "hg19"
+    return load_dbsnp_index(
+        os.path.join(app.config["LF_DATA_FOLDER"], DBSNP_FILES[build])
+    )
+
+
+def _dbsnp_rsid_variants(build, chrom, startbp, endbp, suffix, rsids):
+    """
+    Map each of the given rsIDs found in dbSNP151 within the region to its chrom_pos_ref_alt_build variant ID.
+
+    Multi-allelic variants keep all their ALT alleles, eg. 1_205001063_T_A,C_b37.
+    If an rsID has more than one record in the region, the last one wins.
+    """
+    dbsnp_index = get_dbsnp_index(build)
+    if dbsnp_index is not None:
+        found = {}
+        rsids = list(set(rsids))
+        for rsid, records in zip(rsids, dbsnp_index.lookup_rsids(rsids)):
+            for record in records:
+                if record.chrom == chrom and record.overlaps(startbp, endbp):
+                    found[rsid] = "_".join(
+                        [record.chrom, str(record.pos), record.ref, record.alt, suffix]
+                    )
+        return found
+
+    # Without an index, scan every record in the region
+    found = {}
+    for row in get_dbsnp_tabix(build).fetch(str(chrom), startbp, endbp):
+        rowlist = str(row).split("\t")
+        chromi = rowlist[0].replace("chr", "")
+        found[rowlist[2]] = "_".join(
+            [chromi, rowlist[1], rowlist[3], rowlist[4], suffix]
+        )
+    return found
+
+
+def resolve_snvs(
+    build: str, chrom: str, positions: Sequence[int], refs: Sequence[str]
+) -> List[str]:
+    """
+    Resolve 1-based positions on chrom to dbSNP151 variant IDs in chrom_pos_ref_alt_build format.
+
+    A position covered by exactly one dbSNP record resolves to it. A position covered
+    by several resolves to the first whose REF matches the given one (refs may be "").
+    Anything else resolves to ".". This is the rule of `fetch_snv`, applied to a batch:
+    with the dbSNP index each position is a binary search, and without it all positions
+    are resolved with a single tabix sweep from the lowest to the highest position,
+    instead of one tabix query (and block decompression) each.
+    """
+    if len(positions) == 0:
+        return []
+    suffix = "b38" if build.lower() in ["hg38", "grch38"] else "b37"
+    query = sorted(set(int(pos) for pos in positions))
+
+    # position -> variant IDs of the records covering it, in file order
+    covering: Dict[int, List[str]] = {}
+    dbsnp_index = get_dbsnp_index(build)
+    if dbsnp_index is not None:
+        for pos in query:
+            covering[pos] = [
+                "_".join([record.chrom, str(record.pos), record.ref, record.alt, suffix])
+                for record in dbsnp_index.fetch(str(chrom), pos - 1, pos)
+            ]
+    else:
+        tbx = get_dbsnp_tabix(build)
+        for row in tbx.fetch(str(chrom), query[0] - 1, query[-1]):
+            rowlist = str(row).split("\t")
+            chromi = rowlist[0].replace("chr", "")
+            posi = int(rowlist[1])
+            refi = rowlist[3]
+            varstr = "_".join([chromi, rowlist[1], refi, rowlist[4], suffix])
+            first = bisect_left(query, posi)
+            last = bisect_right(query, posi + len(refi) - 1)
+            for pos in query[first:last]:
+                covering.setdefault(pos, []).append(varstr)
+
+    variant_ids = []
+    for pos, ref in zip(positions, refs):
+        varlist = covering.get(int(pos), [])
+        if len(varlist) == 1:
+            variant_ids.append(varlist[0])
+        elif len(varlist) > 1 and ref not in [None, ".", ""]:
+            variant_ids.append(
+                next((v for v in varlist if v.split("_")[2] == ref), ".")
+            )
+        else:
+            variant_ids.append(".")
+    return variant_ids
+
+
+def _variant_position(
+    chrom_text: str, pos_text: str, chrom_lengths: Dict[str, int]
+) -> Tuple[str, int]:
+    """
+    Validate the chromosome and position of a variant ID, as `parse_region_text` does
+    for the 1 bp region at that position. Return the chromosome (X for 23) and position.
+    """
+    chrom = 23 if chrom_text.upper() == "X" else int(chrom_text)
+    pos = int(pos_text)
+    if chrom < 1 or chrom > 23:
+        raise ValueError(f"Invalid chromosome {chrom_text}")
+    if pos + 1 > chrom_lengths["chrX" if chrom == 23 else f"chr{chrom}"]:
+        raise ValueError(f"Position {pos_text} is out of range")
+    return ("X" if chrom == 23 else str(chrom)), pos
+
+
 def decompose_variant_list(variant_list):
     """
     Parameters
@@ -135,67 +294,39 @@ def standardize_snps(variantlist, regiontxt, build):
     # Lookup variants in GTEx V10 db
     variants_df = get_variants_by_region(int(startbp), int(endbp), str(chrom), "V10")
 
-    # Load dbSNP151 SNP names from region indicated
-    dbsnp_filepath = ""
     suffix = "b37"
     if build.lower() in ["hg38", "grch38"]:
         rsid_colname = "rs_id"
         suffix = "b38"
         # TODO: use newer dbSNP file !!!
-        dbsnp_filepath = os.path.join(
-            app.config["LF_DATA_FOLDER"], "dbSNP151", "GRCh38p7", "All_20180418.vcf.gz"
-        )
     else:
         rsid_colname = "rs_id_dbSNP147_GRCh37p13"
         suffix = "b37"
-        dbsnp_filepath = os.path.join(
-            app.config["LF_DATA_FOLDER"], "dbSNP151", "GRCh37p13", "All_20180423.vcf.gz"
-        )
 
-    # Load dbSNP file
-    # delayeddf = delayed(pd.read_csv)(dbsnp_filepath,skiprows=getNumHeaderLines(dbsnp_filepath),sep='\t')
-    # dbsnp = dd.from_delayed(delayeddf)
-
-    tbx = pysam.TabixFile(dbsnp_filepath)  # type: ignore
-    #    print('Compiling list of known variants in the region from dbSNP151')
-    chromcol = []
-    poscol = []
-    idcol = []
-    refcol = []
-    altcol = []
-    variantid = []  # in chr_pos_ref_alt_build format
-    rsids = dict(
-        {}
-    )  # a multi-allelic variant rsid (key) can be represented in several variantid formats (values)
-    for row in tbx.fetch(str(chrom), startbp, endbp):
-        rowlist = str(row).split("\t")
-        chromi = rowlist[0].replace("chr", "")
-        posi = rowlist[1]
-        idi = rowlist[2]
-        refi = rowlist[3]
-        alti = rowlist[4]
-        varstr = "_".join([chromi, posi, refi, alti, suffix])
-        chromcol.append(chromi)
-        poscol.append(posi)
-        idcol.append(idi)
-        refcol.append(refi)
-        altcol.append(alti)
-        variantid.append(varstr)
-        rsids[idi] = [varstr]
-        altalleles = alti.split(
-            ","
-        )  # could have more than one alt allele (multi-allelic)
-        if len(altalleles) > 1:
-            varstr = "_".join([chromi, posi, refi, altalleles[0], suffix])
-            rsids[idi].append(varstr)
-            for i in np.arange(len(altalleles) - 1):
-                varstr = "_".join([chromi, posi, refi, altalleles[i + 1], suffix])
-                rsids[idi].append(varstr)
+    # rsID -> GTEx variant ID, first occurrence wins.
+    # None if no GTEx variants were found, which leaves every rsID unmatched below.
+    gtex_rsids = None
+    if rsid_colname in variants_df:
+        gtex_rsids = dict(
+            zip(variants_df[rsid_colname][::-1], variants_df["variant_id"][::-1])
+        )
 
     #    print('Cleaning and mapping list of variants')
     variantlist = [
         asnp.split(";")[0].replace(":", "_").replace(".", "") for asnp in variantlist
     ]  # cleaning up the SNP names a bit
+
+    # Load dbSNP151 SNP names from region indicated
+    queried_rsids = [
+        variant.replace("chr", "")
+        for variant in variantlist
+        if variant.replace("chr", "").startswith("rs")
+    ]
+    rsids = _dbsnp_rsid_variants(build, chrom, startbp, endbp, suffix, queried_rsids)
+
+    chrom_lengths = get_chrom_lengths(build)["length"].to_dict()
+    # (index in stdvariantlist, position, REF) of chrom_pos(_ref) variants, resolved together below
+    positional = []
     stdvariantlist = []
     for variant in variantlist:
         if variant == "":
@@ -207,15 +338,10 @@ def standardize_snps(variantlist, regiontxt, build):
         if variantstr.startswith("rs"):
             try:
                 # Here's the difference from the first function version (we look at GTEx first)
-                if variant in list(variants_df[rsid_colname]):
-                    stdvar = (
-                        variants_df["variant_id"]
-                        .loc[variants_df[rsid_colname] == variant]
-                        .to_list()[0]
-                    )
-                    stdvariantlist.append(stdvar)
+                if variant in gtex_rsids:  # type: ignore
+                    stdvariantlist.append(gtex_rsids[variant])  # type: ignore
                 else:
-                    stdvariantlist.append(rsids[variantstr][0])
+                    stdvariantlist.append(rsids[variantstr])
             except Exception:
                 stdvariantlist.append(".")
         elif re.search(
@@ -224,11 +350,7 @@ def standardize_snps(variantlist, regiontxt, build):
             strlist = variantstr.split("_")
             strlist = list(filter(None, strlist))  # remove empty strings
             try:
-                achr, astart, aend = parse_region_text(
-                    strlist[0] + ":" + strlist[1] + "-" + str(int(strlist[1]) + 1),
-                    build,
-                )
-                achr = str(achr).replace("23", "X")
+                achr, astart = _variant_position(strlist[0], strlist[1], chrom_lengths)
                 if achr == str(chrom) and astart >= startbp and astart <= endbp:
                     variantstr = (
                         variantstr.replace("_" + str(suffix), "") + "_" + str(suffix)
@@ -248,25 +370,31 @@ def standardize_snps(variantlist, regiontxt, build):
             strlist = variantstr.split("_")
             strlist = list(filter(None, strlist))  # remove empty strings
             try:
-                achr, astart, aend = parse_region_text(
-                    strlist[0] + ":" + strlist[1] + "-" + str(int(strlist[1]) + 1),
-                    build,
-                )
-                achr = str(achr).replace("23", "X")
-                if achr == str(chrom) and astart >= startbp and astart <= endbp:
-                    if len(strlist) == 3:
-                        aref = strlist[2]
-                    else:
-                        aref = ""
-                    stdvariantlist.append(fetch_snv(achr, astart, aref, build))
-                else:
-                    stdvariantlist.append(".")
+                achr, astart = _variant_position(strlist[0], strlist[1], chrom_lengths)
             except Exception:
                 raise InvalidUsage(f"Problem with variant {variant}", status_code=410)
+            if achr == str(chrom) and astart >= startbp and astart <= endbp:
+                if len(strlist) == 3:
+                    aref = strlist[2]
+                else:
+                    aref = ""
+                positional.append((len(stdvariantlist), astart, aref))
+            stdvariantlist.append(".")
         else:
             raise InvalidUsage(
                 f"Variant format not recognized: {variant}", status_code=410
             )
+
+    if positional:
+        indices, positions, refs = zip(*positional)
+        try:
+            snvs = resolve_snvs(build, chrom, positions, refs)
+        except Exception:
+            raise InvalidUsage(
+                f"Problem with variant {variantlist[indices[0]]}", status_code=410
+            )
+        for i, snv in zip(indices, snvs):
+            stdvariantlist[i] = snv
     return stdvariantlist
 
 
@@ -285,12 +413,7 @@ def parse_region_text(regiontext, build):
     pos = regiontext.split(":")[1]
     startbp = pos.split("-")[0].replace(",", "")
     endbp = pos.split("-")[1].replace(",", "")
-    chromLengths = pd.read_csv(
-        os.path.join(app.config["LF_DATA_FOLDER"], build + "_chrom_lengths.txt"),
-        sep="\t",
-        encoding="utf-8",
-    )
-    chromLengths.set_index("sequence", inplace=True)
+    chromLengths = get_chrom_lengths(build)
     if chrom in ["X", "x"] or chrom == "23":
         chrom = 23
         maxChromLength = chromLengths.loc["chrX", "length"]
@@ -333,8 +456,6 @@ def parse_region_text(regiontext, build):
 
 
 def fetch_snv(chrom, bp, ref, build):
-    variantid = "."
-
     if ref is None or ref == ".":
         ref = ""
 
@@ -346,40 +467,8 @@ def fetch_snv(chrom, bp, ref, build):
     chrom, startbp, endbp = parse_region_text(regiontxt, build)
     chrom = str(chrom).replace("chr", "").replace("23", "X")
 
-    # Load dbSNP151 SNP names from region indicated
-    dbsnp_filepath = ""
-    if build.lower() in ["hg38", "grch38"]:
-        suffix = "b38"
-        dbsnp_filepath = os.path.join(
-            app.config["LF_DATA_FOLDER"], "dbSNP151", "GRCh38p7", "All_20180418.vcf.gz"
-        )
-    else:
-        suffix = "b37"
-        dbsnp_filepath = os.path.join(
-            app.config["LF_DATA_FOLDER"], "dbSNP151", "GRCh37p13", "All_20180423.vcf.gz"
-        )
-
     # Load variant info from dbSNP151
-    tbx = pysam.TabixFile(dbsnp_filepath)  # type: ignore
-    varlist = []
-    for row in tbx.fetch(str(chrom), bp - 1, bp):
-        rowlist = str(row).split("\t")
-        chromi = rowlist[0].replace("chr", "")
-        posi = rowlist[1]
-        refi = rowlist[3]
-        alti = rowlist[4]
-        varstr = "_".join([chromi, posi, refi, alti, suffix])
-        varlist.append(varstr)
-
-    # Check if there is a match to an SNV with the provided info
-    if len(varlist) == 1:
-        variantid = varstr
-    elif len(varlist) > 1 and ref != "":
-        for v in varlist:
-            if v.split("_")[2] == ref:
-                variantid = v
-                break
-    return variantid
+    return resolve_snvs(build, chrom, [bp], [ref])[0]
 
 
 def x_to_23(ls):
@@ -439,7 +528,7 @@ def getLeadSNPindex(leadsnpname, summaryStats, snpcol, pcol):
     return lead_snp_position_index
 
 
-def clean_snps(variantlist, regiontext, build):
+def clean_snps(variantlist, regiontext, build, std_varlist=None):
     """
     Parameters
     ----------
@@ -449,6 +538,8 @@ def clean_snps(variantlist, regiontext, build):
         the region of interest in chr:start-end format
     build : str
         build.lower() in ['hg19','hg38', 'grch37', 'grch38'] must be true
+    std_varlist : list, optional
+        output of standardize_snps for the same variantlist, if already computed
 
     Returns
     -------
@@ -461,7 +552,8 @@ def clean_snps(variantlist, regiontext, build):
     variantlist = [
         asnp.split(";")[0].replace(":", "_").replace(".", "") for asnp in variantlist
     ]  # cleaning up the SNP names a bit
-    std_varlist = standardize_snps(variantlist, regiontext, build)
+    if std_varlist is None:
+        std_varlist = standardize_snps(variantlist, regiontext, build)
     final_varlist = [
         e if (e.startswith("rs") and std_varlist[i] != ".") else std_varlist[i]
         for i, e in enumerate(variantlist)
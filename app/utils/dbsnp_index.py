@@ -0,0 +1,281 @@
+"""
+Memory-mapped index of a dbSNP VCF, for looking up variants by rsID and by position.
+
+Build it once per dbSNP file, next to the file (as <file>.index/)::
+
+    python -m app.utils.dbsnp_index data/dbSNP151/GRCh38p7/All_20180418.vcf.gz
+
+The index is a directory of .npy arrays over the VCF records, in file order
+(which tabix requires to be sorted by chromosome and position):
+
+- locus: chromosome code << 32 | position of each record (int64)
+- rsid_sorted / rsid_order: rs numbers of the records, sorted, and the record each belongs to
+- allele_offsets / alleles: "REF\\tALT" of each record, as offsets into one byte array
+
+Lookups are binary searches over the memory-mapped arrays, so resolving a
+batch of rsIDs reads a few pages per rsID however dense the region is.
+Building the rsID order needs memory for the sort (about 12 bytes per record).
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+from functools import lru_cache
+from typing import Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+INDEX_SUFFIX = ".index"
+CHROM_CODES = {
+    **{str(i): i for i in range(1, 23)},
+    "X": 23,
+    "Y": 24,
+    "M": 25,
+    "MT": 25,
+}
+CHROM_NAMES = {
+    **{i: str(i) for i in range(1, 23)},
+    23: "X",
+    24: "Y",
+    25: "MT",
+}
+
+
+class DbSNPRecord(NamedTuple):
+    chrom: str
+    pos: int
+    ref: str
+    alt: str
+
+    def overlaps(self, start: int, end: int) -> bool:
+        """
+        Return whether the record's REF overlaps the 0-based, half-open region start-end,
+        as for `pysam.TabixFile.fetch(chrom, start, end)`.
+        """
+        return self.pos - 1 < end and self.pos - 1 + len(self.ref) > start
+
+
+# rs numbers are stored as uint32
+MAX_RS_NUMBER = int(np.iinfo(np.uint32).max)
+
+
+def _rs_number(rsid: str) -> int:
+    """
+    Return the number of an rsID like "rs123", or 0 (never a valid rs number) if it is not one
+    or is too large to be in an index.
+    """
+    if rsid.startswith("rs") and rsid[2:].isdigit():
+        number = int(rsid[2:])
+        if number <= MAX_RS_NUMBER:
+            return number
+    return 0
+
+
+class DbSNPIndex:
+    """
+    Read-only view of a dbSNP index directory written by `build_dbsnp_index`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.max_ref_length: int = self.meta["max_ref_length"]
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in ["locus", "rsid_sorted", "rsid_order", "allele_offsets", "alleles"]
+        }
+        self.locus = arrays["locus"]
+        self.rsid_sorted = arrays["rsid_sorted"]
+        self.rsid_order = arrays["rsid_order"]
+        self.allele_offsets = arrays["allele_offsets"]
+        self.alleles = arrays["alleles"]
+
+    def __len__(self) -> int:
+        return len(self.locus)
+
+    def record(self, row: int) -> DbSNPRecord:
+        locus = int(self.locus[row])
+        alleles = bytes(
+            self.alleles[self.allele_offsets[row] : self.allele_offsets[row + 1]]
+        ).decode()
+        ref, alt = alleles.split("\t")
+        return DbSNPRecord(CHROM_NAMES[locus >> 32], locus & 0xFFFFFFFF, ref, alt)
+
+    def lookup_rsids(self, rsids: Sequence[str]) -> List[List[DbSNPRecord]]:
+        """
+        Return the records of each rsID (eg. "rs123"), in file order. Unknown or malformed rsIDs have none.
+        """
+        # Of the index's dtype, so that searchsorted does not convert the whole memory-mapped array
+        numbers = np.array(
+            [_rs_number(rsid) for rsid in rsids], dtype=self.rsid_sorted.dtype
+        )
+        # Search in sorted order, so that consecutive searches touch nearby pages
+        order = np.argsort(numbers, kind="stable")
+        starts = np.empty(len(numbers), dtype=np.int64)
+        ends = np.empty(len(numbers), dtype=np.int64)
+        starts[order] = np.searchsorted(self.rsid_sorted, numbers[order], side="left")
+        ends[order] = np.searchsorted(self.rsid_sorted, numbers[order], side="right")
+
+        results = []
+        for number, start, end in zip(numbers, starts, ends):
+            rows = np.sort(self.rsid_order[start:end]) if number > 0 else []
+            results.append([self.record(int(row)) for row in rows])
+        return results
+
+    def fetch(self, chrom: str, start: int, end: int) -> List[DbSNPRecord]:
+        """
+        Return the records overlapping the 0-based, half-open region start-end of chrom,
+        like `pysam.TabixFile.fetch(chrom, start, end)`.
+        """
+        code = CHROM_CODES.get(str(chrom).replace("chr", "").upper())
+        if code is None:
+            return []
+        # Records starting up to max_ref_length before the region may still overlap it
+        first_pos = max(start - self.max_ref_length + 1, 0) + 1
+        lo = np.searchsorted(self.locus, (code << 32) | first_pos, side="left")
+        hi = np.searchsorted(self.locus, (code << 32) | end, side="right")
+        records = (self.record(row) for row in range(int(lo), int(hi)))
+        return [record for record in records if record.overlaps(start, end)]
+
+
+def load_dbsnp_index(vcf_path: str) -> Optional[DbSNPIndex]:
+    """
+    Return the index built for a dbSNP VCF, or None if it has not been built (yet). Opened once per process.
+    """
+    index_path = vcf_path + INDEX_SUFFIX
+    if not os.path.exists(os.path.join(index_path, "meta.json")):
+        return None
+    return _open_dbsnp_index(index_path)
+
+
+@lru_cache(maxsize=None)
+def _open_dbsnp_index(index_path: str) -> DbSNPIndex:
+    return DbSNPIndex(index_path)
+
+
+def _read_vcf_chunks(vcf_path: str, chunksize: int) -> Iterable[pd.DataFrame]:
+    return pd.read_csv(
+        vcf_path,
+        sep="\t",
+        comment="#",
+        header=None,
+        usecols=[0, 1, 2, 3, 4],
+        names=["chrom", "pos", "id", "ref", "alt"],
+        dtype={"chrom": str, "pos": np.int64, "id": str, "ref": str, "alt": str},
+        keep_default_na=False,
+        chunksize=chunksize,
+    )
+
+
+def build_dbsnp_index(
+    vcf_path: str, index_path: Optional[str] = None, chunksize: int = 1_000_000
+) -> int:
+    """
+    Build the index of a (possibly gzipped) dbSNP VCF at index_path (default <vcf_path>.index).
+
+    Records on contigs other than 1-22, X, Y and MT are skipped. Returns the number of records indexed.
+    """
+    index_path = index_path or vcf_path + INDEX_SUFFIX
+    parent = os.path.dirname(os.path.abspath(index_path))
+    build_path = tempfile.mkdtemp(dir=parent, prefix=".dbsnp-index-")
+    raw = {
+        name: open(os.path.join(build_path, name), "wb")
+        for name in ["locus", "rsid", "allele_offsets", "alleles"]
+    }
+    raw["allele_offsets"].write(np.zeros(1, dtype=np.uint64).tobytes())
+    num_records = 0
+    num_allele_bytes = 0
+    max_ref_length = 0
+    last_locus = 0
+
+    try:
+        for chunk in _read_vcf_chunks(vcf_path, chunksize):
+            codes = chunk["chrom"].str.replace("chr", "", regex=False).map(CHROM_CODES)
+            chunk = chunk[codes.notna()]
+            codes = codes[codes.notna()].astype(np.int64)
+            if len(chunk) == 0:
+                continue
+
+            locus = (codes.to_numpy() << 32) | chunk["pos"].to_numpy(dtype=np.int64)
+            if locus[0] < last_locus or (np.diff(locus) < 0).any():
+                raise ValueError(
+                    f"{vcf_path} is not sorted by chromosome (1-22, X, Y, MT) and position"
+                )
+            last_locus = locus[-1]
+
+            ids = chunk["id"].str.split(";").str[0]
+            rsids = pd.to_numeric(
+                ids.where(ids.str.startswith("rs")).str[2:], errors="coerce"
+            ).fillna(0)
+            if rsids.max() > MAX_RS_NUMBER:
+                raise ValueError(f"rs numbers in {vcf_path} do not fit in 32 bits")
+
+            alleles = (chunk["ref"] + "\t" + chunk["alt"]).to_list()
+            lengths = np.fromiter(map(len, alleles), dtype=np.uint64, count=len(alleles))
+            offsets = num_allele_bytes + np.cumsum(lengths, dtype=np.uint64)
+
+            raw["locus"].write(locus.tobytes())
+            raw["rsid"].write(rsids.to_numpy(dtype=np.uint32).tobytes())
+            raw["allele_offsets"].write(offsets.tobytes())
+            raw["alleles"].write("".join(alleles).encode("ascii"))
+
+            num_records += len(chunk)
+            num_allele_bytes = int(offsets[-1])
+            max_ref_length = max(max_ref_length, int(chunk["ref"].str.len().max()))
+
+        for f in raw.values():
+            f.close()
+
+        def raw_array(name: str, dtype) -> np.ndarray:
+            path = os.path.join(build_path, name)
+            if os.path.getsize(path) == 0:
+                return np.zeros(0, dtype=dtype)
+            return np.memmap(path, dtype=dtype, mode="r")
+
+        np.save(os.path.join(build_path, "locus.npy"), raw_array("locus", np.int64))
+        np.save(
+            os.path.join(build_path, "allele_offsets.npy"),
+            raw_array("allele_offsets", np.uint64),
+        )
+        np.save(os.path.join(build_path, "alleles.npy"), raw_array("alleles", np.uint8))
+        rsid = np.array(raw_array("rsid", np.uint32))
+        rsid_order = np.argsort(rsid, kind="stable").astype(np.uint32)
+        np.save(os.path.join(build_path, "rsid_order.npy"), rsid_order)
+        np.save(os.path.join(build_path, "rsid_sorted.npy"), rsid[rsid_order])
+        del rsid, rsid_order
+
+        for name in raw:
+            os.remove(os.path.join(build_path, name))
+        with open(os.path.join(build_path, "meta.json"), "w") as f:
+            json.dump(
+                {
+                    "source": os.path.basename(vcf_path),
+                    "records": num_records,
+                    "max_ref_length": max_ref_length,
+                },
+                f,
+            )
+
+        if os.path.exists(index_path):
+            shutil.rmtree(index_path)
+        os.replace(build_path, index_path)
+    finally:
+        for f in raw.values():
+            f.close()
+        if os.path.exists(build_path):
+            shutil.rmtree(build_path)
+    return num_records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("vcf_paths", nargs="+", help="dbSNP VCF files to index")
+    parser.add_argument("--chunksize", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    for path in args.vcf_paths:
+        print(f"{path}: indexed {build_dbsnp_index(path, chunksize=args.chunksize)} records")
@@ -0,0 +1,185 @@
+"""
+Caches of GTEx eQTL query results, keyed by (version, tissue, ENSG prefix).
+
+`EQTLCache` lives for one colocalization job so that each tissue/gene pair is
+fetched from the GTEx database once, even though both the GTEx reporting and
+the Simple Sum stages need it. It can be backed by a `SharedEQTLCache`, which
+keeps results in the flask-caching backend so that hot pairs are reused across
+jobs.
+"""
+
+import fcntl
+import threading
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+from typing import Iterator, Optional, Sequence, Tuple
+
+import pandas as pd
+from flask_caching import Cache
+
+from app.utils.gtex_db.base import GTExDatabase, restrict_eqtl_data
+
+EQTLKey = Tuple[str, str, str]
+
+
+@dataclass
+class EQTLCacheEntry:
+    """
+    Result of one `get_eqtl_data` call, with the columns and window it was fetched with.
+    """
+
+    data: pd.DataFrame
+    columns: Optional[Sequence[str]] = None
+    start: Optional[int] = None
+    end: Optional[int] = None
+
+    def covers(
+        self,
+        columns: Optional[Sequence[str]] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+    ) -> bool:
+        """
+        Return whether a query with these arguments can be answered from this entry.
+        """
+        if self.columns is not None:
+            if columns is None or not set(columns) <= {"variant_id", *self.columns}:
+                return False
+        if self.start is not None and (start is None or start < self.start):
+            return False
+        if self.end is not None and (end is None or end > self.end):
+            return False
+        return True
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.data.memory_usage(index=True, deep=True).sum())
+
+
+class SharedEQTLCache:
+    """
+    Cross-job eQTL cache stored in the flask-caching backend.
+
+    The size of every entry is recorded in a ledger that is also kept in the backend,
+    in least recently used order. All processes sharing the backend therefore keep the
+    entries under `max_bytes` together, by evicting the least recently used ones. Ledger
+    updates are serialized by a lock file (`lock_path`, eg. in the FileSystemCache
+    directory), or only between threads if there is none. Entries the backend drops
+    itself (eg. past the FileSystemCache threshold or timeout) stay in the ledger until
+    they are next looked up or evicted, so they can only make the cache hold less.
+    """
+
+    LEDGER_KEY = "eqtl-ledger"
+
+    def __init__(self, cache: Cache, max_bytes: int, lock_path: Optional[str] = None):
+        self.cache = cache
+        self.max_bytes = max_bytes
+        self.lock_path = lock_path
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(key: EQTLKey) -> str:
+        return "eqtl-" + "-".join(key)
+
+    @contextmanager
+    def _ledger(self) -> Iterator["dict[str, int]"]:
+        """
+        Lock the ledger, and yield it (cache key -> bytes, least recently used first) to
+        be updated in place. It is written back to the backend afterwards.
+        """
+        with self._lock, ExitStack() as stack:
+            if self.lock_path is not None:
+                lock_file = stack.enter_context(open(self.lock_path, "a"))
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            ledger = self.cache.get(self.LEDGER_KEY) or {}
+            yield ledger
+            self.cache.set(self.LEDGER_KEY, ledger, timeout=0)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum((self.cache.get(self.LEDGER_KEY) or {}).values())
+
+    def get(self, key: EQTLKey) -> Optional[EQTLCacheEntry]:
+        cache_key = self._cache_key(key)
+        entry = self.cache.get(cache_key)
+        with self._ledger() as ledger:
+            nbytes = ledger.pop(cache_key, None)
+            if entry is not None and nbytes is not None:
+                ledger[cache_key] = nbytes
+        return entry
+
+    def set(self, key: EQTLKey, entry: EQTLCacheEntry):
+        nbytes = entry.nbytes
+        if nbytes > self.max_bytes:
+            return
+        cache_key = self._cache_key(key)
+        with self._ledger() as ledger:
+            ledger.pop(cache_key, None)
+            while ledger and sum(ledger.values()) + nbytes > self.max_bytes:
+                evicted_key = next(iter(ledger))
+                del ledger[evicted_key]
+                self.cache.delete(evicted_key)
+            if self.cache.set(cache_key, entry):
+                ledger[cache_key] = nbytes
+
+
+class EQTLCache:
+    """
+    Per-job cache of `GTExDatabase.get_eqtl_data` results.
+
+    A cached result is reused for any later query whose columns and position
+    window it covers, eg. the Simple Sum stage's pval-only query of the Simple
+    Sum region reuses the full query of the plot region made for reporting.
+
+    Safe to use from the threads of a `GTExFetcher`; concurrent misses on the
+    same key may both query the database.
+    """
+
+    def __init__(self, shared: Optional[SharedEQTLCache] = None):
+        self.shared = shared
+        self._entries: "dict[EQTLKey, EQTLCacheEntry]" = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_eqtl_data(
+        self,
+        gtex_db: GTExDatabase,
+        version: str,
+        tissue: str,
+        ensg_id_prefix: str,
+        columns: Optional[Sequence[str]] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """
+        Return `gtex_db.get_eqtl_data(...)`, from the cache if possible.
+        """
+        key = (version.upper(), tissue, ensg_id_prefix)
+        entry = self._entries.get(key)
+        if entry is None and self.shared is not None:
+            entry = self.shared.get(key)
+            if entry is not None:
+                self._entries[key] = entry
+
+        if entry is not None and entry.covers(columns, start, end):
+            with self._lock:
+                self.hits += 1
+            return restrict_eqtl_data(entry.data, columns, start, end).copy()
+
+        with self._lock:
+            self.misses += 1
+        data = gtex_db.get_eqtl_data(
+            version, tissue, ensg_id_prefix, columns=columns, start=start, end=end
+        )
+        entry = EQTLCacheEntry(data, columns, start, end)
+        self._entries[key] = entry
+        if self.shared is not None:
+            self.shared.set(key, entry)
+        return data.copy()
+
+    def stats(self) -> dict:
+        """
+        Return hit/miss counts for this job.
+        """
+        return {"hits": self.hits, "misses": self.misses}
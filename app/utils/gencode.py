@@ -3,27 +3,232 @@ Utility functions for gene name and gencode lookups using local files
 """
 
 import os
-from typing import List
+import tempfile
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
 from app.utils import parse_region_text
+from app.utils.errors import InvalidUsage
 
 # /app/utils/gencode.py -> /data/
 DATA_FOLDER = os.path.abspath(
     os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../data")
 )
-collapsed_genes_df_hg19 = pd.read_csv(
-    os.path.join(DATA_FOLDER, "collapsed_gencode_v19_hg19.gz"),
-    compression="gzip",
-    sep="\t",
-    encoding="utf-8",
-)
-collapsed_genes_df_hg38 = pd.read_csv(
-    os.path.join(DATA_FOLDER, "collapsed_gencode_v26_hg38.gz"),
-    compression="gzip",
-    sep="\t",
-    encoding="utf-8",
-)
+GENCODE_FILES = {
+    "hg19": "collapsed_gencode_v19_hg19.gz",
+    "hg38": "collapsed_gencode_v26_hg38.gz",
+}
+# Feather copies of the GENCODE files, written the first time each is parsed
+GENCODE_CACHE_FOLDER = os.path.join(DATA_FOLDER, "cache", "gencode")
+
+
+def _gencode_build(build: str) -> str:
+    if build.lower() in ["hg19", "grch37"]:
+        return "hg19"
+    elif build.lower() in ["hg38", "grch38"]:
+        return "hg38"
+    raise InvalidUsage(f"Unrecognized build: {build}")
+
+
+def read_genes_df(path: str, cache_folder: Optional[str] = None) -> pd.DataFrame:
+    """
+    Read a collapsed GENCODE file (gzipped TSV).
+
+    If cache_folder is given, the table is read from a Feather copy there when
+    the copy is newer than the file, and the copy is (re)written otherwise.
+    Failing to write the copy is not an error.
+    """
+    if cache_folder is None:
+        return pd.read_csv(path, compression="gzip", sep="\t", encoding="utf-8")
+
+    name = os.path.basename(path)
+    feather_path = os.path.join(cache_folder, name.replace(".gz", "") + ".feather")
+    try:
+        if os.path.getmtime(feather_path) >= os.path.getmtime(path):
+            return pd.read_feather(feather_path)
+    except (OSError, ValueError):
+        pass
+
+    genes_df = read_genes_df(path)
+    try:
+        os.makedirs(cache_folder, exist_ok=True)
+        # Write then rename, so concurrent workers never read a partial copy
+        with tempfile.NamedTemporaryFile(
+            dir=cache_folder, prefix=name, suffix=".tmp", delete=False
+        ) as f:
+            tmp_path = f.name
+        try:
+            genes_df.to_feather(tmp_path)
+            os.replace(tmp_path, feather_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    except OSError:
+        pass
+    return genes_df
+
+
+def get_genes_df(build: str) -> pd.DataFrame:
+    """
+    Return the collapsed GENCODE table for hg19/GRCh37 or hg38/GRCh38, loaded on first use.
+
+    The table is shared by every caller in the process, so it must not be modified.
+    """
+    return _genes_df(_gencode_build(build))
+
+
+@lru_cache(maxsize=None)
+def _genes_df(build: str) -> pd.DataFrame:
+    return read_genes_df(
+        os.path.join(DATA_FOLDER, GENCODE_FILES[build]), GENCODE_CACHE_FOLDER
+    )
+
+
+class GeneNameIndex:
+    """
+    Bidirectional HUGO <-> ENSG gene name lookup for one GENCODE build.
+
+    ENSG names can be looked up with or without their version suffix.
+    Where a name occurs more than once, the first occurrence wins.
+    """
+
+    def __init__(self, genes_df: pd.DataFrame):
+        self.names: List[str] = genes_df["name"].tolist()
+        self.ensg_names: List[str] = genes_df["ENSG_name"].tolist()
+        self._ensg_by_name: Dict[str, str] = {}
+        self._name_by_ensg: Dict[str, str] = {}
+        self._ensg_by_prefix: Dict[str, str] = {}
+        for name, ensg_name in zip(self.names, self.ensg_names):
+            self._ensg_by_name.setdefault(name, ensg_name)
+            self._name_by_ensg.setdefault(ensg_name, name)
+            self._ensg_by_prefix.setdefault(ensg_name.split(".")[0], ensg_name)
+
+    def ensg_name(self, gene: str) -> Optional[str]:
+        """
+        Return the versioned ENSG name for a HUGO name or (possibly unversioned) ENSG name, or None if unknown.
+        """
+        if gene in self._name_by_ensg:
+            return gene
+        if gene in self._ensg_by_name:
+            return self._ensg_by_name[gene]
+        return self._ensg_by_prefix.get(gene)
+
+    def hugo_name(self, gene: str) -> Optional[str]:
+        """
+        Return the HUGO name for a HUGO name or (possibly unversioned) ENSG name, or None if unknown.
+        """
+        if gene in self._ensg_by_name:
+            return gene
+        ensg_name = self.ensg_name(gene)
+        return None if ensg_name is None else self._name_by_ensg[ensg_name]
+
+
+def get_gene_name_index(build: str) -> GeneNameIndex:
+    """
+    Return the gene name index for hg19/GRCh37 or hg38/GRCh38, built on first use.
+    """
+    return _gene_name_index(_gencode_build(build))
+
+
+@lru_cache(maxsize=None)
+def _gene_name_index(build: str) -> GeneNameIndex:
+    return GeneNameIndex(_genes_df(build))
+
+
+class GeneIntervalIndex:
+    """
+    Per-chromosome index of GENCODE gene spans for region overlap queries.
+
+    Genes on each chromosome are sorted by txStart alongside a running maximum
+    of txEnd, so the genes overlapping a region are found with two binary
+    searches plus a scan of the candidates between them. Exon coordinates are
+    split into ints once, when the index is built.
+
+    Query results are in the order of the GENCODE file, like filtering the
+    DataFrame directly.
+    """
+
+    def __init__(self, genes_df: pd.DataFrame):
+        self.names: List[str] = genes_df["name"].tolist()
+        self.ensg_names: List[str] = genes_df["ENSG_name"].tolist()
+        self.tx_starts: List[int] = genes_df["txStart"].tolist()
+        self.tx_ends: List[int] = genes_df["txEnd"].tolist()
+        self.exon_starts: List[List[int]] = [
+            [int(bp) for bp in exons.split(",")] for exons in genes_df["exonStarts"]
+        ]
+        self.exon_ends: List[List[int]] = [
+            [int(bp) for bp in exons.split(",")] for exons in genes_df["exonEnds"]
+        ]
+
+        # chrom -> (rows sorted by txStart, txStart, running max of txEnd, txEnd)
+        self._chroms: Dict[str, Tuple[np.ndarray, ...]] = {}
+        tx_starts = genes_df["txStart"].to_numpy()
+        tx_ends = genes_df["txEnd"].to_numpy()
+        for chrom, rows in genes_df.groupby("chrom", sort=False).indices.items():
+            rows = rows[np.argsort(tx_starts[rows], kind="stable")]
+            ends = tx_ends[rows]
+            self._chroms[chrom] = (
+                rows,
+                tx_starts[rows],
+                np.maximum.accumulate(ends),
+                ends,
+            )
+
+    @staticmethod
+    def _chrom_name(chrom: Union[int, str]) -> str:
+        chrom = str(chrom)
+        if chrom.startswith("chr"):
+            return chrom
+        return "chr" + chrom.replace("23", "X")
+
+    def overlapping(
+        self, chrom: Union[int, str], startbp: int, endbp: int
+    ) -> np.ndarray:
+        """
+        Return the rows (in GENCODE file order) of genes overlapping startbp-endbp on chrom.
+
+        chrom may be a number (23 for X) or a name like "chrX".
+        """
+        try:
+            rows, starts, max_ends, ends = self._chroms[self._chrom_name(chrom)]
+        except KeyError:
+            return np.array([], dtype=np.intp)
+        # Genes before `first` end before startbp; genes from `last` start after endbp
+        first = np.searchsorted(max_ends, startbp, side="left")
+        last = np.searchsorted(starts, endbp, side="right")
+        candidates = slice(first, max(first, last))
+        return np.sort(rows[candidates][ends[candidates] >= startbp])
+
+    def genes_data(
+        self, chrom: Union[int, str], startbp: int, endbp: int
+    ) -> List[dict]:
+        """
+        Return the genes overlapping startbp-endbp on chrom in the format used to draw them.
+        """
+        return [
+            {
+                "name": self.names[row],
+                "txStart": self.tx_starts[row],
+                "txEnd": self.tx_ends[row],
+                "exonStarts": list(self.exon_starts[row]),
+                "exonEnds": list(self.exon_ends[row]),
+            }
+            for row in self.overlapping(chrom, startbp, endbp)
+        ]
+
+
+def get_gene_interval_index(build: str) -> GeneIntervalIndex:
+    """
+    Return the gene interval index for hg19/GRCh37 or hg38/GRCh38, built on first use.
+    """
+    return _gene_interval_index(_gencode_build(build))
+
+
+@lru_cache(maxsize=None)
+def _gene_interval_index(build: str) -> GeneIntervalIndex:
+    return GeneIntervalIndex(_genes_df(build))
 
 
 def get_genes_by_location(
@@ -32,28 +237,20 @@ def get_genes_by_location(
     """
     Given a build and a region, return a list of genes that overlap that region.
     """
-    collapsed_genes_df = collapsed_genes_df_hg19
-    if build.lower() == "hg38":
-        collapsed_genes_df = collapsed_genes_df_hg38
     regiontext = str(chrom) + ":" + str(startbp) + "-" + str(endbp)
     chrom, startbp, endbp = parse_region_text(regiontext, build)
-    genes_to_draw = collapsed_genes_df.loc[
-        (collapsed_genes_df["chrom"] == ("chr" + str(chrom).replace("23", "X")))
-        & (
-            (
-                (collapsed_genes_df["txStart"] >= startbp)
-                & (collapsed_genes_df["txStart"] <= endbp)
-            )
-            | (
-                (collapsed_genes_df["txEnd"] >= startbp)
-                & (collapsed_genes_df["txEnd"] <= endbp)
-            )
-            | (
-                (collapsed_genes_df["txStart"] <= startbp)
-                & (collapsed_genes_df["txEnd"] >= endbp)
-            )
-        )
-    ]
-    if gencode:
-        return list(genes_to_draw["ENSG_name"])
-    return list(genes_to_draw["name"])
+    index = get_gene_interval_index(build)
+    names = index.ensg_names if gencode else index.names
+    return [names[row] for row in index.overlapping(chrom, startbp, endbp)]
+
+
+def preload_gencode():
+    """
+    Load the GENCODE tables and build their indexes for every build.
+
+    Called before forking workers (eg. gunicorn --preload), so that workers
+    share them copy-on-write instead of each loading their own.
+    """
+    for build in GENCODE_FILES:
+        _gene_name_index(build)
+        _gene_interval_index(build)
@@ -1,96 +1,111 @@
+import numpy as np
 import pandas as pd
 from flask import current_app
 
 from app.utils.variants import get_variants_by_region
-from app.utils.gencode import collapsed_genes_df_hg19, collapsed_genes_df_hg38
+from app.utils.gencode import get_gene_name_index
 from app.utils.errors import InvalidUsage
+from app.utils.variant_index import VariantIndex
 
 
-def get_gtex(version, tissue, gene_id):
-    """Fetch the merged eQTL + variant DataFrame for a tissue/gene pair.
-
-    Returns a DataFrame with all eQTL columns plus rs_id, chr, pos, ref, alt.
-    Returns a single-row error DataFrame (column "error") when no eQTL data
-    exists for the gene/tissue combination.
-    """
-    if version.upper() == "V7":
+def _resolve_ensg_id_prefix(gtex_db, version, tissue, gene_id):
+    """Return the ENSG ID (without version suffix) of gene_id, checking that the tissue exists."""
+    if version == "V7":
         raise InvalidUsage(
             "Cannot standardize SNPs to hg19; GTEx V7 is no longer available."
         )
 
-    gtex_db = current_app.extensions["gtex_db"]
-    version = version.upper()
-    tissue = tissue.replace(" ", "_")
-
     if tissue not in gtex_db.list_tissues(version):
         raise InvalidUsage(f"Tissue {tissue} not found", status_code=410)
 
-    collapsed_genes_df = collapsed_genes_df_hg38
-
-    if gene_id.startswith("ENSG"):
-        if gene_id not in list(collapsed_genes_df["ENSG_name"]):
-            raise InvalidUsage(f"Gene name {gene_id} not found", status_code=410)
-        ensg_name = gene_id
-    elif gene_id in list(collapsed_genes_df["name"]):
-        i = list(collapsed_genes_df["name"]).index(gene_id)
-        ensg_name = list(collapsed_genes_df["ENSG_name"])[i]
-    else:
+    ensg_name = get_gene_name_index("hg38").ensg_name(gene_id)
+    if ensg_name is None:
         raise InvalidUsage(f"Gene name {gene_id} not found", status_code=410)
 
-    ensg_id_prefix = ensg_name.rsplit(".", 1)[0]
+    return ensg_name.rsplit(".", 1)[0]
 
-    result = gtex_db.get_eqtl_data(version, tissue, ensg_id_prefix)
+
+def get_gtex(version, tissue, gene_id, columns=None, start=None, end=None, cache=None):
+    """Fetch the merged eQTL + variant DataFrame for a tissue/gene pair.
+
+    Returns a DataFrame with all eQTL columns plus rs_id, chr, pos, ref, alt,
+    or only variant_id plus `columns` when given. `start`/`end` restrict the
+    result to eQTL variants in that position window (see GTExDatabase.get_eqtl_data).
+    If `cache` (an EQTLCache) is given, the query is answered from it when possible.
+    Returns a single-row error DataFrame (column "error") when no eQTL data
+    exists for the gene/tissue combination.
+    """
+    gtex_db = current_app.extensions["gtex_db"]
+    version = version.upper()
+    tissue = tissue.replace(" ", "_")
+    ensg_id_prefix = _resolve_ensg_id_prefix(gtex_db, version, tissue, gene_id)
+
+    if cache is not None:
+        result = cache.get_eqtl_data(
+            gtex_db, version, tissue, ensg_id_prefix, columns=columns, start=start, end=end
+        )
+    else:
+        result = gtex_db.get_eqtl_data(
+            version, tissue, ensg_id_prefix, columns=columns, start=start, end=end
+        )
     if result.empty:
         return pd.DataFrame([{"error": f"No eQTL data for {gene_id} in {tissue}"}])
     return result
 
 
-def get_gtex_data(version, tissue, gene, snp_list, raiseErrors=False) -> pd.DataFrame:
+def get_gtex_variants(version, tissue, gene_id, variants):
+    """Fetch the eQTL data of a tissue/gene pair for only the given rs IDs and/or variant IDs.
+
+    Returns the same columns as get_gtex, or an empty DataFrame when none of the
+    variants have eQTL data for the gene/tissue combination.
+    """
+    gtex_db = current_app.extensions["gtex_db"]
+    version = version.upper()
+    tissue = tissue.replace(" ", "_")
+    ensg_id_prefix = _resolve_ensg_id_prefix(gtex_db, version, tissue, gene_id)
+
+    return gtex_db.get_eqtl_variants(version, tissue, ensg_id_prefix, variants)
+
+
+def get_gtex_data(
+    version, tissue, gene, snp_list, raiseErrors=False, columns=None, cache=None
+) -> pd.DataFrame:
+    """Return the eQTL data for a tissue/gene pair, aligned row-by-row to snp_list.
+
+    snp_list may be a list of variant IDs or a prebuilt VariantIndex, which lets
+    callers fetching several tissue/gene pairs for the same SNPs share one index.
+
+    Only eQTLs within the positions spanned by snp_list are fetched, and only
+    `columns` (plus the variant ID column) if given, e.g. `["pval"]` for Simple Sum.
+    `cache` is an optional EQTLCache, see get_gtex.
+    """
     if version.upper() == "V7":
         raise InvalidUsage(
             "GTEx V7 is no longer available. Please use GTEx V8 or GTEx V10."
         )
     assert version.upper() in ["V8", "V10"]
 
-    rsids = True
-    rsid_snps = [x for x in snp_list if x.startswith("rs")]
-    b37_snps = [x for x in snp_list if x.endswith("_b37")]
-    b38_snps = [x for x in snp_list if x.endswith("_b38")]
-    if len(rsid_snps) > 0 and (len(b37_snps) > 0 or len(b38_snps) > 0):
-        raise InvalidUsage(
-            "There is a mix of rsid and other variant id formats; please use a consistent format"
-        )
-    elif len(rsid_snps) > 0:
-        rsids = True
-    elif len(b37_snps) or len(b38_snps) > 0:
-        rsids = False
-    else:
-        raise InvalidUsage(
-            "Variant naming format not supported; ensure all are rs ID's are formatted as chrom_pos_ref_alt_b37 eg. 1_205720483_G_A_b37"
-        )
+    snp_index = snp_list if isinstance(snp_list, VariantIndex) else VariantIndex(snp_list)
+    key_col = "rs_id" if snp_index.uses_rsids else "variant_id"
+
+    if columns is not None:
+        columns = [key_col] + [c for c in columns if c != key_col]
+    start, end = snp_index.position_range() or (None, None)
 
     hugo_gene, ensg_gene = gene_names(gene, "hg38")
-    response_df = get_gtex(version.upper(), tissue, gene)
+    response_df = get_gtex(
+        version.upper(), tissue, gene, columns=columns, start=start, end=end, cache=cache
+    )
+    if "error" in response_df.columns and start is not None:
+        # Nothing in the window; refetch the whole gene to tell "no overlap" from "no data"
+        response_df = get_gtex(version.upper(), tissue, gene, columns=columns, cache=cache)
 
     gtex_data = []
     if "error" not in response_df.columns:
         eqtl = response_df
-        if rsids:
-            snp_df = pd.DataFrame(snp_list, columns=["rs_id"])
-            idx2 = pd.Index(list(eqtl["rs_id"]))
-            eqtl = eqtl[~idx2.duplicated()]
-            gtex_data = (
-                snp_df.reset_index()
-                .merge(eqtl, on="rs_id", how="left", sort=False)
-                .sort_values("index")
-            )
-        else:
-            snp_df = pd.DataFrame(snp_list, columns=["variant_id"])
-            gtex_data = (
-                snp_df.reset_index()
-                .merge(eqtl, on="variant_id", how="left", sort=False)
-                .sort_values("index")
-            )
+        gtex_data = snp_index.align(eqtl.drop(columns=key_col), eqtl[key_col])
+        gtex_data.insert(0, key_col, snp_index.variant_ids)
+        gtex_data.insert(0, "index", np.arange(len(snp_index)))
     else:
         try:
             gtex_data = pd.DataFrame({})
@@ -160,17 +175,5 @@ def get_gtex_snp_matches(stdsnplist, regiontxt, build, gtex_version="V10"):
 
 def gene_names(genename, build):
     """Given either an ENSG or HUGO gene name, return (HUGO, ENSG) names."""
-    ensg_gene = genename
-    if build.lower() in ["hg19", "grch37"]:
-        collapsed_genes_df = collapsed_genes_df_hg19
-    elif build.lower() in ["hg38", "grch38"]:
-        collapsed_genes_df = collapsed_genes_df_hg38
-    if genename in list(collapsed_genes_df["name"]):
-        ensg_gene = collapsed_genes_df["ENSG_name"][
-            list(collapsed_genes_df["name"]).index(genename)
-        ]
-    if genename in list(collapsed_genes_df["ENSG_name"]):
-        genename = collapsed_genes_df["name"][
-            list(collapsed_genes_df["ENSG_name"]).index(genename)
-        ]
-    return genename, ensg_gene
+    index = get_gene_name_index(build)
+    return index.hugo_name(genename) or genename, index.ensg_name(genename) or genename
@@ -1,6 +1,26 @@
+import importlib
+
 from app.utils.gtex_db.base import GTExDatabase
-from app.utils.gtex_db.real import RealGTExDatabase
-from app.utils.gtex_db.null import NullGTExDatabase
-from app.utils.gtex_db.fake import FakeGTExDatabase
 
-__all__ = ["GTExDatabase", "RealGTExDatabase", "NullGTExDatabase", "FakeGTExDatabase"]
+# Backends are imported on first access, so that only the one in use is loaded
+# along with its dependencies (eg. Faker, pyarrow.dataset)
+_BACKEND_MODULES = {
+    "RealGTExDatabase": "app.utils.gtex_db.real",
+    "NullGTExDatabase": "app.utils.gtex_db.null",
+    "FakeGTExDatabase": "app.utils.gtex_db.fake",
+    "ParquetGTExDatabase": "app.utils.gtex_db.parquet",
+}
+
+__all__ = [
+    "GTExDatabase",
+    "RealGTExDatabase",
+    "NullGTExDatabase",
+    "FakeGTExDatabase",
+    "ParquetGTExDatabase",
+]
+
+
+def __getattr__(name: str):
+    if name in _BACKEND_MODULES:
+        return getattr(importlib.import_module(_BACKEND_MODULES[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -6,10 +6,59 @@ in-memory fake used in tests (FakeGTExDatabase) implement this interface.
 """
 
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import List, Optional, Sequence
 
 import pandas as pd
 
+# Columns of `get_eqtl_data` results that come from the variant table rather than the eQTL records
+VARIANT_COLUMNS = ["rs_id", "chr", "pos", "ref", "alt"]
+
+
+def eqtl_columns(available: Sequence[str], columns: Sequence[str]) -> List[str]:
+    """Return `variant_id` followed by the requested `columns` that are `available`, without duplicates."""
+    selected = ["variant_id"]
+    for column in columns:
+        if column in available and column not in selected:
+            selected.append(column)
+    return selected
+
+
+def restrict_eqtl_data(
+    eqtl_df: pd.DataFrame,
+    columns: Optional[Sequence[str]] = None,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+) -> pd.DataFrame:
+    """Apply the `columns` and `start`/`end` arguments of `get_eqtl_data` to a full eQTL DataFrame.
+
+    For backends that cannot restrict the query itself.
+    """
+    if eqtl_df.empty:
+        return eqtl_df
+    if start is not None or end is not None:
+        positions = eqtl_df["variant_id"].str.split("_").str[1].astype(int)
+        in_window = pd.Series(True, index=eqtl_df.index)
+        if start is not None:
+            in_window &= positions >= start
+        if end is not None:
+            in_window &= positions <= end
+        eqtl_df = eqtl_df.loc[in_window].reset_index(drop=True)
+        if eqtl_df.empty:
+            return pd.DataFrame()
+    if columns is not None:
+        eqtl_df = eqtl_df[eqtl_columns(eqtl_df.columns, columns)]
+    return eqtl_df
+
+
+def select_eqtl_variants(eqtl_df: pd.DataFrame, variants: Sequence[str]) -> pd.DataFrame:
+    """Return the rows of a `get_eqtl_data` result whose `variant_id` or `rs_id` is in `variants`."""
+    if eqtl_df.empty:
+        return eqtl_df
+    selected = eqtl_df["variant_id"].isin(variants) | eqtl_df["rs_id"].isin(variants)
+    if not selected.any():
+        return pd.DataFrame()
+    return eqtl_df.loc[selected].reset_index(drop=True)
+
 
 class GTExDatabase(ABC):
     """
@@ -35,7 +84,13 @@ class GTExDatabase(ABC):
 
     @abstractmethod
     def get_eqtl_data(
-        self, version: str, tissue: str, ensg_id_prefix: str
+        self,
+        version: str,
+        tissue: str,
+        ensg_id_prefix: str,
+        columns: Optional[Sequence[str]] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
     ) -> pd.DataFrame:
         """Return eQTL data for a gene in a tissue.
 
@@ -47,6 +102,14 @@ class GTExDatabase(ABC):
             Tissue name (spaces replaced with underscores). e.g. `"Artery_Aorta"`.
         ensg_id_prefix:
             ENSG gene ID **without** the version suffix, e.g. `"ENSG00000069275"`.
+        columns:
+            Columns to return (besides `variant_id`, which is always returned),
+            e.g. `["pval"]` for Simple Sum.  Default: all columns.  Backends
+            should only fetch what is needed, eg. skip the variant table when no
+            `VARIANT_COLUMNS` are requested.
+        start, end:
+            Only return eQTL variants with `start <= pos <= end` (inclusive).
+            Default: the whole gene.
 
         Returns
         -------
@@ -65,9 +128,36 @@ class GTExDatabase(ABC):
             * `sample_maf`   - minor allele frequency in the GTEx sample (float)
             * `ma_count`     - minor allele count (int)
 
+            When `columns` is given, only `variant_id` and those columns.
+
             Returns an **empty** DataFrame when no data is available for the
-            given gene/tissue combination.
+            given gene/tissue combination (or window).
+        """
+
+    def get_eqtl_variants(
+        self, version: str, tissue: str, ensg_id_prefix: str, variants: Sequence[str]
+    ) -> pd.DataFrame:
+        """Return eQTL data for a gene in a tissue, for only a few variants.
+
+        Parameters
+        ----------
+        version, tissue, ensg_id_prefix:
+            As for `get_eqtl_data`.
+        variants:
+            rs IDs and/or variant IDs (`"{chrom}_{pos}_{ref}_{alt}_b38"`).
+
+        Returns
+        -------
+        pd.DataFrame
+            The rows of `get_eqtl_data` for the given variants, omitting
+            variants without eQTL data.  Returns an **empty** DataFrame when
+            none of them have eQTL data.
+
+        The default implementation fetches the whole gene; backends that can
+        look up single variants should override it.
         """
+        eqtl_df = self.get_eqtl_data(version, tissue, ensg_id_prefix)
+        return select_eqtl_variants(eqtl_df, variants)
 
     @abstractmethod
     def get_variants_by_region(
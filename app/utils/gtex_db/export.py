@@ -0,0 +1,149 @@
+"""
+Export a GTExDatabase (normally the MongoDB-backed one) to the Parquet layout read by ParquetGTExDatabase.
+
+Usage::
+
+    python -m app.utils.gtex_db.export mongodb://localhost:27017 /path/to/gtex_parquet --versions V8 V10
+
+Variant tables are written one file per chromosome, sorted by position. eQTLs are
+written one file per tissue and chromosome, sorted by gene, already joined with
+the variant table as returned by `get_eqtl_data`.
+"""
+
+import argparse
+import os
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.utils.gtex_db.base import GTExDatabase
+from app.utils.gtex_db.parquet import eqtl_path, variant_table_path
+
+CHROMOSOMES = list(range(1, 25))  # 23 = X, 24 = Y
+MAX_POSITION = 10**10
+ROW_GROUP_SIZE = 64 * 1024
+
+
+class _PartitionWriter:
+    """Buffer DataFrames per chromosome and write them as row groups of one Parquet file each."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.writers: Dict[int, pq.ParquetWriter] = {}
+        self.buffers: Dict[int, List[pd.DataFrame]] = {}
+        self.num_rows = 0
+
+    def write(self, chrom: int, df: pd.DataFrame):
+        buffer = self.buffers.setdefault(chrom, [])
+        buffer.append(df)
+        if sum(len(frame) for frame in buffer) >= ROW_GROUP_SIZE:
+            self._flush(chrom)
+
+    def close(self):
+        for chrom in list(self.buffers):
+            self._flush(chrom)
+        for writer in self.writers.values():
+            writer.close()
+
+    def _flush(self, chrom: int):
+        frames = self.buffers.pop(chrom, [])
+        if len(frames) == 0:
+            return
+        df = pd.concat(frames, ignore_index=True)
+        writer = self.writers.get(chrom)
+        if writer is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            partition = os.path.join(self.directory, f"chrom={chrom}")
+            os.makedirs(partition, exist_ok=True)
+            writer = pq.ParquetWriter(os.path.join(partition, "part-0.parquet"), table.schema)
+            self.writers[chrom] = writer
+        else:
+            table = pa.Table.from_pandas(
+                df.reindex(columns=writer.schema.names),
+                schema=writer.schema,
+                preserve_index=False,
+            )
+        writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+        self.num_rows += len(df)
+
+
+def export_variant_table(db: GTExDatabase, root: str, version: str) -> int:
+    """
+    Write the variant table of `version`. Return the number of variants written.
+    """
+    writer = _PartitionWriter(variant_table_path(root, version))
+    for chrom in CHROMOSOMES:
+        variants = db.get_variants_by_region(0, MAX_POSITION, str(chrom), version)
+        if variants.empty:
+            continue
+        writer.write(chrom, variants.sort_values("pos", kind="stable"))
+    writer.close()
+    return writer.num_rows
+
+
+def export_tissue(
+    db: GTExDatabase, root: str, version: str, tissue: str, gene_ids: Iterable[str]
+) -> int:
+    """
+    Write the eQTLs of the given genes in one tissue. Return the number of eQTLs written.
+    """
+    writer = _PartitionWriter(eqtl_path(root, version, tissue))
+    for gene_id in sorted(gene_ids):
+        ensg_id_prefix = gene_id.split(".")[0]
+        eqtl_df = db.get_eqtl_data(version, tissue, ensg_id_prefix)
+        if eqtl_df.empty:
+            continue
+        eqtl_df.insert(0, "ensg_id_prefix", ensg_id_prefix)
+        eqtl_df.insert(0, "gene_id", gene_id)
+        writer.write(int(eqtl_df["chr"].iloc[0]), eqtl_df)
+    writer.close()
+    return writer.num_rows
+
+
+def export_gtex(
+    db: GTExDatabase,
+    root: str,
+    gene_ids: Dict[str, Dict[str, List[str]]],
+    versions: Sequence[str] = ("V8", "V10"),
+    tissues: Optional[Sequence[str]] = None,
+):
+    """
+    Export the variant tables and eQTLs of the given versions (and tissues, default all) to `root`.
+
+    `gene_ids` maps version -> tissue -> gene IDs to export.
+    """
+    for version in versions:
+        version = version.upper()
+        num_variants = export_variant_table(db, root, version)
+        print(f"[{version}] exported {num_variants} variants")
+        for tissue in tissues or db.list_tissues(version):
+            num_eqtls = export_tissue(
+                db, root, version, tissue, gene_ids[version].get(tissue, [])
+            )
+            print(f"[{version}] exported {num_eqtls} eQTLs for {tissue}")
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+
+    from app.utils.gtex_db.real import RealGTExDatabase
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("mongo_uri", help="MongoDB connection string")
+    parser.add_argument("root", help="Output directory (GTEX_PARQUET_PATH)")
+    parser.add_argument("--versions", nargs="+", default=["V8", "V10"])
+    parser.add_argument("--tissues", nargs="+", default=None)
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_uri)
+    real_db = RealGTExDatabase(client)
+    mongo_gene_ids = {
+        version.upper(): {
+            tissue: client[f"GTEx_{version.upper()}"][tissue].distinct("gene_id")
+            for tissue in (args.tissues or real_db.list_tissues(version))
+        }
+        for version in args.versions
+    }
+    export_gtex(real_db, args.root, mongo_gene_ids, args.versions, args.tissues)
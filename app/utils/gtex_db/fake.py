@@ -9,13 +9,13 @@ lookups in ``app/utils/gtex.py`` resolve correctly.
 """
 
 import random
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Sequence
 
 import pandas as pd
 from faker import Faker
 from pymongo import MongoClient, ASCENDING
 
-from app.utils.gtex_db.base import GTExDatabase
+from app.utils.gtex_db.base import GTExDatabase, restrict_eqtl_data
 
 
 GENES: Dict[str, Dict[str, Any]] = {
@@ -118,7 +118,13 @@ class FakeGTExDatabase(GTExDatabase):
         return sorted(self.genes.keys())
 
     def get_eqtl_data(
-        self, version: str, tissue: str, ensg_id_prefix: str
+        self,
+        version: str,
+        tissue: str,
+        ensg_id_prefix: str,
+        columns: Optional[Sequence[str]] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
     ) -> pd.DataFrame:
         gene_name = self._find_gene_by_ensg_prefix(ensg_id_prefix)
         if gene_name is None or tissue not in self._tissue_eqtls:
@@ -138,7 +144,9 @@ class FakeGTExDatabase(GTExDatabase):
                 for v in self._gene_variants[gene_name]
             ]
         )
-        return pd.merge(eqtl_df, variant_cols, on="variant_id")
+        return restrict_eqtl_data(
+            pd.merge(eqtl_df, variant_cols, on="variant_id"), columns, start, end
+        )
 
     def get_variants_by_region(
         self, start: int, end: int, chrom: str, version: str
@@ -177,8 +185,10 @@ class FakeGTExDatabase(GTExDatabase):
             coll.insert_many(self._variant_table_docs(version))
             if version == "V8":
                 coll.create_index([("chr", ASCENDING), ("variant_pos", ASCENDING)])
+                coll.create_index("rs_id_dbSNP151_GRCh38p7")
             else:
                 coll.create_index([("chr", ASCENDING), ("pos", ASCENDING)])
+                coll.create_index("rs_id_dbSNP155_GRCh38p13")
             coll.create_index("variant_id")
 
             for tissue in self.tissues:
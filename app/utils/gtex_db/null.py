@@ -5,7 +5,7 @@ All methods return empty results, allowing the app to start and serve non-GTEx
 functionality without a live database.
 """
 
-from typing import List, Optional
+from typing import List, Optional, Sequence
 
 import pandas as pd
 
@@ -22,7 +22,13 @@ class NullGTExDatabase(GTExDatabase):
         return []
 
     def get_eqtl_data(
-        self, version: str, tissue: str, ensg_id_prefix: str
+        self,
+        version: str,
+        tissue: str,
+        ensg_id_prefix: str,
+        columns: Optional[Sequence[str]] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
     ) -> pd.DataFrame:
         return pd.DataFrame()
 
@@ -0,0 +1,156 @@
+"""
+Parquet-backed implementation of GTExDatabase.
+
+Reads a local dataset materialized from the GTEx MongoDB databases by
+`app.utils.gtex_db.export`, laid out as::
+
+    {root}/GTEx_{version}/variant_table/chrom={chrom}/part-0.parquet
+    {root}/GTEx_{version}/eqtl/tissue={tissue}/chrom={chrom}/part-0.parquet
+
+eQTL files are sorted by gene and already joined with the variant table, so a
+gene lookup is a single filtered, memory-mapped scan of one tissue directory.
+"""
+
+import os
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+import pyarrow.dataset as ds
+from pyarrow import fs
+
+from app.utils.gtex_db.base import GTExDatabase, eqtl_columns
+
+PARTITION_COLUMNS = ["chrom", "tissue"]
+GENE_COLUMNS = ["gene_id", "ensg_id_prefix"]
+
+
+def version_path(root: str, version: str) -> str:
+    return os.path.join(root, f"GTEx_{version.upper()}")
+
+
+def variant_table_path(root: str, version: str) -> str:
+    return os.path.join(version_path(root, version), "variant_table")
+
+
+def eqtl_path(root: str, version: str, tissue: str) -> str:
+    return os.path.join(version_path(root, version), "eqtl", f"tissue={tissue}")
+
+
+class ParquetGTExDatabase(GTExDatabase):
+    """GTExDatabase backed by a local, partitioned Parquet dataset."""
+
+    def __init__(self, root: str) -> None:
+        if not os.path.isdir(root):
+            raise FileNotFoundError(f"GTEx Parquet dataset not found: {root}")
+        self._root = root
+        self._filesystem = fs.LocalFileSystem(use_mmap=True)
+        self._datasets: Dict[str, ds.Dataset] = {}
+
+    # ------------------------------------------------------------------
+
+    def list_tissues(self, version: str) -> List[str]:
+        self._check_version(version)
+        eqtl_root = os.path.join(version_path(self._root, version), "eqtl")
+        if not os.path.isdir(eqtl_root):
+            return []
+        return sorted(
+            name.split("=", 1)[1]
+            for name in os.listdir(eqtl_root)
+            if name.startswith("tissue=")
+        )
+
+    def get_eqtl_data(
+        self,
+        version: str,
+        tissue: str,
+        ensg_id_prefix: str,
+        columns: Optional[Sequence[str]] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+    ) -> pd.DataFrame:
+        self._check_version(version)
+        dataset = self._dataset(eqtl_path(self._root, version, tissue))
+        if dataset is None:
+            return pd.DataFrame()
+
+        condition = ds.field("ensg_id_prefix") == ensg_id_prefix
+        if start is not None:
+            condition &= ds.field("pos") >= start
+        if end is not None:
+            condition &= ds.field("pos") <= end
+        return self._to_pandas(
+            dataset, condition, exclude=GENE_COLUMNS, columns=columns
+        )
+
+    def get_eqtl_variants(
+        self, version: str, tissue: str, ensg_id_prefix: str, variants: Sequence[str]
+    ) -> pd.DataFrame:
+        self._check_version(version)
+        dataset = self._dataset(eqtl_path(self._root, version, tissue))
+        if dataset is None:
+            return pd.DataFrame()
+
+        variants = list(variants)
+        return self._to_pandas(
+            dataset,
+            (ds.field("ensg_id_prefix") == ensg_id_prefix)
+            & (
+                ds.field("variant_id").isin(variants)
+                | ds.field("rs_id").isin(variants)
+            ),
+            exclude=GENE_COLUMNS,
+        )
+
+    def get_variants_by_region(
+        self, start: int, end: int, chrom: str, version: str
+    ) -> pd.DataFrame:
+        self._check_version(version)
+        dataset = self._dataset(variant_table_path(self._root, version))
+        if dataset is None:
+            return pd.DataFrame()
+
+        return self._to_pandas(
+            dataset,
+            (ds.field("chrom") == int(chrom))
+            & (ds.field("pos") >= start)
+            & (ds.field("pos") <= end),
+        )
+
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _check_version(version: str) -> None:
+        if version.upper() not in ("V8", "V10"):
+            raise ValueError(f"Invalid GTEx version: {version}")
+
+    def _dataset(self, path: str):
+        """Open (once) the hive-partitioned dataset at `path`, or return None if it does not exist."""
+        if path not in self._datasets:
+            if not os.path.isdir(path):
+                return None
+            self._datasets[path] = ds.dataset(
+                path,
+                format="parquet",
+                partitioning="hive",
+                filesystem=self._filesystem,
+            )
+        return self._datasets[path]
+
+    @staticmethod
+    def _to_pandas(
+        dataset: ds.Dataset,
+        filter,
+        exclude: Sequence[str] = (),
+        columns: Optional[Sequence[str]] = None,
+    ) -> pd.DataFrame:
+        available = [
+            name
+            for name in dataset.schema.names
+            if name not in PARTITION_COLUMNS and name not in exclude
+        ]
+        if columns is not None:
+            available = eqtl_columns(available, columns)
+        table = dataset.to_table(columns=available, filter=filter)
+        if table.num_rows == 0:
+            return pd.DataFrame()
+        return table.to_pandas(split_blocks=True, self_destruct=True)
@@ -6,12 +6,18 @@ collection; each document holds all eQTL variants for one gene.  A separate
 `variant_table` collection maps variant IDs to rs IDs and positional info.
 """
 
-from typing import List
+from typing import Any, List, Optional, Sequence
 
 import pandas as pd
 from pymongo import MongoClient
 
-from app.utils.gtex_db.base import GTExDatabase
+from app.utils.gtex_db.base import VARIANT_COLUMNS, GTExDatabase, eqtl_columns
+
+# Variant table fields holding the rs ID and position, per GTEx version
+_VARIANT_TABLE_FIELDS = {
+    "V8": ("rs_id_dbSNP151_GRCh38p7", "variant_pos"),
+    "V10": ("rs_id_dbSNP155_GRCh38p13", "pos"),
+}
 
 
 class RealGTExDatabase(GTExDatabase):
@@ -29,7 +35,13 @@ class RealGTExDatabase(GTExDatabase):
         return sorted(n for n in db.list_collection_names() if n != "variant_table")
 
     def get_eqtl_data(
-        self, version: str, tissue: str, ensg_id_prefix: str
+        self,
+        version: str,
+        tissue: str,
+        ensg_id_prefix: str,
+        columns: Optional[Sequence[str]] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
     ) -> pd.DataFrame:
         version = version.upper()
         if version not in ("V8", "V10"):
@@ -37,8 +49,33 @@ class RealGTExDatabase(GTExDatabase):
         db = self._client[f"GTEx_{version}"]
         collection = db[tissue]
 
+        # Filter and project eqtl_variants server-side so only what was asked for is transferred
+        eqtl_variants: Any = "$eqtl_variants"
+        window = _window_condition(start, end)
+        if window is not None:
+            eqtl_variants = {
+                "$filter": {"input": eqtl_variants, "as": "v", "cond": window}
+            }
+        if columns is not None:
+            eqtl_fields = ["variant_id"] + [
+                c for c in columns if c != "variant_id" and c not in VARIANT_COLUMNS
+            ]
+            eqtl_variants = {
+                "$map": {
+                    "input": eqtl_variants,
+                    "as": "v",
+                    "in": {field: f"$$v.{field}" for field in eqtl_fields},
+                }
+            }
+
         results = list(
-            collection.find({"gene_id": {"$regex": f"^{ensg_id_prefix}.*"}})
+            collection.aggregate(
+                [
+                    {"$match": {"gene_id": {"$regex": f"^{ensg_id_prefix}.*"}}},
+                    {"$limit": 1},
+                    {"$project": {"_id": 0, "eqtl_variants": eqtl_variants}},
+                ]
+            )
         )
         if not results:
             return pd.DataFrame()
@@ -48,38 +85,146 @@ class RealGTExDatabase(GTExDatabase):
             return pd.DataFrame()
 
         eqtl_df = pd.DataFrame(eqtl_variants)
+        if columns is not None and not any(c in VARIANT_COLUMNS for c in columns):
+            return eqtl_df[eqtl_columns(eqtl_df.columns, columns)]
 
         chrom = eqtl_df["variant_id"].iloc[0].split("_")[0].replace("X", "23")
         positions = eqtl_df["variant_id"].str.split("_").str[1].astype(int)
-        variants_df = self.get_variants_by_region(
-            int(positions.min()), int(positions.max()), chrom, version
+        variants_df = self._find_variants(
+            int(positions.min()),
+            int(positions.max()),
+            chrom,
+            version,
+            None if columns is None else [c for c in columns if c in VARIANT_COLUMNS],
         )
 
-        return pd.merge(eqtl_df, variants_df, on="variant_id")
+        eqtl_df = pd.merge(eqtl_df, variants_df, on="variant_id")
+        if columns is not None:
+            eqtl_df = eqtl_df[eqtl_columns(eqtl_df.columns, columns)]
+        return eqtl_df
 
     def get_variants_by_region(
         self, start: int, end: int, chrom: str, version: str
+    ) -> pd.DataFrame:
+        return self._find_variants(start, end, chrom, version)
+
+    def get_eqtl_variants(
+        self, version: str, tissue: str, ensg_id_prefix: str, variants: Sequence[str]
     ) -> pd.DataFrame:
         version = version.upper()
         if version not in ("V8", "V10"):
             raise ValueError(f"Invalid GTEx version: {version}")
-        if version == "V8":
-            db = self._client.GTEx_V8
-            rsid_col = "rs_id_dbSNP151_GRCh38p7"
-            query = {"chr": int(chrom), "variant_pos": {"$gte": start, "$lte": end}}
-        else:  # V10
-            db = self._client.GTEx_V10
-            rsid_col = "rs_id_dbSNP155_GRCh38p13"
-            query = {"chr": int(chrom), "pos": {"$gte": start, "$lte": end}}
-
-        docs = list(db["variant_table"].find(query))
+        db = self._client[f"GTEx_{version}"]
+        rsid_col, _ = _VARIANT_TABLE_FIELDS[version]
+
+        # Indexed lookup of the requested variants in the variant table
+        rs_ids = [v for v in variants if v.startswith("rs")]
+        variant_ids = [v for v in variants if not v.startswith("rs")]
+        variants_df = self._query_variant_table(
+            version,
+            {
+                "$or": [
+                    {"variant_id": {"$in": variant_ids}},
+                    {rsid_col: {"$in": rs_ids}},
+                ]
+            },
+        )
+        if variants_df.empty:
+            return pd.DataFrame()
+
+        # Fetch only the matching elements of the gene's eqtl_variants
+        gene_query = {"gene_id": {"$regex": f"^{ensg_id_prefix}.*"}}
+        found_ids = variants_df["variant_id"].drop_duplicates().tolist()
+        if len(found_ids) == 1:
+            doc = db[tissue].find_one(
+                gene_query,
+                {"_id": 0, "eqtl_variants": {"$elemMatch": {"variant_id": found_ids[0]}}},
+            )
+        else:
+            doc = next(
+                db[tissue].aggregate(
+                    [
+                        {"$match": gene_query},
+                        {"$limit": 1},
+                        {
+                            "$project": {
+                                "_id": 0,
+                                "eqtl_variants": {
+                                    "$filter": {
+                                        "input": "$eqtl_variants",
+                                        "as": "v",
+                                        "cond": {"$in": ["$$v.variant_id", found_ids]},
+                                    }
+                                },
+                            }
+                        },
+                    ]
+                ),
+                None,
+            )
+        eqtl_variants = (doc or {}).get("eqtl_variants", [])
+        if not eqtl_variants:
+            return pd.DataFrame()
+
+        return pd.merge(pd.DataFrame(eqtl_variants), variants_df, on="variant_id")
+
+    def _find_variants(
+        self,
+        start: int,
+        end: int,
+        chrom: str,
+        version: str,
+        columns: Optional[Sequence[str]] = None,
+    ) -> pd.DataFrame:
+        """
+        Query the variant table by region, fetching only `variant_id` and `columns` (of VARIANT_COLUMNS) if given.
+        """
+        version = version.upper()
+        if version not in ("V8", "V10"):
+            raise ValueError(f"Invalid GTEx version: {version}")
+        _, pos_col = _VARIANT_TABLE_FIELDS[version]
+        query = {"chr": int(chrom), pos_col: {"$gte": start, "$lte": end}}
+        return self._query_variant_table(version, query, columns)
+
+    def _query_variant_table(
+        self, version: str, query: dict, columns: Optional[Sequence[str]] = None
+    ) -> pd.DataFrame:
+        """
+        Run a query on the variant table and return the results with normalised column names.
+        """
+        db = self._client[f"GTEx_{version}"]
+        rsid_col, pos_col = _VARIANT_TABLE_FIELDS[version]
+
+        projection = None
+        if columns is not None:
+            stored_names = {"rs_id": rsid_col, "pos": pos_col}
+            projection = {"_id": 0, "variant_id": 1}
+            projection.update({stored_names.get(c, c): 1 for c in columns})
+
+        docs = list(db["variant_table"].find(query, projection))
         if not docs:
             return pd.DataFrame()
 
-        df = pd.DataFrame(docs).drop(columns=["_id"]).rename(
+        df = pd.DataFrame(docs).drop(columns=["_id"], errors="ignore").rename(
             columns={rsid_col: "rs_id"}
         )
         # Normalise V8's "variant_pos" to "pos" so callers get a consistent column name.
         if "variant_pos" in df.columns:
             df = df.rename(columns={"variant_pos": "pos"})
         return df
+
+
+def _window_condition(start: Optional[int], end: Optional[int]) -> Optional[dict]:
+    """
+    Return an aggregation expression that is true for eQTL variants `$$v` with `start <= pos <= end`.
+    """
+    # variant_id is "{chrom}_{pos}_{ref}_{alt}_b38"
+    pos = {"$toInt": {"$arrayElemAt": [{"$split": ["$$v.variant_id", "_"]}, 1]}}
+    conditions = []
+    if start is not None:
+        conditions.append({"$gte": [pos, start]})
+    if end is not None:
+        conditions.append({"$lte": [pos, end]})
+    if len(conditions) == 0:
+        return None
+    return {"$and": conditions}
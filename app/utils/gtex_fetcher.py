@@ -0,0 +1,97 @@
+"""
+Bounded concurrent fetching of GTEx data.
+"""
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, TypeVar
+
+from flask import current_app
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class GTExFetcher:
+    """
+    Runs GTEx queries (eg. one per tissue/gene pair) on a bounded thread pool.
+
+    The queries are I/O bound, so threads can share the GTEx database client's
+    connection pool. Results are returned in the order of the inputs, so callers
+    can rely on the same ordering as a sequential loop.
+
+    The pool is created on first use, so that it is not inherited by forked
+    worker processes.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max(1, max_workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.failed = 0
+
+    def map(self, fn: Callable[[T], R], items: Iterable[T]) -> List[R]:
+        """
+        Return `[fn(item) for item in items]`, running up to `max_workers` calls at once.
+
+        Each call runs inside the current Flask app context. If a call raises, the
+        calls not yet started are cancelled and the first exception (in input order) is raised.
+        """
+        items = list(items)
+        if self.max_workers == 1 or len(items) <= 1:
+            return [self._run(fn, item) for item in items]
+
+        app = current_app._get_current_object()  # type: ignore
+
+        def run_in_app_context(item: T) -> R:
+            with app.app_context():
+                return self._run(fn, item)
+
+        executor = self._get_executor()
+        futures: List[Future] = [executor.submit(run_in_app_context, item) for item in items]
+        try:
+            return [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def _run(self, fn: Callable[[T], R], item: T) -> R:
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            result = fn(item)
+        except BaseException:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        with self._lock:
+            self.completed += 1
+        return result
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="gtex-fetch"
+                )
+            return self._executor
+
+    def stats(self) -> dict:
+        """
+        Return the pool size and query counts for this process.
+        """
+        return {
+            "max_workers": self.max_workers,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
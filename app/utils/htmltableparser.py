@@ -7,13 +7,18 @@ Created on Fri Apr 23 19:53:19 2021
 from https://srome.github.io/Parsing-HTML-Tables-in-Python-with-BeautifulSoup-and-pandas/
 """
 
-import requests
+from os import PathLike
+from typing import IO, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
 import pandas as pd
-from bs4 import BeautifulSoup
 
 
 class HTMLTableParser:
     def parse_url(self, url):
+        import requests
+        from bs4 import BeautifulSoup
+
         response = requests.get(url)
         soup = BeautifulSoup(response.text, "lxml")
         return [
@@ -67,3 +72,110 @@ class HTMLTableParser:
                 pass
 
         return df
+
+
+def _to_typed_array(values: List[Optional[str]]) -> np.ndarray:
+    """
+    Convert a list of cell strings to a float64 array if possible,
+    otherwise keep the strings as an object array.
+    """
+    try:
+        return np.array(values, dtype=np.float64)
+    except (ValueError, TypeError):
+        return np.array(values, dtype=object)
+
+
+def _clear_element(elem) -> None:
+    """
+    Free an element that has been fully processed, along with any
+    preceding siblings still attached to its parent.
+    """
+    elem.clear()
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
+def iter_html_tables(
+    source: Union[str, PathLike, IO[bytes]],
+) -> Iterator[Tuple[Optional[str], Union[pd.DataFrame, Exception]]]:
+    """
+    Stream (title, table) pairs from an HTML file made of `<h3>` titles
+    followed by `<table>` elements (see merge_and_convert_to_html.py).
+
+    Each table is built column-wise straight from the parser events, so only
+    one table is held in memory at a time. Columns are float64 when every
+    cell parses as a number, and object (str) otherwise.
+
+    The title is the most recent `<h3>` that has not been paired with a table
+    yet, or None if there isn't one. If a table is malformed (eg. the number of
+    header cells does not match the number of data cells), the exception is
+    yielded in place of the DataFrame so that the caller can decide how to
+    handle it without aborting the rest of the file.
+    """
+    title: Optional[str] = None
+    column_names: List[str] = []
+    columns: List[List[Optional[str]]] = []
+    row: List[str] = []
+    n_rows = 0
+    error: Optional[Exception] = None
+
+    from lxml import etree
+
+    for _, elem in etree.iterparse(
+        source,
+        events=("end",),
+        tag=("h3", "th", "td", "tr", "table"),
+        html=True,
+        encoding="utf-8",
+        recover=True,
+    ):
+        tag = elem.tag
+        if tag == "h3":
+            title = "".join(elem.itertext())
+            _clear_element(elem)
+        elif tag == "th":
+            if n_rows == 0 and len(columns) == 0:
+                column_names.append("".join(elem.itertext()))
+        elif tag == "td":
+            row.append("".join(elem.itertext()))
+        elif tag == "tr":
+            if len(row) > 0 and error is None:
+                if len(columns) == 0:
+                    # First data row: set the number of columns for this table
+                    if len(column_names) > 0 and len(column_names) != len(row):
+                        error = Exception(
+                            "Column titles do not match the number of columns"
+                        )
+                    columns = [[] for _ in row]
+                if len(row) > len(columns):
+                    error = Exception(
+                        f"Row {n_rows + 1} has more cells than the table has columns"
+                    )
+                else:
+                    for i, column in enumerate(columns):
+                        column.append(row[i] if i < len(row) else None)
+                    n_rows += 1
+            row = []
+            _clear_element(elem)
+        elif tag == "table":
+            if error is not None:
+                yield title, error
+            else:
+                names = (
+                    column_names
+                    if len(column_names) > 0
+                    else list(range(len(columns)))
+                )
+                yield title, pd.DataFrame(
+                    {
+                        name: _to_typed_array(column)
+                        for name, column in zip(names, columns)
+                    },
+                    columns=names,
+                    index=pd.RangeIndex(n_rows),
+                )
+            title = None
+            column_names, columns, row, n_rows, error = [], [], [], 0, None
+            _clear_element(elem)
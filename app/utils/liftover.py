@@ -1,83 +1,192 @@
+import gzip
 import os
 import subprocess
 import tempfile
-from typing import List, Tuple
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Hashable, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
+from app.utils.liftover_cache import LiftoverCache
 
-# inspired by https://github.com/broadinstitute/liftover/blob/main/service/server.py
-def run_liftover(
-    original_df: pd.DataFrame,
-    source_coords: str,
-    chrom_col: str = "CHROM",
-    pos_col: str = "POS",
-) -> Tuple[pd.DataFrame, List[int]]:
-    """Lift positions from one coordinate system to the other. This script assumes that columns in the
-    dataframe have standardized names (specifically "CHROM" and "POS").
+CHAIN_ROOT = os.path.join("/usr", "local", "share", "liftOver")
+CHAIN_FILES = {
+    "hg19": "hg19ToHg38.over.chain.gz",
+    "hg38": "hg38ToHg19.over.chain.gz",
+}
+LIFTOVER_ENGINES = ["chain", "binary"]
 
-    :param original_df: The GWAS dataframe whose positions neeed to be lifted
-    :type original_df: pd.DataFrame
-    :param source_coords: Either `hg19` or `hg38`. The positions will be lifted into the other system. If
-    `source_coords` is `hg19`, then the returned DataFrame will have positions in `hg38`.
-    :type source_coords: str
-    :param chrom_col: The column name for the chromosome column. Defaults to "CHROM".
-    :type chrom_col: str
-    :param pos_col: The column name for the position column. Defaults to "POS".
-    :type pos_col: str
-    :return: The new dataframe with updated "CHROM" and "POS" columns and a set of indexes referring to
-    rows in the input DataFrame that could not be lifted over (if they exist).
-    :rtype: Tuple[pd.DataFrame, set]
+
+class ChainMap:
     """
+    Ungapped alignment blocks of a UCSC chain file, stored as sorted arrays per
+    source chromosome so that positions can be lifted with `np.searchsorted`.
 
-    if source_coords not in ["hg19", "hg38"]:
-        raise ValueError("Only source coordinates in hg19 or hg38 can be lifted over!")
+    A position maps if exactly one block contains it. Positions in more than
+    one block (overlapping chains) are left unmapped, as the liftOver binary
+    does without `-multiple`.
+    """
 
-    # drop any existing index and replace with an index column for tracking dropped rows
-    original_copy = original_df.copy().reset_index(drop=True).reset_index()
+    def __init__(self, blocks: Dict[str, Dict[str, np.ndarray]], query_names: List[str]):
+        self.blocks = blocks
+        self.query_names = np.array(query_names, dtype=object)
 
-    # truncate to necessary columns only
-    transformed_df = original_copy.loc[:, [chrom_col, pos_col, "index"]]
-    transformed_df = transformed_df.astype({chrom_col: str})
+    @classmethod
+    def from_file(cls, chain_file_path: str) -> "ChainMap":
+        """
+        Parse a (possibly gzipped) chain file.
+        See https://genome.ucsc.edu/goldenPath/help/chain.html for the format.
+        """
+        opener = gzip.open if str(chain_file_path).endswith(".gz") else open
+        columns: Dict[str, Dict[str, list]] = {}
+        query_names: List[str] = []
+        query_name_ids: Dict[str, int] = {}
 
-    # make sure chr is prefixed as expected by liftOver
-    transformed_df.loc[:, chrom_col] = "chr" + transformed_df.iloc[:, 0].replace(
-        "chr", "", regex=True
-    )
+        with opener(chain_file_path, "rt") as f:
+            for line in f:
+                fields = line.split()
+                if not fields:
+                    continue
+                if fields[0] == "chain":
+                    t_name, t_start = fields[2], int(fields[5])
+                    q_name, q_size, q_strand, q_start = (
+                        fields[7],
+                        int(fields[8]),
+                        fields[9],
+                        int(fields[10]),
+                    )
+                    if q_name not in query_name_ids:
+                        query_name_ids[q_name] = len(query_names)
+                        query_names.append(q_name)
+                    chrom_columns = columns.setdefault(
+                        t_name,
+                        {key: [] for key in ("start", "end", "q_start", "q_name", "q_size")},
+                    )
+                    t_pos, q_pos = t_start, q_start
+                    # q_size is stored negated for blocks on the reverse strand
+                    signed_q_size = -q_size if q_strand == "-" else q_size
+                    continue
+
+                size = int(fields[0])
+                chrom_columns["start"].append(t_pos)
+                chrom_columns["end"].append(t_pos + size)
+                chrom_columns["q_start"].append(q_pos)
+                chrom_columns["q_name"].append(query_name_ids[q_name])
+                chrom_columns["q_size"].append(signed_q_size)
+                if len(fields) == 3:
+                    t_pos += size + int(fields[1])
+                    q_pos += size + int(fields[2])
+
+        blocks = {}
+        for t_name, chrom_columns in columns.items():
+            order = np.argsort(chrom_columns["start"], kind="stable")
+            arrays = {
+                key: np.asarray(values, dtype=np.int64)[order]
+                for key, values in chrom_columns.items()
+            }
+            starts, ends = arrays["start"], arrays["end"]
+            # max end of all blocks before (and including) each block
+            arrays["max_end"] = np.maximum.accumulate(ends)
+            overlaps_next = np.zeros(len(starts), dtype=bool)
+            overlaps_next[:-1] = ends[:-1] > starts[1:]
+            overlaps_prev = np.zeros(len(starts), dtype=bool)
+            overlaps_prev[1:] = starts[1:] < arrays["max_end"][:-1]
+            arrays["overlapping"] = np.flatnonzero(overlaps_next | overlaps_prev)
+            blocks[t_name] = arrays
+
+        return cls(blocks, query_names)
+
+    def lift(
+        self, chroms: np.ndarray, positions: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Lift 1-based positions on the given chromosomes (named as in the chain file, eg. 'chr1').
+
+        Return the new chromosomes, the new 1-based positions, and a boolean mask of
+        which positions could be lifted. Unmapped entries are None and -1.
+        """
+        chroms = np.asarray(chroms, dtype=object)
+        positions = np.asarray(positions, dtype=np.int64)
+        new_chroms = np.full(len(positions), None, dtype=object)
+        new_positions = np.full(len(positions), -1, dtype=np.int64)
+        mapped = np.zeros(len(positions), dtype=bool)
+
+        for chrom in pd.unique(chroms):
+            arrays = self.blocks.get(chrom)
+            if arrays is None:
+                continue
+            rows = np.flatnonzero(chroms == chrom)
+            p0 = positions[rows] - 1  # chain coordinates are 0-based
+            starts, ends, max_end = arrays["start"], arrays["end"], arrays["max_end"]
+
+            block = np.searchsorted(starts, p0, side="right") - 1
+            clipped = np.maximum(block, 0)
+            hit = (block >= 0) & (p0 < ends[clipped])
+            # an earlier block reaching past p0 means p0 may be covered more than once
+            maybe_overlapping = (block >= 1) & (max_end[np.maximum(block - 1, 0)] > p0)
 
-    # chrom col needs to be prefixed with #
-    transformed_df.rename({chrom_col: "#CHROM"}, inplace=True, axis=1)
+            block = np.where(hit & ~maybe_overlapping, block, -1)
+            overlapping = arrays["overlapping"]
+            for k in np.flatnonzero(maybe_overlapping):
+                covering = overlapping[
+                    (starts[overlapping] <= p0[k]) & (ends[overlapping] > p0[k])
+                ]
+                if len(covering) == 1:
+                    block[k] = covering[0]
 
-    # liftover expects BED-style input; add necessary columns
-    transformed_df.loc[:, "end"] = transformed_df.loc[:, pos_col]
-    # BED format is zero-indexed for start pos
-    transformed_df.loc[:, pos_col] = transformed_df.loc[:, pos_col] - 1
+            ok = block >= 0
+            b = block[ok]
+            q0 = arrays["q_start"][b] + (p0[ok] - starts[b])
+            q_size = arrays["q_size"][b]
+            q0 = np.where(q_size < 0, -q_size - 1 - q0, q0)
 
-    # ensure proper column order
-    transformed_df = transformed_df[["#CHROM", pos_col, "end", "index"]]
+            new_chroms[rows[ok]] = self.query_names[arrays["q_name"][b]]
+            new_positions[rows[ok]] = q0 + 1
+            mapped[rows[ok]] = True
 
-    # typecast columns
-    transformed_df = transformed_df.astype({
-        pos_col: int,
-        "end": int,
-    })
+        return new_chroms, new_positions, mapped
 
-    chain_root = os.path.join("/usr", "local", "share", "liftOver")
 
-    chain_file = (
-        "hg19ToHg38.over.chain.gz"
-        if source_coords == "hg19"
-        else "hg38ToHg19.over.chain.gz"
+@lru_cache(maxsize=None)
+def load_chain_map(chain_file_path: str) -> ChainMap:
+    """Parse a chain file once per process."""
+    return ChainMap.from_file(chain_file_path)
+
+
+def get_chain_file_path(source_coords: str) -> str:
+    if source_coords not in CHAIN_FILES:
+        raise ValueError("Only source coordinates in hg19 or hg38 can be lifted over!")
+    return os.path.join(CHAIN_ROOT, CHAIN_FILES[source_coords])
+
+
+def _lift_with_binary(
+    chroms: np.ndarray, positions: np.ndarray, chain_file_path: str
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Lift positions with the external `liftOver` binary. Same contract as `ChainMap.lift`.
+    """
+    # liftover expects BED-style input; BED format is zero-indexed for start pos
+    bed_df = pd.DataFrame(
+        {
+            "#CHROM": chroms,
+            "start": positions - 1,
+            "end": positions,
+            "index": np.arange(len(positions)),
+        }
     )
 
-    chain_file_path = os.path.join(chain_root, chain_file)
+    new_chroms = np.full(len(positions), None, dtype=object)
+    new_positions = np.full(len(positions), -1, dtype=np.int64)
+    mapped = np.zeros(len(positions), dtype=bool)
 
     with (
         tempfile.NamedTemporaryFile(suffix=".bed") as input_file,
         tempfile.NamedTemporaryFile(suffix=".bed") as output_file,
         tempfile.NamedTemporaryFile(suffix=".bed") as unmapped_output_file,
     ):
-        transformed_df.to_csv(input_file.name, sep="\t", index=False)
+        bed_df.to_csv(input_file.name, sep="\t", index=False)
 
         subprocess.run(
             [
@@ -91,20 +200,154 @@ def run_liftover(
         )
 
         result_df = pd.read_csv(
-            output_file, sep="\t", names=list(transformed_df.columns)
+            output_file, sep="\t", names=list(bed_df.columns)
         )
 
-        result_df.loc[:, pos_col] = result_df.loc[:, "end"]
+    rows = result_df["index"].to_numpy()
+    new_chroms[rows] = result_df["#CHROM"].astype(str).to_numpy()
+    new_positions[rows] = result_df["end"].to_numpy()
+    mapped[rows] = True
+
+    return new_chroms, new_positions, mapped
+
+
+@dataclass
+class LiftoverTable:
+    """A DataFrame to be lifted over, and the names of its coordinate columns."""
 
-        joined = original_copy.merge(
-            result_df, how="inner", suffixes=("", "_lifted"), on="index"
+    df: pd.DataFrame
+    chrom_col: str = "CHROM"
+    pos_col: str = "POS"
+
+
+def run_liftover_batch(
+    tables: Dict[Hashable, LiftoverTable],
+    source_coords: str,
+    engine: str = "chain",
+    cache: Optional[LiftoverCache] = None,
+) -> Dict[Hashable, Tuple[pd.DataFrame, List[int]]]:
+    """Lift several DataFrames in a single pass of the liftover engine.
+
+    The coordinates of all tables are concatenated, lifted together, and split back per table,
+    so a job pays for chain loading (or the liftOver process) once rather than once per table.
+
+    :param tables: The tables to lift, keyed by any label (eg. the dataset title).
+    :type tables: Dict[Hashable, LiftoverTable]
+    :param source_coords: Either `hg19` or `hg38`, as for `run_liftover`.
+    :type source_coords: str
+    :param engine: "chain" or "binary", as for `run_liftover`.
+    :type engine: str
+    :param cache: Persistent cache of lifted coordinates, consulted before the engine is run and
+    updated with the positions it lifts. Defaults to no cache.
+    :type cache: Optional[LiftoverCache]
+    :return: For each key in `tables`, the same (lifted DataFrame, unlifted indices) pair that
+    `run_liftover` returns for that table alone.
+    :rtype: Dict[Hashable, Tuple[pd.DataFrame, List[int]]]
+    """
+
+    chain_file_path = get_chain_file_path(source_coords)
+    if engine not in LIFTOVER_ENGINES:
+        raise ValueError(f"Unknown liftover engine '{engine}', expected one of {LIFTOVER_ENGINES}")
+    if len(tables) == 0:
+        return {}
+
+    # drop any existing index so that unlifted rows are reported by position
+    originals = {key: table.df.reset_index(drop=True) for key, table in tables.items()}
+
+    chrom_arrays = []
+    pos_arrays = []
+    for key, table in tables.items():
+        original = originals[key]
+        # make sure chr is prefixed as expected by the chain file
+        chrom_arrays.append(
+            (
+                "chr"
+                + original[table.chrom_col].astype(str).str.replace("chr", "", regex=False)
+            ).to_numpy(dtype=object)
         )
+        pos_arrays.append(original[table.pos_col].astype(int).to_numpy())
 
-        dropped = set(original_copy["index"]).difference(joined["index"])
+    chroms = np.concatenate(chrom_arrays)
+    positions = np.concatenate(pos_arrays)
 
-        # Chrom can be affected by liftover, so we'll take it from the new DataFrame
-        joined = joined.drop(
-            [chrom_col, pos_col, "index", "POS_lifted"], axis=1
-        ).rename({"#CHROM": chrom_col, "end": pos_col}, axis=1)[original_df.columns]
+    if cache is not None:
+        new_chroms, new_positions, mapped, found = cache.lookup(
+            source_coords, chroms, positions
+        )
+        missing = np.flatnonzero(~found)
+    else:
+        missing = np.arange(len(positions))
+        new_chroms = np.full(len(positions), None, dtype=object)
+        new_positions = np.full(len(positions), -1, dtype=np.int64)
+        mapped = np.zeros(len(positions), dtype=bool)
+
+    if len(missing) > 0:
+        if engine == "chain":
+            lifted_coords = load_chain_map(chain_file_path).lift(
+                chroms[missing], positions[missing]
+            )
+        else:
+            lifted_coords = _lift_with_binary(
+                chroms[missing], positions[missing], chain_file_path
+            )
+        new_chroms[missing], new_positions[missing], mapped[missing] = lifted_coords
+        if cache is not None:
+            cache.store(
+                source_coords, chroms[missing], positions[missing], *lifted_coords
+            )
+
+    results = {}
+    offset = 0
+    for key, table in tables.items():
+        original = originals[key]
+        rows = slice(offset, offset + len(original))
+        offset += len(original)
+        table_mapped = mapped[rows]
+
+        # Chrom can be affected by liftover, so we take both from the lifted coordinates
+        lifted = original.loc[table_mapped].reset_index(drop=True)
+        lifted[table.chrom_col] = new_chroms[rows][table_mapped]
+        lifted[table.pos_col] = new_positions[rows][table_mapped]
+
+        results[key] = (lifted, np.flatnonzero(~table_mapped).tolist())
+
+    return results
+
+
+# inspired by https://github.com/broadinstitute/liftover/blob/main/service/server.py
+def run_liftover(
+    original_df: pd.DataFrame,
+    source_coords: str,
+    chrom_col: str = "CHROM",
+    pos_col: str = "POS",
+    engine: str = "chain",
+    cache: Optional[LiftoverCache] = None,
+) -> Tuple[pd.DataFrame, List[int]]:
+    """Lift positions from one coordinate system to the other. This script assumes that columns in the
+    dataframe have standardized names (specifically "CHROM" and "POS").
+
+    :param original_df: The GWAS dataframe whose positions neeed to be lifted
+    :type original_df: pd.DataFrame
+    :param source_coords: Either `hg19` or `hg38`. The positions will be lifted into the other system. If
+    `source_coords` is `hg19`, then the returned DataFrame will have positions in `hg38`.
+    :type source_coords: str
+    :param chrom_col: The column name for the chromosome column. Defaults to "CHROM".
+    :type chrom_col: str
+    :param pos_col: The column name for the position column. Defaults to "POS".
+    :type pos_col: str
+    :param engine: "chain" to lift in-process from the parsed chain file (default), or "binary" to run
+    the external `liftOver` tool, which is kept for validating the in-process engine.
+    :type engine: str
+    :param cache: Persistent cache of lifted coordinates to use, if any.
+    :type cache: Optional[LiftoverCache]
+    :return: The new dataframe with updated "CHROM" and "POS" columns and a set of indexes referring to
+    rows in the input DataFrame that could not be lifted over (if they exist).
+    :rtype: Tuple[pd.DataFrame, set]
+    """
 
-    return joined, list(dropped)
+    return run_liftover_batch(
+        {None: LiftoverTable(original_df, chrom_col, pos_col)},
+        source_coords,
+        engine=engine,
+        cache=cache,
+    )[None]
@@ -0,0 +1,157 @@
+"""
+Persistent cache of lifted-over coordinates, shared across jobs.
+"""
+
+import os
+import sqlite3
+from contextlib import closing
+from typing import Tuple
+
+import numpy as np
+
+
+class LiftoverCache:
+    """
+    SQLite-backed (source build, chrom, pos) -> (chrom, pos) cache for `run_liftover_batch`.
+
+    Positions that could not be lifted are cached too, with a NULL chromosome.
+    Cache errors (eg. a locked or read-only database) are counted and treated as
+    misses so that liftover never fails because of the cache.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS lifted (
+                        source TEXT NOT NULL,
+                        chrom TEXT NOT NULL,
+                        pos INTEGER NOT NULL,
+                        new_chrom TEXT,
+                        new_pos INTEGER,
+                        PRIMARY KEY (source, chrom, pos)
+                    ) WITHOUT ROWID
+                    """
+                )
+            except sqlite3.Error:
+                conn.close()
+                raise
+            self._initialized = True
+        return conn
+
+    def lookup(
+        self, source_coords: str, chroms: np.ndarray, positions: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Look up lifted coordinates. Return the new chromosomes, new positions and mapped mask
+        (as `ChainMap.lift` does), plus a mask of which positions were found in the cache.
+        """
+        n = len(positions)
+        new_chroms = np.full(n, None, dtype=object)
+        new_positions = np.full(n, -1, dtype=np.int64)
+        mapped = np.zeros(n, dtype=bool)
+        found = np.zeros(n, dtype=bool)
+
+        try:
+            # The connection's own context manager commits but does not close it
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "CREATE TEMP TABLE query (row INTEGER PRIMARY KEY, chrom TEXT, pos INTEGER)"
+                )
+                conn.executemany(
+                    "INSERT INTO query VALUES (?, ?, ?)",
+                    zip(range(n), np.asarray(chroms).tolist(), np.asarray(positions).tolist()),
+                )
+                rows = conn.execute(
+                    """
+                    SELECT query.row, lifted.new_chrom, lifted.new_pos
+                    FROM query JOIN lifted
+                    ON lifted.source = ? AND lifted.chrom = query.chrom AND lifted.pos = query.pos
+                    """,
+                    (source_coords,),
+                ).fetchall()
+        except sqlite3.Error:
+            self.errors += 1
+            rows = []
+
+        if len(rows) > 0:
+            found_rows = np.array([row[0] for row in rows], dtype=np.intp)
+            found_chroms = np.array([row[1] for row in rows], dtype=object)
+            found_positions = np.array(
+                [-1 if row[2] is None else row[2] for row in rows], dtype=np.int64
+            )
+            found_mapped = np.array([row[1] is not None for row in rows], dtype=bool)
+
+            found[found_rows] = True
+            mapped[found_rows] = found_mapped
+            new_chroms[found_rows[found_mapped]] = found_chroms[found_mapped]
+            new_positions[found_rows[found_mapped]] = found_positions[found_mapped]
+
+        self.hits += int(found.sum())
+        self.misses += n - int(found.sum())
+
+        return new_chroms, new_positions, mapped, found
+
+    def store(
+        self,
+        source_coords: str,
+        chroms: np.ndarray,
+        positions: np.ndarray,
+        new_chroms: np.ndarray,
+        new_positions: np.ndarray,
+        mapped: np.ndarray,
+    ):
+        """
+        Save lifted coordinates (and positions that could not be lifted).
+        """
+        records = (
+            (
+                source_coords,
+                chrom,
+                pos,
+                new_chrom if is_mapped else None,
+                new_pos if is_mapped else None,
+            )
+            for chrom, pos, new_chrom, new_pos, is_mapped in zip(
+                np.asarray(chroms).tolist(),
+                np.asarray(positions).tolist(),
+                np.asarray(new_chroms).tolist(),
+                np.asarray(new_positions).tolist(),
+                np.asarray(mapped).tolist(),
+            )
+        )
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO lifted VALUES (?, ?, ?, ?, ?)", records
+                )
+        except sqlite3.Error:
+            self.errors += 1
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def stats(self) -> dict:
+        """
+        Return cumulative hit/miss counts for this process.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "errors": self.errors,
+        }
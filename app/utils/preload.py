@@ -0,0 +1,86 @@
+"""
+Preloading of reference data (and R workers) into worker processes, so that the
+first job on a worker does not pay for reading it.
+"""
+
+import time
+from functools import partial
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from flask import current_app as app
+
+from app.colocalization.plink import preload_plink_bims
+from app.scripts.r_worker import start_r_workers
+from app.utils import get_chrom_lengths, get_dbsnp_tabix
+from app.utils.gencode import preload_gencode
+from app.utils.liftover import get_chain_file_path, load_chain_map
+
+PRELOAD_TARGETS = ["gencode", "chrom_lengths", "liftover", "bim", "dbsnp", "r_workers"]
+# Targets that can be loaded before worker processes are forked and shared by them
+SHARED_PRELOAD_TARGETS = ["gencode", "chrom_lengths", "liftover", "bim"]
+# Targets holding open files or child processes, which every worker process must load for itself
+PROCESS_PRELOAD_TARGETS = ["dbsnp", "r_workers"]
+
+
+def _preload_steps(
+    targets: Sequence[str], builds: Sequence[str], populations: Sequence[str]
+) -> List[Tuple[str, Callable[[], object]]]:
+    unknown = set(targets) - set(PRELOAD_TARGETS)
+    if unknown:
+        raise ValueError(
+            f"Unknown preload targets {sorted(unknown)}; expected some of {PRELOAD_TARGETS}"
+        )
+
+    steps: List[Tuple[str, Callable[[], object]]] = []
+    if "gencode" in targets:
+        steps.append(("gencode", preload_gencode))
+    if "r_workers" in targets:
+        steps.append(("r_workers", start_r_workers))
+    for build in builds:
+        if "chrom_lengths" in targets:
+            steps.append((f"chrom_lengths:{build}", partial(get_chrom_lengths, build)))
+        if "liftover" in targets:
+            steps.append(
+                (
+                    f"liftover:{build}",
+                    lambda build=build: load_chain_map(get_chain_file_path(build)),
+                )
+            )
+        if "bim" in targets:
+            for pop in populations:
+                steps.append((f"bim:{build}:{pop}", partial(preload_plink_bims, build, pop)))
+        if "dbsnp" in targets:
+            steps.append((f"dbsnp:{build}", partial(get_dbsnp_tabix, build)))
+    return steps
+
+
+def preload_reference_data(
+    targets: Sequence[str], builds: Sequence[str], populations: Sequence[str] = ()
+) -> Dict[str, float]:
+    """
+    Load reference data into this process, and log how long each dataset took.
+
+    targets are some of PRELOAD_TARGETS. Each is loaded for every build
+    ("hg19", "hg38"), and BIM files for every 1000 Genomes population as well.
+    A dataset that fails to load (eg. its file is not installed) is logged and
+    skipped, and is loaded on first use instead.
+
+    Must be called in an app context. Returns the seconds taken by each dataset that was loaded.
+    """
+    steps = _preload_steps(targets, builds, populations)
+    timings: Dict[str, float] = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            app.logger.warning(f"Could not preload {name}: {e}")
+            continue
+        timings[name] = time.perf_counter() - start
+        app.logger.info(f"Preloaded {name} in {timings[name]:.2f}s")
+
+    if steps:
+        app.logger.info(
+            f"Preloaded {len(timings)}/{len(steps)} reference datasets in {sum(timings.values()):.2f}s"
+        )
+    return timings
@@ -0,0 +1,95 @@
+"""
+Readers for columnar secondary dataset containers.
+
+Besides the merged HTML file (see `app.utils.htmltableparser`), secondary datasets
+can be uploaded as:
+
+- a single Parquet file, where each row carries the title of its dataset in a
+  `dataset_title` column, or
+- a tar archive of tab-separated files (optionally gzipped), one per dataset, where
+  the dataset title is the file name without its extension.
+
+Both can be created with merge_and_convert_to_html.py using `--format parquet` or `--format tar`.
+"""
+
+import os
+import tarfile
+from typing import Iterator, Tuple, Union
+
+import pandas as pd
+
+from app.utils.errors import InvalidUsage
+
+DATASET_TITLE_COL = "dataset_title"
+TAR_TABLE_EXTENSIONS = (".tsv.gz", ".txt.gz", ".tsv", ".txt")
+
+
+def iter_parquet_tables(
+    filepath: Union[str, os.PathLike],
+) -> Iterator[Tuple[str, Union[pd.DataFrame, Exception]]]:
+    """
+    Yield (title, table) pairs from a Parquet file with a `dataset_title` column.
+
+    Datasets are yielded in the order in which they first appear in the file.
+    """
+    try:
+        df = pd.read_parquet(filepath)
+    except Exception as e:
+        raise InvalidUsage(
+            f"Failed to read secondary datasets as a Parquet file: {e}",
+            status_code=410,
+        ) from e
+
+    if DATASET_TITLE_COL not in df.columns:
+        raise InvalidUsage(
+            f"Secondary dataset Parquet file is missing the '{DATASET_TITLE_COL}' column. Please use the merge_and_convert_to_html.py script for formatting.",
+            status_code=410,
+        )
+
+    for title, table in df.groupby(DATASET_TITLE_COL, sort=False):
+        yield str(title), table.drop(columns=[DATASET_TITLE_COL]).reset_index(
+            drop=True
+        )
+
+
+def iter_tar_tables(
+    filepath: Union[str, os.PathLike],
+) -> Iterator[Tuple[str, Union[pd.DataFrame, Exception]]]:
+    """
+    Yield (title, table) pairs from a tar archive of tab-separated files.
+
+    Members are read one at a time in archive order. Hidden files and members
+    without a recognized extension are skipped. If a member cannot be parsed,
+    the exception is yielded in place of the DataFrame.
+    """
+    try:
+        tar = tarfile.open(filepath)
+    except tarfile.TarError as e:
+        raise InvalidUsage(
+            f"Failed to read secondary datasets as a tar archive: {e}",
+            status_code=410,
+        ) from e
+
+    with tar:
+        for member in tar:
+            name = os.path.basename(member.name)
+            if not member.isfile() or name.startswith("."):
+                continue
+            extension = next(
+                (ext for ext in TAR_TABLE_EXTENSIONS if name.endswith(ext)), None
+            )
+            if extension is None:
+                continue
+
+            title = name[: -len(extension)]
+            try:
+                table = pd.read_csv(
+                    tar.extractfile(member),  # type: ignore
+                    sep="\t",
+                    encoding="utf-8",
+                    compression="gzip" if extension.endswith(".gz") else None,
+                )
+            except Exception as e:
+                yield title, e
+                continue
+            yield title, table
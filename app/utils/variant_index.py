@@ -0,0 +1,94 @@
+"""
+Variant index for aligning secondary datasets against a GWAS SNP list.
+"""
+
+from functools import cached_property
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.utils.errors import InvalidUsage
+
+MISSING_VARIANT = "."
+
+
+class VariantIndex:
+    """
+    Ordered list of variant IDs (eg. the Simple Sum subset of a GWAS) that
+    secondary datasets are aligned against.
+
+    Build it once per job and align each dataset with a single hash lookup,
+    rather than a DataFrame merge and sort per dataset.
+    """
+
+    def __init__(self, variant_ids: Iterable[str]):
+        self.variant_ids = pd.Index(np.asarray(list(variant_ids), dtype=object))
+
+    def __len__(self) -> int:
+        return len(self.variant_ids)
+
+    @cached_property
+    def uses_rsids(self) -> bool:
+        """
+        Return True if the indexed variants are rs IDs, False if they are in
+        chrom_pos_ref_alt_build format.
+
+        Raise InvalidUsage if the formats are mixed or not recognized.
+        """
+        ids = self.variant_ids.astype(str)
+        has_rsids = bool(ids.str.startswith("rs").any())
+        has_std_ids = bool(
+            (ids.str.endswith("_b37") | ids.str.endswith("_b38")).any()
+        )
+        if has_rsids and has_std_ids:
+            raise InvalidUsage(
+                "There is a mix of rsid and other variant id formats; please use a consistent format"
+            )
+        elif has_rsids:
+            return True
+        elif has_std_ids:
+            return False
+        raise InvalidUsage(
+            "Variant naming format not supported; ensure all are rs ID's are formatted as chrom_pos_ref_alt_b37 eg. 1_205720483_G_A_b37"
+        )
+
+    def position_range(self) -> Optional[Tuple[int, int]]:
+        """
+        Return the (min, max) position of the indexed chrom_pos_ref_alt_build variants,
+        or None if they are rs IDs or no position could be read.
+        """
+        if self.uses_rsids:
+            return None
+        positions = pd.to_numeric(
+            self.variant_ids.astype(str).str.split("_").str[1], errors="coerce"
+        ).dropna()
+        if len(positions) == 0:
+            return None
+        return int(positions.min()), int(positions.max())
+
+    def positions(self, variant_ids: Iterable[str]) -> np.ndarray:
+        """
+        For each indexed variant, return the position of its first match in `variant_ids`, or -1 if there is none.
+
+        Missing variant IDs ('.' or NaN) never match.
+        """
+        keys = pd.Index(np.asarray(list(variant_ids), dtype=object))
+        usable = ~keys.duplicated() & keys.notna() & (keys != MISSING_VARIANT)
+        rows = np.flatnonzero(usable)
+        if len(rows) == 0:
+            return np.full(len(self), -1, dtype=np.intp)
+        matches = keys[usable].get_indexer(self.variant_ids)
+        return np.where(matches >= 0, rows[matches], -1)
+
+    def align(self, df: pd.DataFrame, variant_ids: Iterable[str]) -> pd.DataFrame:
+        """
+        Return the rows of `df` reordered to match the indexed variants, where `variant_ids` are the IDs of the rows of `df`.
+
+        The result has one row per indexed variant; variants without a match in `df` get a row of NaN.
+        """
+        return (
+            df.reset_index(drop=True)
+            .reindex(self.positions(variant_ids))
+            .reset_index(drop=True)
+        )
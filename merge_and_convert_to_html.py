@@ -9,6 +9,8 @@ python merge_and_convert_to_hmtl.py -h
 """
 
 import argparse
+import io
+import tarfile
 import numpy as np
 import pandas as pd
 import gzip
@@ -115,6 +117,33 @@ def getNumHeaderLines(file, num_lines_to_check = 1000):
                 num_lines_checked += 1
     return num_header_lines
 
+def writeMergedDatasets(datasets, outfilename, outformat):
+    '''
+    Writes the (description, dataframe) pairs in 'datasets' to 'outfilename' as either
+    - html: tables separated by <h3> title tags
+    - parquet: a single table with an additional 'dataset_title' column
+    - tar: one tab-separated file per dataset, named after its description
+    '''
+    if outformat == 'parquet':
+        merged = pd.concat([ df.assign(dataset_title=description) for description, df in datasets ], axis=0, ignore_index=True)
+        merged.to_parquet(outfilename, index=False)
+    elif outformat == 'tar':
+        with tarfile.open(outfilename, 'w') as tar:
+            for description, df in datasets:
+                tsv_bytes = df.to_csv(sep='\t', index=False).encode('utf-8')
+                tarinfo = tarfile.TarInfo(name=description.replace('/','_') + '.tsv')
+                tarinfo.size = len(tsv_bytes)
+                tar.addfile(tarinfo, io.BytesIO(tsv_bytes))
+    else:
+        final_merge = '<!DOCTYPE html>\n<html>'
+        for description, df in datasets:
+            h3tag = '<h3>'+description+'</h3>'
+            df_html_str = df.to_html(index=False)
+            final_merge += h3tag + df_html_str
+        final_merge += '</html>'
+        with open(outfilename, 'w') as f_out:
+            f_out.write(final_merge)
+
 class Logger(object):
     def __init__(self, outfilename):
         self.terminal = sys.stdout
@@ -132,19 +161,22 @@ class Logger(object):
 ## MAIN
 ##############################
 if __name__=='__main__':
-    parser = argparse.ArgumentParser(description='Merge several datasets together into HTML tables separated by <h3> title tags')
+    parser = argparse.ArgumentParser(description='Merge several datasets together into HTML tables separated by <h3> title tags (or into a single Parquet file or tar of TSVs)')
     parser.add_argument('filelist_filename', 
                         help='Filename containing the list of files to be merged together.\n \
                         The second column (tab-delimited) may contain descriptions of the datasets.\n \
                         The remaining columns specify the column names for chromosome, basepair position, SNP name, P-value (in that order).')
     parser.add_argument('coordinates', help="The region coordinates to subset from each file (e.g. 1:500,000-600,000")
     parser.add_argument('outfilename', help="Desired output filename for the merged file")
+    parser.add_argument('--format', dest='outformat', default='html', choices=['html','parquet','tar'],
+                        help="Output format: html (default), parquet (single table with a 'dataset_title' column) or tar (one TSV per dataset)")
     args = parser.parse_args()  
 
     filelist_filename = str(args.filelist_filename)
     chrom, startbp, endbp = parseRegionText(args.coordinates)
-    outfilename = str(args.outfilename.replace('.html','') + '.html')
-    logfilename = str(outfilename.replace('.html','') + '.log')
+    outformat = str(args.outformat)
+    outfilename = str(args.outfilename.replace('.'+outformat,'') + '.'+outformat)
+    logfilename = str(outfilename.replace('.'+outformat,'') + '.log')
 
 #    filelist_filename = "files_test.txt"
 #    outfilename = "slc9a3_gwas_mqtl.html"
@@ -175,7 +207,7 @@ if __name__=='__main__':
             raise Exception('Column names given: ' + str(list(filelist.iloc[i,2:6])) + '\n Not all match for file ' + files[i])
 
     print('Merging files')
-    final_merge = '<!DOCTYPE html>\n<html>'
+    datasets = []
     for i in tqdm(np.arange(len(files))):
         df = pd.read_csv(files[i], sep='\t', skiprows=getNumHeaderLines(files[i]))
         desired_cols = list(filelist.iloc[i,2:6])
@@ -189,14 +221,10 @@ if __name__=='__main__':
             df[CHROM] = np.repeat(chrom, df.shape[0])
         df[CHROM] = [ int(str(x).lower().replace('chr','').replace('chrom','')) for x in list(df[CHROM]) ]
         df = df.loc[ (df[CHROM]==chrom) & (df[BP]>=startbp) & (df[BP]<=endbp) ]
-        h3tag = '<h3>'+file_descriptions[i]+'</h3>'
-        df_html_str = df.to_html(index=False)
-        final_merge += h3tag + df_html_str
-    final_merge += '</html>'
+        datasets.append((file_descriptions[i], df))
     
     print('Writing merged output')
-    with open(outfilename, 'w') as f_out:
-        f_out.write(final_merge)
+    writeMergedDatasets(datasets, outfilename, outformat)
     
     # Quick check:
 #    with open(outfilename, encoding='utf-8', errors='replace') as f:
@@ -0,0 +1,65 @@
+import json
+import os
+import uuid
+
+import pytest
+from flask.app import Flask
+
+from tests.fake_gtex import FakeGTExDatabase
+
+
+@pytest.fixture()
+def gene_switch_session(flask_app: Flask, fake_gtex_db: FakeGTExDatabase):
+    """Write a minimal form_data session file with SNPs around NUCKS1 and CDK18."""
+    from app.routes import APP_STATIC
+
+    snps = [v["variant_id"] for v in fake_gtex_db._gene_variants["NUCKS1"][::2]]
+    snps += [v["variant_id"] for v in fake_gtex_db._gene_variants["CDK18"][:5]]
+    snps += ["1_205000000_A_G_b38"]
+    session_id = str(uuid.uuid4())
+    sessionfilepath = os.path.join(
+        APP_STATIC, f"session_data/form_data-{session_id}.json"
+    )
+    with open(sessionfilepath, "w") as f:
+        json.dump(
+            {
+                "snps": snps,
+                "gtex_tissues": ["Liver", "Lung"],
+                "gtex_version": "V8",
+            },
+            f,
+        )
+    yield session_id
+    os.remove(sessionfilepath)
+
+
+def test_gene_switch_matches_update(flask_app: Flask, gene_switch_session: str):
+    """The compact gene-switch response has the same eQTLs as the full /update response."""
+    client = flask_app.test_client()
+    full = client.get(f"/update/{gene_switch_session}/NUCKS1").get_json()
+    resp = client.get(f"/update/{gene_switch_session}/NUCKS1/eqtl")
+    assert resp.status_code == 200
+    compact = resp.get_json()
+
+    assert compact["gene"] == "NUCKS1"
+    assert set(compact["tissues"]) == {"Liver", "Lung"}
+    for tissue, columns in compact["tissues"].items():
+        expected = [row for row in full[tissue] if row["pval"] != -1]
+        assert len(expected) > 0
+        assert columns["index"] == [row["index"] for row in expected]
+        assert columns["pos"] == [row["pos"] for row in expected]
+        assert columns["pval"] == [row["pval"] for row in expected]
+        assert columns["rs_id"] == [row["rs_id"] for row in expected]
+
+
+def test_gene_switch_no_overlap(flask_app: Flask, gene_switch_session: str):
+    client = flask_app.test_client()
+    compact = client.get(f"/update/{gene_switch_session}/PM20D1/eqtl").get_json()
+    for columns in compact["tissues"].values():
+        assert columns == {"index": [], "pos": [], "pval": [], "rs_id": []}
+
+
+def test_gene_switch_unknown_session(flask_app: Flask, fake_gtex_db: FakeGTExDatabase):
+    client = flask_app.test_client()
+    resp = client.get(f"/update/{uuid.uuid4()}/NUCKS1/eqtl")
+    assert resp.status_code == 404
@@ -1,3 +1,4 @@
+import pandas as pd
 import pytest
 from flask.app import Flask
 
@@ -69,6 +70,58 @@ def test_get_gtex_data(flask_app: Flask, fake_gtex_db: FakeGTExDatabase):
         assert len(non_null) > 0
 
 
+def test_get_gtex_data_columns(flask_app: Flask, fake_gtex_db: FakeGTExDatabase):
+    """get_gtex_data with a column subset returns the same values as a full fetch."""
+    with flask_app.app_context():
+        from app.utils.gtex import get_gtex_data
+
+        nucks1_variants = fake_gtex_db._gene_variants["NUCKS1"]
+        snp_list = [v["variant_id"] for v in nucks1_variants[10:20]] + ["."]
+
+        full = get_gtex_data("V8", "Liver", "NUCKS1", snp_list)
+        subset = get_gtex_data("V8", "Liver", "NUCKS1", snp_list, columns=["pval"])
+        assert list(subset.columns) == ["index", "variant_id", "pval"]
+        pd.testing.assert_frame_equal(subset, full[["index", "variant_id", "pval"]])
+
+
+def test_get_eqtl_data_window(fake_gtex_db: FakeGTExDatabase):
+    """get_eqtl_data only returns eQTLs within [start, end], with the requested columns."""
+    nucks1_variants = fake_gtex_db._gene_variants["NUCKS1"]
+    start, end = nucks1_variants[5]["pos"], nucks1_variants[14]["pos"]
+    ensg_id_prefix = fake_gtex_db.genes["NUCKS1"]["ensg_id"].split(".")[0]
+
+    df = fake_gtex_db.get_eqtl_data(
+        "V8", "Liver", ensg_id_prefix, columns=["rs_id", "pval"], start=start, end=end
+    )
+    assert list(df.columns) == ["variant_id", "rs_id", "pval"]
+    assert list(df["variant_id"]) == [v["variant_id"] for v in nucks1_variants[5:15]]
+
+    assert fake_gtex_db.get_eqtl_data("V8", "Liver", ensg_id_prefix, start=0, end=1).empty
+
+
+def test_gtex_variant_route(flask_app: Flask, fake_gtex_db: FakeGTExDatabase):
+    """/gtex/<version>/<tissue>/<gene>/<variant> returns the eQTL of one or a few variants."""
+    client = flask_app.test_client()
+    variants = fake_gtex_db._gene_variants["NUCKS1"]
+
+    resp = client.get(f"/gtex/V8/Liver/NUCKS1/{variants[3]['rs_id']}")
+    assert resp.status_code == 200
+    records = resp.get_json()
+    assert [r["variant_id"] for r in records] == [variants[3]["variant_id"]]
+    assert {"pval", "beta", "se", "rs_id", "pos"} <= set(records[0])
+
+    batch = f"{variants[1]['variant_id']},{variants[2]['rs_id']},rs1"
+    records = client.get(f"/gtex/V8/Liver/NUCKS1/{batch}").get_json()
+    assert [r["variant_id"] for r in records] == [
+        variants[1]["variant_id"],
+        variants[2]["variant_id"],
+    ]
+
+    # A variant of another gene has no eQTL for NUCKS1
+    other = fake_gtex_db._gene_variants["CDK18"][0]["rs_id"]
+    assert client.get(f"/gtex/V8/Liver/NUCKS1/{other}").status_code == 410
+
+
 def test_list_tissues_route(flask_app: Flask, fake_gtex_db: FakeGTExDatabase):
     """The /gtex/<version>/tissues_list route returns the seeded tissues."""
     client = flask_app.test_client()
@@ -0,0 +1,97 @@
+import pandas as pd
+import pytest
+
+from app.utils.gtex_db import ParquetGTExDatabase
+from app.utils.gtex_db.export import export_gtex
+from tests.fake_gtex import FakeGTExDatabase, GENES, TISSUES
+
+
+@pytest.fixture(scope="module")
+def fake_db() -> FakeGTExDatabase:
+    return FakeGTExDatabase()
+
+
+@pytest.fixture(scope="module")
+def parquet_db(fake_db: FakeGTExDatabase, tmp_path_factory) -> ParquetGTExDatabase:
+    """Export the fake GTEx databases to Parquet and open the export."""
+    root = str(tmp_path_factory.mktemp("gtex_parquet"))
+    gene_ids = [info["ensg_id"] for info in GENES.values()]
+    export_gtex(
+        fake_db,
+        root,
+        {version: {tissue: gene_ids for tissue in TISSUES} for version in ("V8", "V10")},
+    )
+    return ParquetGTExDatabase(root)
+
+
+def test_parquet_list_tissues(parquet_db: ParquetGTExDatabase):
+    assert parquet_db.list_tissues("V8") == sorted(TISSUES)
+    assert parquet_db.list_tissues("v10") == sorted(TISSUES)
+
+
+@pytest.mark.parametrize("tissue", TISSUES)
+def test_parquet_eqtl_data_matches_source(
+    fake_db: FakeGTExDatabase, parquet_db: ParquetGTExDatabase, tissue: str
+):
+    for info in GENES.values():
+        ensg_id_prefix = info["ensg_id"].split(".")[0]
+        expected = fake_db.get_eqtl_data("V8", tissue, ensg_id_prefix)
+        actual = parquet_db.get_eqtl_data("V8", tissue, ensg_id_prefix)
+        pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_parquet_eqtl_data_restricted(
+    fake_db: FakeGTExDatabase, parquet_db: ParquetGTExDatabase
+):
+    ensg_id_prefix = GENES["CDK18"]["ensg_id"].split(".")[0]
+    start, end = 205_510_000, 205_520_000
+    for columns in (["pval"], ["rs_id", "pos", "beta", "se"]):
+        expected = fake_db.get_eqtl_data(
+            "V10", "Lung", ensg_id_prefix, columns=columns, start=start, end=end
+        )
+        actual = parquet_db.get_eqtl_data(
+            "V10", "Lung", ensg_id_prefix, columns=columns, start=start, end=end
+        )
+        assert list(actual.columns) == ["variant_id"] + columns
+        pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_parquet_eqtl_variants_matches_source(
+    fake_db: FakeGTExDatabase, parquet_db: ParquetGTExDatabase
+):
+    ensg_id_prefix = GENES["ELK4"]["ensg_id"].split(".")[0]
+    elk4_variants = fake_db._gene_variants["ELK4"]
+    variants = [elk4_variants[0]["rs_id"], elk4_variants[7]["variant_id"], "rs1"]
+
+    expected = fake_db.get_eqtl_variants("V8", "Liver", ensg_id_prefix, variants)
+    actual = parquet_db.get_eqtl_variants("V8", "Liver", ensg_id_prefix, variants)
+    assert len(actual) == 2
+    pd.testing.assert_frame_equal(actual, expected)
+    assert parquet_db.get_eqtl_variants("V8", "Liver", ensg_id_prefix, ["rs1"]).empty
+
+
+def test_parquet_variants_by_region_matches_source(
+    fake_db: FakeGTExDatabase, parquet_db: ParquetGTExDatabase
+):
+    start, end = 205_500_000, 205_800_000
+    expected = (
+        fake_db.get_variants_by_region(start, end, "1", "V10")
+        .sort_values("pos")
+        .reset_index(drop=True)
+    )
+    actual = parquet_db.get_variants_by_region(start, end, "1", "V10")
+    assert len(actual) > 0
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_parquet_missing_data(parquet_db: ParquetGTExDatabase):
+    assert parquet_db.get_eqtl_data("V8", "Liver", "ENSG00000000000").empty
+    assert parquet_db.get_eqtl_data("V8", "Not_A_Tissue", "ENSG00000069275").empty
+    assert parquet_db.get_variants_by_region(0, 100, "1", "V8").empty
+    with pytest.raises(ValueError):
+        parquet_db.get_variants_by_region(0, 100, "1", "V7")
+
+
+def test_parquet_root_must_exist(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        ParquetGTExDatabase(str(tmp_path / "missing"))
@@ -0,0 +1,113 @@
+"""
+RealGTExDatabase queries run against a mongomock copy of FakeGTExDatabase's
+data, and compared with FakeGTExDatabase's in-memory results.
+"""
+
+import mongomock
+import pandas as pd
+import pytest
+
+from app.utils.gtex_db.base import GTExDatabase
+from app.utils.gtex_db.real import RealGTExDatabase
+from tests.fake_gtex import FakeGTExDatabase
+
+NUCKS1_PREFIX = "ENSG00000069275"
+
+
+@pytest.fixture(scope="module")
+def fake_db():
+    return FakeGTExDatabase()
+
+
+@pytest.fixture(scope="module")
+def real_db(fake_db):
+    client = mongomock.MongoClient()
+    fake_db.seed(client)
+    return RealGTExDatabase(client)
+
+
+@pytest.mark.parametrize("version", ["V8", "V10"])
+@pytest.mark.parametrize("columns", [None, ["pval"], ["rs_id", "pval"], ["pos", "beta", "se"]])
+def test_get_eqtl_data_matches_fake(fake_db, real_db, version, columns):
+    real = real_db.get_eqtl_data(version, "Liver", NUCKS1_PREFIX, columns=columns)
+    fake = fake_db.get_eqtl_data(version, "Liver", NUCKS1_PREFIX, columns=columns)
+    assert len(real) == fake_db.n_variants_per_gene
+    # Only the whole gene comes with its variant table columns in a different order
+    pd.testing.assert_frame_equal(real, fake, check_like=columns is None)
+
+
+@pytest.mark.parametrize(
+    "first, last, kept",
+    [
+        # start and end are inclusive
+        (5, 14, slice(5, 15)),
+        (0, 0, slice(0, 1)),
+        (None, 9, slice(0, 10)),
+        (40, None, slice(40, None)),
+    ],
+)
+def test_get_eqtl_data_window(fake_db, real_db, first, last, kept):
+    variants = fake_db._gene_variants["NUCKS1"]
+    start = None if first is None else variants[first]["pos"]
+    end = None if last is None else variants[last]["pos"]
+
+    real = real_db.get_eqtl_data(
+        "V10", "Liver", NUCKS1_PREFIX, columns=["rs_id", "pval"], start=start, end=end
+    )
+    fake = fake_db.get_eqtl_data(
+        "V10", "Liver", NUCKS1_PREFIX, columns=["rs_id", "pval"], start=start, end=end
+    )
+    assert list(real["variant_id"]) == [v["variant_id"] for v in variants[kept]]
+    pd.testing.assert_frame_equal(real, fake)
+
+
+def test_get_eqtl_data_empty_window(fake_db, real_db):
+    variants = fake_db._gene_variants["NUCKS1"]
+    start, end = variants[5]["pos"], variants[6]["pos"]
+    assert real_db.get_eqtl_data("V8", "Liver", NUCKS1_PREFIX, start=start + 1, end=end - 1).empty
+    assert real_db.get_eqtl_data(
+        "V8", "Liver", NUCKS1_PREFIX, columns=["pval"], start=0, end=1
+    ).empty
+    assert real_db.get_eqtl_data("V8", "Liver", "ENSG00000000000").empty
+
+
+@pytest.mark.parametrize("version", ["V8", "V10"])
+@pytest.mark.parametrize(
+    "lookup",
+    [
+        # One variant ($elemMatch), by rs ID or variant ID
+        lambda variants: [variants[3]["rs_id"]],
+        lambda variants: [variants[3]["variant_id"]],
+        # Several ($filter), including unknown ones and one variant asked for twice
+        lambda variants: [
+            variants[1]["variant_id"],
+            variants[2]["rs_id"],
+            variants[2]["variant_id"],
+            "rs1",
+            "1_1_A_G_b38",
+        ],
+    ],
+)
+def test_get_eqtl_variants_matches_gene_filter(fake_db, real_db, version, lookup):
+    variants = lookup(fake_db._gene_variants["NUCKS1"])
+    real = real_db.get_eqtl_variants(version, "Liver", NUCKS1_PREFIX, variants)
+    # The previous lookup: fetch the whole gene, then keep the requested variants
+    whole_gene = GTExDatabase.get_eqtl_variants(
+        real_db, version, "Liver", NUCKS1_PREFIX, variants
+    )
+    assert len(real) > 0
+    pd.testing.assert_frame_equal(
+        real.reset_index(drop=True), whole_gene.reset_index(drop=True), check_like=True
+    )
+
+
+def test_get_eqtl_variants_missing(fake_db, real_db):
+    other_gene = fake_db._gene_variants["CDK18"]
+    assert real_db.get_eqtl_variants("V10", "Liver", NUCKS1_PREFIX, ["rs1"]).empty
+    # Variants of another gene have no eQTL for NUCKS1, with one or several of them
+    assert real_db.get_eqtl_variants(
+        "V10", "Liver", NUCKS1_PREFIX, [other_gene[0]["rs_id"]]
+    ).empty
+    assert real_db.get_eqtl_variants(
+        "V10", "Liver", NUCKS1_PREFIX, [v["variant_id"] for v in other_gene[:3]]
+    ).empty
@@ -0,0 +1,84 @@
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+# Cumulative import time budget for a cold `create_app()`, in seconds (with --benchmark).
+# Measured at ~1s on a development machine, so this only catches large regressions.
+STARTUP_BUDGET = float(os.environ.get("STARTUP_IMPORT_BUDGET", 3.0))
+
+# Optional dependencies that are only needed by some requests or pipeline stages,
+# and must be imported where they are used rather than at startup
+LAZY_MODULES = ["pysam", "bs4", "lxml", "gtex_openapi", "scipy", "pyarrow.dataset"]
+
+STARTUP_SCRIPT = """
+from app import create_app
+from app.config import DevConfig
+
+config = DevConfig()
+config.SECRET_KEY = "test"
+config.CACHE_TYPE = "NullCache"
+config.MONGO_URI = None
+config.GTEX_PARQUET_PATH = None
+config.PRELOAD_GENCODE = False
+create_app(config=config)
+
+# Data that is loaded on first use rather than at startup
+from app.utils import _dbsnp_handles, _read_chrom_lengths
+from app.utils.gencode import _gene_name_index, _genes_df
+
+print("gencode tables:", _genes_df.cache_info().currsize + _gene_name_index.cache_info().currsize)
+print("chrom lengths:", _read_chrom_lengths.cache_info().currsize)
+print("dbSNP handles:", len(getattr(_dbsnp_handles, "files", {})))
+"""
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+
+def _import_times():
+    """
+    Run create_app in a fresh interpreter with -X importtime.
+
+    Returns a dict of module name to cumulative import time in seconds,
+    the total time of the top-level imports, and the script's output.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT],
+        cwd=PROJECT_ROOT,
+        env={**os.environ, "PYTHONPATH": PROJECT_ROOT},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    total = 0.0
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)", line)
+        if match is None:
+            continue
+        cumulative = int(match.group(1)) / 1e6
+        times[match.group(3)] = cumulative
+        if match.group(2) == "":
+            total += cumulative
+    return times, total, result.stdout
+
+
+def test_startup_defers_loading():
+    times, _, output = _import_times()
+
+    assert "app.routes" in times
+    assert [module for module in LAZY_MODULES if module in times] == []
+    assert output.splitlines() == [
+        "gencode tables: 0",
+        "chrom lengths: 0",
+        "dbSNP handles: 0",
+    ]
+
+
+@pytest.mark.benchmark
+def test_startup_import_time():
+    _import_times()  # make sure bytecode is cached before measuring
+    times, total, _ = _import_times()
+    assert total < STARTUP_BUDGET, sorted(times.items(), key=lambda item: -item[1])[:20]
@@ -0,0 +1,41 @@
+"""
+Stand-in for app/scripts/r_worker.R that speaks the same PING/RUN protocol, for
+testing the R worker pool without R. Run as `python fake_r_worker.py <reply fd>`.
+
+Jobs are Python scripts, run with the job's arguments as `python script args...`
+would, so that a one-shot run of the same script gives the same result. Scripts
+see the worker's pid in FAKE_R_WORKER_PID.
+"""
+
+import os
+import subprocess
+import sys
+
+
+def reply(replies, status, out=b"", err=b""):
+    replies.write(f"{status}\t{len(out)}\t{len(err)}\n".encode() + out + err)
+    replies.flush()
+
+
+def main():
+    replies = os.fdopen(int(sys.argv[1]), "wb")
+    # Like R's startup messages, which must not get mixed into the replies
+    print("fake R worker started")
+    sys.stdout.flush()
+    for line in sys.stdin:
+        fields = line.rstrip("\n").split("\t")
+        if fields[0] == "PING":
+            reply(replies, 0)
+        elif fields[0] == "RUN":
+            job = subprocess.run(
+                [sys.executable, *fields[1:]],
+                capture_output=True,
+                env={**os.environ, "FAKE_R_WORKER_PID": str(os.getpid())},
+            )
+            reply(replies, job.returncode, job.stdout, job.stderr)
+        else:
+            reply(replies, 2, err=f"Unknown request: {fields[0]}\n".encode())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.colocalization.stages.coloc_simple_sum import ColocSimpleSumStage
+
+# Seconds allowed to assemble the COLOC2 eQTL input of 1,000 tissue/gene pairs (with --benchmark).
+# Measured at ~2.5s on a development machine, so this only catches large regressions.
+ASSEMBLY_BUDGET = float(os.environ.get("COLOC2_ASSEMBLY_BUDGET", 10.0))
+
+
+def _gtex_eqtl_df(rng, num_variants):
+    """A GTEx eQTL dataset aligned to the GWAS variants, with NaN rows for variants GTEx does not have."""
+    maf = rng.uniform(0.01, 0.5, num_variants)
+    df = pd.DataFrame(
+        {
+            "rs_id": [f"rs{i}" for i in range(num_variants)],
+            "chr": "chr1",
+            "pos": np.arange(num_variants) + 1_000_000,
+            "ref": "A",
+            "alt": "G",
+            "pval": rng.uniform(0, 1, num_variants),
+            "beta": rng.normal(0, 0.1, num_variants),
+            "se": rng.uniform(0.01, 0.1, num_variants),
+            "sample_maf": maf,
+            "ma_count": maf * 838,
+        }
+    )
+    df.loc[rng.uniform(0, 1, num_variants) < 0.3] = np.nan
+    return df
+
+
+def test_coloc2_gtex_block():
+    df = _gtex_eqtl_df(np.random.default_rng(0), 100)
+    block = ColocSimpleSumStage._coloc2_gtex_block(df, "Liver:NUCKS1")
+
+    assert list(block.columns) == ColocSimpleSumStage.COLOC2_EQTL_COLNAMES
+    assert len(block) == df["pval"].count()
+    assert list(block["PVAL"]) == list(df["pval"].dropna())
+    assert (block["N"] == 838).all()
+    assert (block["ProbeID"] == "Liver:NUCKS1").all()
+    assert ColocSimpleSumStage._coloc2_gtex_block(df.iloc[:0], "Liver:NUCKS1") is None
+
+
+def _assemble_1000_pairs():
+    rng = np.random.default_rng(1)
+    datasets = [_gtex_eqtl_df(rng, 2000) for _ in range(20)]
+    pairs = [(f"Tissue{i}", f"GENE{j}") for i in range(50) for j in range(20)]
+
+    blocks = []
+    for tissue, gene in pairs:
+        block = ColocSimpleSumStage._coloc2_gtex_block(
+            datasets[int(gene[4:])], f"{tissue}:{gene}"
+        )
+        blocks.append(block)
+    return blocks, ColocSimpleSumStage._concat_coloc2_blocks(blocks)
+
+
+def test_coloc2_assembly_1000_pairs():
+    blocks, coloc2eqtl_df = _assemble_1000_pairs()
+
+    assert len(coloc2eqtl_df) == sum(len(block) for block in blocks)
+    assert coloc2eqtl_df.index.is_unique
+    assert coloc2eqtl_df["ProbeID"].nunique() == 1000
+    assert not coloc2eqtl_df.isna().any().any()
+
+
+@pytest.mark.benchmark
+def test_coloc2_assembly_time():
+    start = time.perf_counter()
+    _assemble_1000_pairs()
+    elapsed = time.perf_counter() - start
+    assert elapsed < ASSEMBLY_BUDGET, f"{elapsed:.2f}s"
+
+
+def test_coloc2_assembly_empty():
+    coloc2eqtl_df = ColocSimpleSumStage._concat_coloc2_blocks([])
+    assert coloc2eqtl_df.shape == (0, len(ColocSimpleSumStage.COLOC2_EQTL_COLNAMES))
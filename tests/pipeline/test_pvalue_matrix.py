@@ -0,0 +1,168 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.colocalization.payload import DataExclusion, DataExclusionReason
+from app.colocalization.stages import coloc_simple_sum
+from app.colocalization.stages.coloc_simple_sum import ColocSimpleSumStage
+from app.scripts import ScriptError
+from app.utils.errors import InvalidUsage
+
+NUM_SNPS = 40
+POSITIONS = np.arange(NUM_SNPS) * 10 + 1_000_000
+VARIANTS = [f"1_{pos}_A_G_b38" for pos in POSITIONS]
+
+
+def _eqtls(rng, variants):
+    return pd.DataFrame(
+        {"variant_id": variants, "pval": rng.uniform(0, 1, len(variants))}
+    )
+
+
+@pytest.fixture()
+def inputs():
+    rng = np.random.default_rng(0)
+    # Every fifth GWAS SNP is left out of the Simple Sum subset
+    kept = [i for i in range(NUM_SNPS) if i % 5 != 4]
+    gwas = pd.DataFrame({"POS": POSITIONS, "P": rng.uniform(0, 1, NUM_SNPS)})
+    gtex = {
+        # All of the SNPs
+        ("Liver", "NUCKS1"): _eqtls(rng, VARIANTS),
+        # A tissue missing some of the SNPs
+        ("Liver", "CDK18"): _eqtls(rng, VARIANTS[::2]),
+        # No overlap: skipped, with a row of NaN
+        ("Blood", "NUCKS1"): _eqtls(rng, ["1_1_C_T_b38", "1_2_C_T_b38"]),
+        # Variants out of order
+        ("Blood", "CDK18"): _eqtls(rng, VARIANTS[::-1]),
+    }
+    secondary_datasets = {
+        # Out of order, with SNPs the GWAS does not have
+        "shuffled": pd.DataFrame(
+            {
+                "SNP": list(rng.permutation(VARIANTS[5:] + ["1_5_C_T_b38"])),
+                "P": rng.uniform(0, 1, NUM_SNPS - 4),
+            }
+        ),
+        # All p values missing: skipped, with a row of NaN
+        "missing": pd.DataFrame({"SNP": VARIANTS, "P": np.nan}),
+        "empty": pd.DataFrame({"SNP": [], "P": []}),
+    }
+    payload = SimpleNamespace(
+        gwas_data=gwas,
+        gwas_data_kept=gwas.loc[kept],
+        gwas_indices_kept=kept,
+        std_snp_list=VARIANTS,
+        secondary_datasets=secondary_datasets,
+        secondary_exclude=DataExclusion(),
+        coloc2=False,
+        eqtl_cache=None,
+        get_gtex_version=lambda: "V10",
+        get_locus=lambda: "1:1000000-1000400",
+        get_coordinate=lambda: "hg38",
+        get_overlap_threshold=lambda: 0.1,
+        get_gtex_selection=lambda: (["Liver", "Blood"], ["NUCKS1", "CDK18"]),
+    )
+    return payload, gtex
+
+
+@pytest.fixture()
+def stage(flask_app, inputs, monkeypatch):
+    _, gtex = inputs
+
+    def get_gtex_data(version, tissue, gene, snp_list, columns=None, cache=None):
+        variants = pd.DataFrame({"variant_id": snp_list.variant_ids})
+        return variants.merge(gtex[(tissue, gene)], on="variant_id", how="left")
+
+    # Variants are already standardized
+    monkeypatch.setattr(coloc_simple_sum, "clean_snps", lambda snps, *args, **kwargs: snps)
+    monkeypatch.setattr(coloc_simple_sum, "standardize_snps", lambda snps, *args: snps)
+    monkeypatch.setattr(coloc_simple_sum, "get_gtex_data", get_gtex_data)
+    with flask_app.app_context():
+        yield ColocSimpleSumStage()
+
+
+def _list_pvalue_matrix(payload, gtex):
+    """The P value matrix as built before it was preallocated: a list of rows, merged one dataset at a time."""
+    kept_variants = pd.DataFrame(
+        {"SNP": [VARIANTS[i] for i in payload.gwas_indices_kept]}
+    )
+    num_snps = len(kept_variants)
+    threshold = payload.get_overlap_threshold()
+    p_value_matrix = [list(payload.gwas_data_kept["P"])]
+    tissues, genes = payload.get_gtex_selection()
+    datasets = [
+        gtex[(tissue, gene)].rename(columns={"variant_id": "SNP", "pval": "P"})
+        for tissue in tissues
+        for gene in genes
+    ] + list(payload.secondary_datasets.values())
+    for dataset in datasets:
+        merged = kept_variants.merge(dataset, on="SNP", how="left")
+        if len(dataset) == 0 or merged["P"].count() / num_snps < threshold:
+            p_value_matrix.append(np.repeat(np.nan, num_snps))
+        else:
+            p_value_matrix.append(list(merged["P"]))
+    return np.matrix(p_value_matrix)
+
+
+def test_pvalue_matrix_matches_list(stage, inputs):
+    payload, gtex = inputs
+    p_value_matrix, coloc2eqtl_df = stage._build_pvalue_matrix(payload)
+
+    assert p_value_matrix.dtype == np.float64
+    assert p_value_matrix.shape == (8, len(payload.gwas_indices_kept))
+    np.testing.assert_array_equal(p_value_matrix, _list_pvalue_matrix(payload, gtex))
+    assert np.isnan(p_value_matrix[2]).sum() == len(payload.gwas_indices_kept) // 2
+    assert np.isnan(p_value_matrix[3]).all() and np.isnan(p_value_matrix[6]).all()
+    assert payload.secondary_exclude.gtex_tissue_gene == {
+        ("Blood", "NUCKS1"): DataExclusionReason.NO_OVERLAP
+    }
+    assert payload.secondary_exclude.uploaded == {
+        "missing": DataExclusionReason.NO_OVERLAP
+    }
+    assert coloc2eqtl_df.empty
+
+
+def test_simple_sum_inputs_match_list(stage, inputs, monkeypatch):
+    payload, _ = inputs
+    p_value_matrix, _ = stage._build_pvalue_matrix(payload)
+    # The LD matrix has every third SNP of the Simple Sum subset, and a SNP without LD
+    ld_positions = [POSITIONS[i] for i in payload.gwas_indices_kept if i % 3 == 0]
+    num_ld_snps = len(ld_positions)
+    ld_matrix = np.matrix(np.full((num_ld_snps, num_ld_snps), 0.5))
+    ld_matrix[4, :] = np.nan
+    ld_matrix[:, 4] = np.nan
+    payload.ld_matrix = ld_matrix
+    payload.ld_snps_bim_df = pd.DataFrame(
+        {"CHROM_POS": [f"1_{pos}" for pos in ld_positions], "POS": ld_positions}
+    )
+    payload.file = SimpleNamespace(
+        p_value_filepath="Pvalues.txt",
+        ld_matrix_filepath="ldmat.txt",
+        ld_mat_snps_filepath="ld_snps.txt",
+        ld_mat_positions_filepath="ld_positions.txt",
+        simple_sum_results_filepath="SSPvalues.txt",
+    )
+    payload.get_p_value_threshold = lambda: 0.05
+
+    written = {}
+    monkeypatch.setattr(
+        coloc_simple_sum, "write_matrix", lambda matrix, path: written.setdefault(path, matrix)
+    )
+    monkeypatch.setattr(coloc_simple_sum, "write_list", lambda values, path: None)
+
+    def simple_sum(*args):
+        raise ScriptError("", "stop after the inputs are written")
+
+    monkeypatch.setattr(coloc_simple_sum, "simple_sum", simple_sum)
+    with pytest.raises(InvalidUsage):
+        stage._run_simple_sum(p_value_matrix, payload)
+
+    # Column selection as done with a list scan
+    SS_positions = list(payload.gwas_data_kept["POS"])
+    p_matrix_indices = [i for i, e in enumerate(SS_positions) if e in ld_positions]
+    non_nan_ld_rows = [i for i in range(num_ld_snps) if i != 4]
+    expected = np.matrix(p_value_matrix)[:, p_matrix_indices][:, non_nan_ld_rows]
+    np.testing.assert_array_equal(written["Pvalues.txt"], expected)
+    assert written["ldmat.txt"].shape == (num_ld_snps - 1, num_ld_snps - 1)
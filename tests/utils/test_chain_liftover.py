@@ -0,0 +1,157 @@
+import gzip
+import os
+import shutil
+import sqlite3
+
+import numpy as np
+
+import pandas as pd
+import pytest
+
+from app.utils.liftover import (
+    ChainMap,
+    LiftoverTable,
+    get_chain_file_path,
+    run_liftover,
+    run_liftover_batch,
+)
+from app.utils.liftover_cache import LiftoverCache
+
+CHAIN = """\
+chain 1000 chr1 1000 + 100 300 chr1 2000 + 1000 1210 1
+50 10 20
+140
+
+chain 900 chr2 1000 + 0 100 chr5 500 - 10 110 2
+100
+
+chain 800 chr1 1000 + 280 320 chr7 1000 + 0 40 3
+40
+
+chain 700 chr3 2000 + 0 1000 chr3 2000 + 0 1000 4
+1000
+
+chain 600 chr3 2000 + 100 110 chr9 2000 + 50 60 5
+10
+"""
+
+
+@pytest.fixture()
+def chain_map(tmp_path):
+    chain_file = tmp_path / "test.over.chain.gz"
+    with gzip.open(chain_file, "wt") as f:
+        f.write(CHAIN)
+    return ChainMap.from_file(str(chain_file))
+
+
+def test_chain_map_lift(chain_map):
+    chroms = ["chr1", "chr1", "chr1", "chr1", "chr1", "chr1", "chr2", "chr3", "chr3", "chr23"]
+    positions = [101, 150, 155, 200, 290, 310, 1, 501, 106, 101]
+
+    new_chroms, new_positions, mapped = chain_map.lift(chroms, positions)
+
+    # 155 is in a gap, 290 and chr3:106 are covered by two chains, chr23 is not in the chain file
+    assert mapped.tolist() == [True, True, False, True, False, True, True, True, False, False]
+    assert new_chroms[mapped].tolist() == ["chr1", "chr1", "chr1", "chr7", "chr5", "chr3"]
+    # chr2:1 maps to the reverse strand of chr5
+    assert new_positions[mapped].tolist() == [1001, 1050, 1110, 30, 490, 501]
+
+
+def test_run_liftover_with_chain_map(chain_map, monkeypatch):
+    monkeypatch.setattr("app.utils.liftover.load_chain_map", lambda _: chain_map)
+    df = pd.DataFrame(
+        {"CHROM": [1, 1, 2], "BP": [101, 155, 1], "SNP": ["rs1", "rs2", "rs3"]},
+        index=[5, 6, 7],
+    )
+
+    lifted, unlifted = run_liftover(df, "hg19", chrom_col="CHROM", pos_col="BP")
+
+    assert list(lifted.columns) == list(df.columns)
+    assert lifted.to_dict(orient="list") == {
+        "CHROM": ["chr1", "chr5"],
+        "BP": [1001, 490],
+        "SNP": ["rs1", "rs3"],
+    }
+    assert unlifted == [1]
+
+
+def test_run_liftover_batch_matches_single_tables(chain_map, monkeypatch):
+    monkeypatch.setattr("app.utils.liftover.load_chain_map", lambda _: chain_map)
+    gwas = pd.DataFrame({"CHROM": [1, 1, 1], "POS": [290, 200, 310], "P": [0.1, 0.2, 0.3]})
+    secondary = pd.DataFrame({"CHROM": ["chr3", "chr2"], "BP": [106, 50], "P": [0.4, 0.5]})
+
+    results = run_liftover_batch(
+        {
+            "gwas": LiftoverTable(gwas, "CHROM", "POS"),
+            "secondary": LiftoverTable(secondary, "CHROM", "BP"),
+        },
+        "hg19",
+    )
+
+    for key, (df, pos_col) in {"gwas": (gwas, "POS"), "secondary": (secondary, "BP")}.items():
+        lifted, unlifted = run_liftover(df, "hg19", pos_col=pos_col)
+        pd.testing.assert_frame_equal(results[key][0], lifted)
+        assert results[key][1] == unlifted
+    assert results["gwas"][1] == [0]
+    assert results["secondary"][1] == [0]
+
+
+def test_run_liftover_with_cache(chain_map, monkeypatch, tmp_path):
+    monkeypatch.setattr("app.utils.liftover.load_chain_map", lambda _: chain_map)
+    cache = LiftoverCache(str(tmp_path / "cache" / "liftover.sqlite"))
+    df = pd.DataFrame({"CHROM": [1, 1, 2, 1], "POS": [101, 155, 1, 290]})
+
+    uncached = run_liftover(df, "hg19")
+    first = run_liftover(df, "hg19", cache=cache)
+    assert cache.stats() == {"hits": 0, "misses": 4, "hit_rate": 0.0, "errors": 0}
+
+    # cached results, including unlifted positions, must not need the chain file
+    monkeypatch.setattr("app.utils.liftover.load_chain_map", None)
+    second = run_liftover(df, "hg19", cache=cache)
+    assert cache.stats() == {"hits": 4, "misses": 4, "hit_rate": 0.5, "errors": 0}
+
+    for lifted, unlifted in (first, second):
+        pd.testing.assert_frame_equal(lifted, uncached[0])
+        assert unlifted == uncached[1] == [1, 3]
+
+
+def test_cache_errors_close_connections(monkeypatch, tmp_path):
+    connections = []
+    connect = sqlite3.connect
+
+    def tracked_connect(*args, **kwargs):
+        connections.append(connect(*args, **kwargs))
+        return connections[-1]
+
+    monkeypatch.setattr(sqlite3, "connect", tracked_connect)
+    cache = LiftoverCache(str(tmp_path / "liftover.sqlite"))
+    chroms, positions = np.array(["1"]), np.array([101])
+    cache.store("hg19", chroms, positions, np.array(["1"]), np.array([1101]), np.array([True]))
+    with connect(cache.path) as conn:
+        conn.execute("DROP TABLE lifted")
+    conn.close()
+
+    cache.lookup("hg19", chroms, positions)
+    cache.store("hg19", chroms, positions, np.array(["1"]), np.array([1101]), np.array([True]))
+    assert cache.errors == 2
+    for conn in connections:
+        with pytest.raises(sqlite3.ProgrammingError, match="closed"):
+            conn.execute("SELECT 1")
+
+
+@pytest.mark.skipif(
+    shutil.which("liftOver") is None or not os.path.exists(get_chain_file_path("hg19")),
+    reason="liftOver binary or chain file is not installed",
+)
+def test_chain_engine_matches_binary():
+    df = pd.DataFrame(
+        {
+            "CHROM": [1] * 6 + [22, 23],
+            "POS": [205500000, 205600000, 205700000, 205800000, 205900000, 206000000, 20000000, 150000000],
+        }
+    )
+    binary = run_liftover(df, "hg19", engine="binary")
+    chain = run_liftover(df, "hg19", engine="chain")
+
+    pd.testing.assert_frame_equal(chain[0], binary[0], check_dtype=False)
+    assert chain[1] == binary[1]
@@ -0,0 +1,158 @@
+import os
+
+import billiard
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.colocalization import coloc2
+from app.colocalization.coloc2 import (
+    compute_coloc2,
+    merge_coloc2_inputs,
+    nelder_mead,
+    split_by_probe,
+)
+
+SAMPLE_DATA = os.path.join(
+    os.path.dirname(__file__), "..", "..", "app", "scripts", "coloc2", "sample_data"
+)
+
+
+def _read_sample(filename):
+    return pd.read_csv(os.path.join(SAMPLE_DATA, filename), sep=r"\s+")
+
+
+def _dataset(rng, n, chrom="1", start=1000, probe=None):
+    """A dataset of n variants with alleles, as written by the Simple Sum stage."""
+    df = pd.DataFrame(
+        {
+            "CHR": chrom,
+            "POS": np.arange(start, start + n),
+            "SNPID": [f"rs{start + i}" for i in range(n)],
+            "A2": "A",
+            "A1": "G",
+            "BETA": rng.normal(0, 0.1, n),
+            "SE": rng.uniform(0.02, 0.05, n),
+            "PVAL": rng.uniform(0.001, 1, n),
+            "MAF": rng.uniform(0.05, 0.5, n),
+            "N": 500,
+        }
+    )
+    if probe is not None:
+        df["ProbeID"] = probe
+    else:
+        df["type"] = "quant"
+    return df
+
+
+def test_nelder_mead_matches_r_optim():
+    # The Rosenbrock example of R's ?optim: optim(c(-1.2, 1), fr) gives 1.000260 1.000506
+    def rosenbrock(x):
+        return 100 * (x[1] - x[0] ** 2) ** 2 + (1 - x[0]) ** 2
+
+    x, value = nelder_mead(rosenbrock, [-1.2, 1])
+    assert x == pytest.approx([1.000260, 1.000506], abs=1e-6)
+    assert value == pytest.approx(8.825241e-08, rel=1e-6)
+
+
+def test_sample_data_matches_r():
+    # PP.H4.abf of COLOC2_samplecode.R on the single gene sample
+    result = compute_coloc2(
+        _read_sample("gwas_file.txt"), _read_sample("eqtl_file.txt")
+    )
+    assert list(result["ProbeID"]) == ["gene_MUC4_tissue_Human_nasal_epithelial"]
+    assert result["PPH4abf"].iloc[0] == pytest.approx(0.9481824, abs=1e-7)
+    assert result["nsnps"].iloc[0] == 401
+
+
+def test_sample_data_40_genes():
+    result = compute_coloc2(
+        _read_sample("gwas_file_for40genes.txt"),
+        _read_sample("eqtl_file_40genes.txt"),
+    )
+    assert list(result["ProbeID"]) == [f"probe{i}" for i in range(1, 41)]
+    assert (result["nsnps"] == 670).all()
+    priors = result[[f"PP{i}.coloc.priors" for i in range(5)]].sum(axis=1)
+    assert priors.to_numpy() == pytest.approx(np.ones(40))
+    assert result["PPH4abf"].between(0, 1).all()
+
+
+def test_merge_filters_variants():
+    rng = np.random.default_rng(0)
+    gwas = _dataset(rng, 100)
+    eqtl = pd.concat(
+        [
+            _dataset(rng, 100, probe="tissue:GENE1"),
+            _dataset(rng, 40, start=1050, probe="tissue:GENE2"),
+        ]
+    )
+    # Rare in the eQTL data, a zero p-value, mismatched and flipped/complemented alleles
+    eqtl.loc[eqtl["SNPID"] == "rs1000", "MAF"] = 0.0005
+    gwas.loc[gwas["SNPID"] == "rs1001", "PVAL"] = 0
+    eqtl.loc[eqtl["SNPID"] == "rs1002", "A1"] = "C"
+    eqtl.loc[eqtl["SNPID"] == "rs1003", ["A1", "A2"]] = ["A", "G"]
+    eqtl.loc[eqtl["SNPID"] == "rs1004", ["A1", "A2"]] = ["c", "t"]
+    # A duplicated indel in the GWAS data
+    indel = gwas[gwas["SNPID"] == "rs1005"].assign(A2="AT")
+    gwas = pd.concat([gwas, indel], ignore_index=True)
+
+    merged, probe_ids = merge_coloc2_inputs(gwas, eqtl)
+    assert probe_ids == ["tissue:GENE1", "tissue:GENE2"]
+    gene1 = merged[merged["probe"] == 0]
+    assert len(gene1) == 97
+    assert {"rs1000", "rs1001", "rs1002"}.isdisjoint(gene1["SNPID"])
+    assert {"rs1003", "rs1004"} <= set(gene1["SNPID"])
+    assert list(gene1.loc[gene1["SNPID"] == "rs1005", "A2.biom"]) == ["A"]
+    assert list(merged.loc[merged["probe"] == 1, "SNPID"]) == [
+        f"rs{pos}" for pos in range(1050, 1090)
+    ]
+
+    # tissue:GENE2 has too few variants
+    result = compute_coloc2(gwas, eqtl)
+    assert list(result["ProbeID"]) == ["tissue:GENE1"]
+    assert list(result["nsnps"]) == [97]
+
+    with pytest.raises(ValueError, match="no ProbeIDs"):
+        compute_coloc2(gwas, eqtl, min_snps=100)
+    with pytest.raises(ValueError, match="MAF"):
+        compute_coloc2(gwas, eqtl.drop(columns="MAF"))
+
+
+def test_split_by_probe():
+    eqtl = _read_sample("eqtl_file_40genes.txt")
+    chunks = split_by_probe(eqtl, 7)
+    assert 1 < len(chunks) <= 7
+    assert pd.concat(chunks).equals(eqtl)
+    probe_chunks = [set(chunk["ProbeID"]) for chunk in chunks]
+    assert sum(map(len, probe_chunks)) == eqtl["ProbeID"].nunique()
+    assert split_by_probe(eqtl.iloc[:0], 4) == []
+
+
+def _compute_in_daemon(gwas, eqtl, results):
+    results.put(compute_coloc2(gwas, eqtl, workers=3))
+
+
+def test_parallel_matches_serial(monkeypatch):
+    gwas = _read_sample("gwas_file_for40genes.txt")
+    eqtl = _read_sample("eqtl_file_40genes.txt")
+    serial = compute_coloc2(gwas, eqtl)
+    monkeypatch.setattr(coloc2, "MIN_CHUNK_ROWS", 1000)
+    try:
+        parallel = compute_coloc2(gwas, eqtl, workers=3)
+        pd.testing.assert_frame_equal(parallel, serial)
+
+        # Celery's pool processes are daemonic, and still get a process pool
+        results = billiard.Queue()
+        process = billiard.Process(
+            target=_compute_in_daemon, args=(gwas, eqtl, results), daemon=True
+        )
+        process.start()
+        pd.testing.assert_frame_equal(results.get(timeout=60), serial)
+        process.join()
+
+        pool_processes = list(coloc2._pool._pool)
+        assert len(pool_processes) == 3
+    finally:
+        coloc2.close_pool()
+    assert coloc2._pool is None
+    assert not any(process.is_alive() for process in pool_processes)
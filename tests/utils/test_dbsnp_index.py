@@ -0,0 +1,231 @@
+import os
+import random
+import shutil
+
+import numpy as np
+import pysam
+import pytest
+
+from app.utils import DBSNP_FILES, resolve_snvs, standardize_snps
+from app.utils import dbsnp_index
+from app.utils.dbsnp_index import (
+    MAX_RS_NUMBER,
+    DbSNPIndex,
+    DbSNPRecord,
+    _open_dbsnp_index,
+    build_dbsnp_index,
+    load_dbsnp_index,
+)
+
+
+def _write_vcf(path, records):
+    """Write records (chrom, pos, id, ref, alt) as a bgzipped, tabix-indexed VCF at path."""
+    with open(path[: -len(".gz")], "w") as f:
+        f.write("##fileformat=VCFv4.0\n")
+        f.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n")
+        for record in records:
+            f.write("\t".join(map(str, record)) + "\t.\t.\tRS=1\n")
+    pysam.tabix_index(path[: -len(".gz")], preset="vcf", force=True)
+
+
+def _random_records(rng, n=2000):
+    records = []
+    rs_number = 1000
+    for chrom in ["1", "2", "X"]:
+        pos = 205_500_000
+        for _ in range(n):
+            pos += rng.randint(0, 300)
+            rs_number += rng.randint(1, 3)
+            ref = rng.choice(["A", "C", "G", "T", "AT", "GTTTACA", "C" * 40])
+            alt = rng.choice(["A", "G", "T", "A,C", "T,G,C"])
+            rsid = rng.choice([f"rs{rs_number}", f"rs{rs_number}", "."])
+            records.append((chrom, pos, rsid, ref, alt))
+    # The same rsID on two records
+    records.append(("X", pos + 10, "rs500", "A", "G"))
+    records.append(("X", pos + 20, "rs500", "C", "T"))
+    records.append(("GL000192.1", 10, "rs1", "A", "G"))
+    return records
+
+
+@pytest.fixture(scope="module")
+def dbsnp_vcf(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("dbsnp") / "dbsnp.vcf.gz")
+    records = _random_records(random.Random(0))
+    _write_vcf(path, records)
+    build_dbsnp_index(path, chunksize=500)
+    return path, records
+
+
+def test_fetch_matches_tabix(dbsnp_vcf):
+    path, _ = dbsnp_vcf
+    index = DbSNPIndex(path + ".index")
+    tabix = pysam.TabixFile(path)
+    rng = random.Random(1)
+    for _ in range(200):
+        chrom = rng.choice(["1", "2", "X"])
+        start = rng.randint(205_400_000, 205_900_000)
+        end = start + rng.choice([1, 10, 1000, 100_000])
+        expected = [
+            DbSNPRecord(row[0], int(row[1]), row[3], row[4])
+            for row in (line.split("\t") for line in tabix.fetch(chrom, start, end))
+        ]
+        assert index.fetch(chrom, start, end) == expected
+    assert index.fetch("GL000192.1", 0, 100) == []
+
+
+def test_lookup_rsids(dbsnp_vcf):
+    path, records = dbsnp_vcf
+    index = load_dbsnp_index(path)
+    assert len(index) == len(records) - 1  # the unplaced contig is skipped
+
+    by_rsid = {}
+    for chrom, pos, rsid, ref, alt in records[:-1]:
+        if rsid != ".":
+            by_rsid.setdefault(rsid, []).append(DbSNPRecord(chrom, pos, ref, alt))
+    queries = list(by_rsid)[::7]
+    queries += ["rs500", "rs999999999", ".", "chr1_5", "rs"]
+
+    results = index.lookup_rsids(queries)
+    for rsid, found in zip(queries, results):
+        assert found == by_rsid.get(rsid, [])
+    assert len(results[queries.index("rs500")]) == 2
+
+
+def test_lookup_rsids_dtype(dbsnp_vcf, monkeypatch):
+    path, records = dbsnp_vcf
+    index = DbSNPIndex(path + ".index")
+    searchsorted = np.searchsorted
+    searched = []
+
+    def spy(a, v, *args, **kwargs):
+        searched.append(np.asarray(v).dtype)
+        return searchsorted(a, v, *args, **kwargs)
+
+    monkeypatch.setattr(dbsnp_index.np, "searchsorted", spy)
+    rsid = next(record[2] for record in records if record[2] != ".")
+    too_large = [
+        f"rs{MAX_RS_NUMBER + 1}",
+        f"rs{MAX_RS_NUMBER + int(rsid[2:]) + 1}",
+        "rs" + "9" * 30,
+    ]
+    results = index.lookup_rsids([rsid, *too_large])
+
+    # Searched with the dtype of the index, rather than converting it to int64
+    assert index.rsid_sorted.dtype == np.uint32
+    assert searched == [np.uint32, np.uint32]
+    assert len(results[0]) > 0 and results[1:] == [[], [], []]
+
+
+def test_load_missing_index(tmp_path):
+    vcf_path = str(tmp_path / "dbsnp.vcf.gz")
+    _write_vcf(vcf_path, [("1", 100, "rs1", "A", "G")])
+    # Not cached while it has not been built
+    assert load_dbsnp_index(vcf_path) is None
+    build_dbsnp_index(vcf_path)
+    index = load_dbsnp_index(vcf_path)
+    assert index is not None and load_dbsnp_index(vcf_path) is index
+
+
+def test_build_rejects_unsorted_vcf(tmp_path):
+    path = str(tmp_path / "unsorted.vcf")
+    with open(path, "w") as f:
+        f.write("#CHROM\tPOS\tID\tREF\tALT\n2\t10\trs1\tA\tG\n1\t20\trs2\tC\tT\n")
+    with pytest.raises(ValueError, match="not sorted"):
+        build_dbsnp_index(path)
+    assert not os.path.exists(path + ".index")
+    assert os.listdir(tmp_path) == ["unsorted.vcf"]
+
+
+def _fetch_snv_per_position(tabix, chrom, pos, ref):
+    """The rule resolve_snvs batches: one tabix query per position."""
+    varlist = [
+        "_".join([row[0], row[1], row[3], row[4], "b38"])
+        for row in (line.split("\t") for line in tabix.fetch(chrom, pos - 1, pos))
+    ]
+    if len(varlist) == 1:
+        return varlist[0]
+    if len(varlist) > 1 and ref != "":
+        return next((v for v in varlist if v.split("_")[2] == ref), ".")
+    return "."
+
+
+@pytest.mark.parametrize("with_index", [False, True])
+def test_resolve_snvs(flask_app, tmp_path, monkeypatch, with_index):
+    rng = random.Random(3)
+    records = _random_records(rng, n=500)
+    # Several records at one position, and a deletion covering later records
+    records += [
+        ("Y", 1000, "rs10", "A", "G"),
+        ("Y", 1000, "rs11", "C", "T"),
+        ("Y", 1000, "rs12", "CTTTTTTTTT", "C"),
+        ("Y", 1005, "rs13", "T", "A"),
+    ]
+    vcf_path = str(tmp_path / DBSNP_FILES["hg38"])
+    os.makedirs(os.path.dirname(vcf_path))
+    _write_vcf(vcf_path, records)
+    if with_index:
+        build_dbsnp_index(vcf_path)
+    monkeypatch.setitem(flask_app.config, "LF_DATA_FOLDER", str(tmp_path))
+    tabix = pysam.TabixFile(vcf_path)
+
+    queries = {"Y": [(999, ""), (1000, ""), (1000, "C"), (1000, "G"), (1005, "")]}
+    queries["Y"] += [(1005, "T"), (1010, "T"), (1000, "CTTTTTTTTT"), (1005, "T")]
+    for chrom in ["1", "X"]:
+        positions = [record[1] for record in records if record[0] == chrom]
+        queries[chrom] = [
+            (pos + rng.randint(-2, 40), rng.choice(["", "A", "C", "AT"]))
+            for pos in rng.sample(positions, 200)
+        ]
+
+    with flask_app.app_context():
+        _open_dbsnp_index.cache_clear()
+        for chrom, chrom_queries in queries.items():
+            positions, refs = zip(*chrom_queries)
+            expected = [
+                _fetch_snv_per_position(tabix, chrom, pos, ref)
+                for pos, ref in chrom_queries
+            ]
+            assert resolve_snvs("hg38", chrom, positions, refs) == expected
+        assert resolve_snvs("hg38", "1", [], []) == []
+        _open_dbsnp_index.cache_clear()
+
+    assert expected != ["."] * len(expected)
+
+
+def test_standardize_snps_with_index(flask_app, fake_gtex_db, tmp_path, monkeypatch):
+    """rsIDs resolve to the same variants with the index as with a tabix scan."""
+    records = _random_records(random.Random(2), n=500)
+    vcf_path = str(tmp_path / DBSNP_FILES["hg38"])
+    os.makedirs(os.path.dirname(vcf_path))
+    _write_vcf(vcf_path, records)
+    shutil.copy(
+        os.path.join(flask_app.config["LF_DATA_FOLDER"], "hg38_chrom_lengths.txt"),
+        tmp_path,
+    )
+    monkeypatch.setitem(flask_app.config, "LF_DATA_FOLDER", str(tmp_path))
+
+    gtex_rsids = [v["rs_id"] for v in fake_gtex_db._gene_variants["NUCKS1"][:5]]
+    dbsnp_rsids = [record[2] for record in records if record[2] != "."][::5]
+    positions = [
+        f"{record[0]}_{record[1]}_{record[3]}"
+        for record in records
+        if record[0] == "1" and 205_500_000 <= record[1] <= 205_800_000
+    ][::7]
+    # rs500 is on another chromosome
+    variants = gtex_rsids + dbsnp_rsids + positions + ["rs999999999", "rs500"]
+    region = "1:205500000-205800000"
+
+    with flask_app.app_context():
+        _open_dbsnp_index.cache_clear()
+        scanned = standardize_snps(variants, region, "hg38")
+        build_dbsnp_index(vcf_path)
+        _open_dbsnp_index.cache_clear()
+        indexed = standardize_snps(variants, region, "hg38")
+        _open_dbsnp_index.cache_clear()
+
+    assert indexed == scanned
+    assert indexed[: len(gtex_rsids)] == [
+        v["variant_id"] for v in fake_gtex_db._gene_variants["NUCKS1"][:5]
+    ]
+    assert indexed[-2:] == [".", "."]
+    assert any(variant.endswith("_b38") for variant in indexed[len(gtex_rsids) :])
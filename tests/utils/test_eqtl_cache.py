@@ -0,0 +1,128 @@
+import os
+
+import pandas as pd
+from flask_caching import Cache
+
+from app.utils.eqtl_cache import EQTLCache, EQTLCacheEntry, SharedEQTLCache
+from tests.fake_gtex import FakeGTExDatabase, GENES
+
+
+class CountingGTExDatabase(FakeGTExDatabase):
+    """FakeGTExDatabase that counts eQTL queries."""
+
+    def __init__(self):
+        super().__init__()
+        self.queries = 0
+
+    def get_eqtl_data(self, *args, **kwargs):
+        self.queries += 1
+        return super().get_eqtl_data(*args, **kwargs)
+
+
+NUCKS1 = GENES["NUCKS1"]["ensg_id"].split(".")[0]
+
+
+def test_eqtl_cache_reuses_covering_result():
+    db = CountingGTExDatabase()
+    cache = EQTLCache()
+    start, end = GENES["NUCKS1"]["start"], GENES["NUCKS1"]["end"]
+
+    full = cache.get_eqtl_data(db, "V8", "Liver", NUCKS1)
+    subset = cache.get_eqtl_data(
+        db, "v8", "Liver", NUCKS1, columns=["pval"], start=start + 10_000, end=end
+    )
+
+    assert db.queries == 1
+    assert cache.stats() == {"hits": 1, "misses": 1}
+    pd.testing.assert_frame_equal(
+        subset,
+        db.get_eqtl_data(
+            "V8", "Liver", NUCKS1, columns=["pval"], start=start + 10_000, end=end
+        ),
+    )
+    assert len(subset) < len(full)
+
+
+def test_eqtl_cache_refetches_wider_query():
+    db = CountingGTExDatabase()
+    cache = EQTLCache()
+
+    cache.get_eqtl_data(db, "V8", "Liver", NUCKS1, columns=["pval"])
+    cache.get_eqtl_data(db, "V8", "Liver", NUCKS1, columns=["pval", "beta"])
+    cache.get_eqtl_data(db, "V8", "Lung", NUCKS1, columns=["pval"])
+
+    assert db.queries == 3
+
+
+def test_eqtl_cache_entry_covers():
+    entry = EQTLCacheEntry(pd.DataFrame(), columns=["pval", "beta"], start=100, end=200)
+    assert entry.covers(["variant_id", "beta"], 100, 200)
+    assert not entry.covers(["se"], 100, 200)
+    assert not entry.covers(None, 100, 200)
+    assert not entry.covers(["pval"], 99, 200)
+    assert not entry.covers(["pval"], 100, None)
+    assert EQTLCacheEntry(pd.DataFrame()).covers(None)
+
+
+def test_shared_eqtl_cache_across_jobs(flask_app):
+    db = CountingGTExDatabase()
+    with flask_app.app_context():
+        flask_cache = Cache(flask_app, config={"CACHE_TYPE": "SimpleCache"})
+        shared = SharedEQTLCache(flask_cache, max_bytes=10**7)
+
+        first = EQTLCache(shared).get_eqtl_data(db, "V8", "Liver", NUCKS1)
+        second = EQTLCache(shared).get_eqtl_data(db, "V8", "Liver", NUCKS1)
+
+    assert db.queries == 1
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_shared_eqtl_cache_evicts_by_size(flask_app):
+    db = FakeGTExDatabase()
+    with flask_app.app_context():
+        flask_cache = Cache(flask_app, config={"CACHE_TYPE": "SimpleCache"})
+        entry_bytes = EQTLCacheEntry(db.get_eqtl_data("V8", "Liver", NUCKS1)).nbytes
+        shared = SharedEQTLCache(flask_cache, max_bytes=int(entry_bytes * 2.5))
+
+        for tissue in ("Liver", "Lung", "Whole_Blood"):
+            shared.set(
+                ("V8", tissue, NUCKS1),
+                EQTLCacheEntry(db.get_eqtl_data("V8", tissue, NUCKS1)),
+            )
+
+        assert shared.get(("V8", "Liver", NUCKS1)) is None
+        assert shared.get(("V8", "Whole_Blood", NUCKS1)) is not None
+        assert shared.total_bytes <= shared.max_bytes
+
+
+def test_shared_eqtl_cache_limit_across_processes(flask_app, tmp_path):
+    """Caches of several processes, sharing a backend, keep its entries under max_bytes together."""
+    db = FakeGTExDatabase()
+    with flask_app.app_context():
+        flask_cache = Cache(flask_app, config={"CACHE_TYPE": "SimpleCache"})
+        entry_bytes = EQTLCacheEntry(db.get_eqtl_data("V8", "Liver", NUCKS1)).nbytes
+        lock_path = str(tmp_path / "eqtl-ledger.lock")
+        # One SharedEQTLCache per process
+        first, second = (
+            SharedEQTLCache(flask_cache, int(entry_bytes * 2.5), lock_path)
+            for _ in range(2)
+        )
+
+        for shared, tissue in [(first, "Liver"), (second, "Lung"), (first, "Whole_Blood")]:
+            shared.set(
+                ("V8", tissue, NUCKS1),
+                EQTLCacheEntry(db.get_eqtl_data("V8", tissue, NUCKS1)),
+            )
+            assert first.total_bytes == second.total_bytes <= first.max_bytes
+        assert second.get(("V8", "Liver", NUCKS1)) is None
+
+        # A hit in one process makes the entry recently used for all of them
+        assert first.get(("V8", "Lung", NUCKS1)) is not None
+        second.set(
+            ("V8", "Brain_Cortex", NUCKS1),
+            EQTLCacheEntry(db.get_eqtl_data("V8", "Brain_Cortex", NUCKS1)),
+        )
+        assert second.get(("V8", "Lung", NUCKS1)) is not None
+        assert second.get(("V8", "Whole_Blood", NUCKS1)) is None
+        assert first.total_bytes <= first.max_bytes
+        assert os.path.exists(lock_path)
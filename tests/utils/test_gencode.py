@@ -0,0 +1,135 @@
+import os
+import random
+
+import pytest
+
+from app.utils.errors import InvalidUsage
+from app.utils.gencode import (
+    GeneIntervalIndex,
+    GeneNameIndex,
+    get_gene_interval_index,
+    get_gene_name_index,
+    get_genes_df,
+    read_genes_df,
+)
+from app.utils.gtex import gene_names
+
+collapsed_genes_df_hg19 = get_genes_df("hg19")
+collapsed_genes_df_hg38 = get_genes_df("hg38")
+
+
+def test_gene_name_index_lookups():
+    index = get_gene_name_index("hg38")
+    assert index.ensg_name("NUCKS1") == "ENSG00000069275.12"
+    assert index.ensg_name("ENSG00000069275.12") == "ENSG00000069275.12"
+    assert index.ensg_name("ENSG00000069275") == "ENSG00000069275.12"
+    assert index.hugo_name("ENSG00000069275") == "NUCKS1"
+    assert index.hugo_name("NUCKS1") == "NUCKS1"
+    assert index.ensg_name("NOT_A_GENE") is None
+    assert index.hugo_name("NOT_A_GENE") is None
+
+
+def test_gene_name_index_is_shared():
+    assert get_gene_name_index("hg38") is get_gene_name_index("GRCh38")
+    assert get_gene_name_index("hg19") is not get_gene_name_index("hg38")
+    with pytest.raises(InvalidUsage):
+        get_gene_name_index("hg18")
+
+
+def test_gene_name_index_first_occurrence_wins():
+    names = list(collapsed_genes_df_hg38["name"])
+    ensg_names = list(collapsed_genes_df_hg38["ENSG_name"])
+    duplicated = collapsed_genes_df_hg38["name"][
+        collapsed_genes_df_hg38["name"].duplicated()
+    ].iloc[0]
+
+    index = GeneNameIndex(collapsed_genes_df_hg38)
+    assert index.ensg_name(duplicated) == ensg_names[names.index(duplicated)]
+
+
+@pytest.mark.parametrize(
+    "gene, expected",
+    [
+        ("NUCKS1", ("NUCKS1", "ENSG00000069275.12")),
+        ("ENSG00000069275.12", ("NUCKS1", "ENSG00000069275.12")),
+        ("NOT_A_GENE", ("NOT_A_GENE", "NOT_A_GENE")),
+    ],
+)
+def test_gene_names(gene, expected):
+    assert gene_names(gene, "hg38") == expected
+
+
+def _overlapping_genes_df(genes_df, chrom, startbp, endbp):
+    """The DataFrame filter the interval index replaces."""
+    return genes_df.loc[
+        (genes_df["chrom"] == ("chr" + str(chrom).replace("23", "X")))
+        & (
+            ((genes_df["txStart"] >= startbp) & (genes_df["txStart"] <= endbp))
+            | ((genes_df["txEnd"] >= startbp) & (genes_df["txEnd"] <= endbp))
+            | ((genes_df["txStart"] <= startbp) & (genes_df["txEnd"] >= endbp))
+        )
+    ]
+
+
+@pytest.mark.parametrize(
+    "build, genes_df",
+    [("hg19", collapsed_genes_df_hg19), ("hg38", collapsed_genes_df_hg38)],
+)
+def test_gene_interval_index_matches_dataframe_filter(build, genes_df):
+    index = get_gene_interval_index(build)
+    rng = random.Random(0)
+    for _ in range(200):
+        chrom = rng.randint(1, 23)
+        startbp = rng.randint(0, 150_000_000)
+        endbp = startbp + rng.choice([0, 1_000, 100_000, 1_000_000, 10_000_000])
+        expected = _overlapping_genes_df(genes_df, chrom, startbp, endbp)
+        assert index.overlapping(chrom, startbp, endbp).tolist() == [
+            genes_df.index.get_loc(i) for i in expected.index
+        ]
+
+
+def test_gene_interval_index_genes_data():
+    index = GeneIntervalIndex(collapsed_genes_df_hg38)
+    # NUCKS1 region on chr1
+    genes_data = index.genes_data(1, 205_700_000, 205_800_000)
+    expected = _overlapping_genes_df(
+        collapsed_genes_df_hg38, 1, 205_700_000, 205_800_000
+    )
+
+    assert [gene["name"] for gene in genes_data] == list(expected["name"])
+    nucks1 = genes_data[[gene["name"] for gene in genes_data].index("NUCKS1")]
+    row = expected[expected["name"] == "NUCKS1"].iloc[0]
+    assert nucks1["txStart"] == row["txStart"] and nucks1["txEnd"] == row["txEnd"]
+    assert nucks1["exonStarts"] == [int(bp) for bp in row["exonStarts"].split(",")]
+    assert nucks1["exonEnds"] == [int(bp) for bp in row["exonEnds"].split(",")]
+    assert all(type(bp) is int for bp in nucks1["exonStarts"] + [nucks1["txStart"]])
+
+    assert index.genes_data("chrX", 0, 1) == index.genes_data(23, 0, 1)
+    assert index.genes_data("chrUn", 0, 10**9) == []
+
+
+def test_genes_df_is_shared():
+    assert get_genes_df("GRCh38") is collapsed_genes_df_hg38
+    with pytest.raises(InvalidUsage):
+        get_genes_df("hg18")
+
+
+def test_read_genes_df_binary_copy(tmp_path):
+    path = tmp_path / "genes.gz"
+    collapsed_genes_df_hg38.head(100).to_csv(path, sep="\t", index=False)
+    cache_folder = tmp_path / "cache"
+
+    genes_df = read_genes_df(str(path), str(cache_folder))
+    assert os.listdir(cache_folder) == ["genes.feather"]
+    copy_path = cache_folder / "genes.feather"
+    copy_mtime = os.path.getmtime(copy_path)
+    assert read_genes_df(str(path), str(cache_folder)).equals(genes_df)
+    assert os.path.getmtime(copy_path) == copy_mtime
+
+    # A corrupt or outdated copy is rewritten from the source file
+    copy_path.write_bytes(b"not feather")
+    assert read_genes_df(str(path), str(cache_folder)).equals(genes_df)
+    collapsed_genes_df_hg38.head(10).to_csv(path, sep="\t", index=False)
+    os.utime(path, (copy_mtime + 10, copy_mtime + 10))
+    assert len(read_genes_df(str(path), str(cache_folder))) == 10
+    assert len(read_genes_df(str(path), str(cache_folder))) == 10
@@ -0,0 +1,62 @@
+import random
+import threading
+import time
+
+import pytest
+from flask import current_app
+
+from app.utils.gtex_fetcher import GTExFetcher
+
+
+def test_fetcher_preserves_order(flask_app):
+    fetcher = GTExFetcher(max_workers=4)
+    rng = random.Random(0)
+    delays = [rng.uniform(0, 0.01) for _ in range(20)]
+
+    def fetch(i):
+        time.sleep(delays[i])
+        # GTEx queries look up the database through the app context
+        assert current_app.name == flask_app.name
+        return i * 2
+
+    with flask_app.app_context():
+        results = fetcher.map(fetch, range(20))
+
+    assert results == [i * 2 for i in range(20)]
+    stats = fetcher.stats()
+    assert stats["completed"] == 20
+    assert stats["in_flight"] == 0
+    assert 1 <= stats["peak_in_flight"] <= 4
+
+
+def test_fetcher_runs_concurrently(flask_app):
+    fetcher = GTExFetcher(max_workers=3)
+    barrier = threading.Barrier(3, timeout=5)
+
+    with flask_app.app_context():
+        # Deadlocks (and times out) unless three calls run at once
+        results = fetcher.map(lambda i: barrier.wait() >= 0 and i, [0, 1, 2])
+
+    assert results == [0, 1, 2]
+    assert fetcher.stats()["peak_in_flight"] == 3
+
+
+def test_fetcher_raises_first_error(flask_app):
+    fetcher = GTExFetcher(max_workers=2)
+
+    def fetch(i):
+        if i >= 2:
+            raise ValueError(f"failed {i}")
+        return i
+
+    with flask_app.app_context():
+        with pytest.raises(ValueError, match="failed 2"):
+            fetcher.map(fetch, range(5))
+
+    assert fetcher.stats()["failed"] >= 1
+
+
+def test_fetcher_sequential():
+    fetcher = GTExFetcher(max_workers=1)
+    assert fetcher.map(lambda i: i + 1, [1, 2, 3]) == [2, 3, 4]
+    assert fetcher._executor is None
@@ -0,0 +1,45 @@
+import io
+
+import numpy as np
+
+from app.utils.htmltableparser import iter_html_tables
+
+SAMPLE_HTML = b"""<!DOCTYPE html>
+<html><h3>Dataset A</h3><table border="1" class="dataframe">
+  <thead>
+    <tr style="text-align: right;"><th>CHROM</th><th>BP</th><th>SNP</th><th>P</th></tr>
+  </thead>
+  <tbody>
+    <tr><td>1</td><td>205860191</td><td>rs149104610</td><td>0.237211</td></tr>
+    <tr><td>1</td><td>205860462</td><td>rs183927606</td><td>0.252347</td></tr>
+  </tbody>
+</table><h3>Dataset B</h3><table border="1" class="dataframe">
+  <thead><tr><th>CHROM</th><th>BP</th></tr></thead>
+  <tbody><tr><td>1</td><td>2</td><td>3</td></tr></tbody>
+</table><h3>Dataset C</h3><table border="1" class="dataframe">
+  <thead><tr><th>CHROM</th><th>BP</th><th>SNP</th><th>P</th></tr></thead>
+  <tbody></tbody>
+</table></html>"""
+
+
+def test_iter_html_tables_titles_and_types():
+    tables = list(iter_html_tables(io.BytesIO(SAMPLE_HTML)))
+
+    assert [title for title, _ in tables] == ["Dataset A", "Dataset B", "Dataset C"]
+
+    table_a = tables[0][1]
+    assert list(table_a.columns) == ["CHROM", "BP", "SNP", "P"]
+    assert table_a.shape == (2, 4)
+    assert table_a["BP"].dtype == np.float64
+    assert table_a["P"].dtype == np.float64
+    assert table_a["SNP"].dtype == object
+    assert list(table_a["SNP"]) == ["rs149104610", "rs183927606"]
+
+
+def test_iter_html_tables_malformed_table():
+    """A malformed table is reported without stopping the stream"""
+    tables = list(iter_html_tables(io.BytesIO(SAMPLE_HTML)))
+
+    assert isinstance(tables[1][1], Exception)
+    # the table after the malformed one is still read
+    assert tables[2][1].shape == (0, 4)
@@ -0,0 +1,72 @@
+import os
+import shutil
+
+import pandas as pd
+import pysam
+import pytest
+
+from app.colocalization import plink
+from app.colocalization.plink import read_plink_bim, resolve_plink_filepath
+from app.utils import DBSNP_FILES, get_chrom_lengths, get_dbsnp_tabix
+from app.utils.preload import preload_reference_data
+
+
+@pytest.fixture()
+def data_folder(flask_app, tmp_path, monkeypatch):
+    """Point LF_DATA_FOLDER at a folder with a tiny dbSNP VCF and 1000 Genomes .bim file."""
+    vcf_path = tmp_path / DBSNP_FILES["hg38"]
+    vcf_path.parent.mkdir(parents=True)
+    with open(str(vcf_path)[: -len(".gz")], "w") as f:
+        f.write("##fileformat=VCFv4.0\n")
+        f.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n")
+        f.write("1\t205000001\trs1\tA\tG\t.\t.\t.\n")
+    pysam.tabix_index(str(vcf_path)[: -len(".gz")], preset="vcf")
+
+    (tmp_path / "1000Genomes_GRCh38").mkdir()
+    pd.DataFrame([[1, "chr1:205000001", 0, 205000001, "G", "A"]]).to_csv(
+        tmp_path / "1000Genomes_GRCh38" / "chr1.bim",
+        sep="\t",
+        header=False,
+        index=False,
+    )
+    shutil.copy(
+        os.path.join(flask_app.config["LF_DATA_FOLDER"], "hg38_chrom_lengths.txt"),
+        tmp_path,
+    )
+
+    monkeypatch.setitem(flask_app.config, "LF_DATA_FOLDER", str(tmp_path))
+    monkeypatch.setattr(plink, "_preloaded_bims", {})
+    with flask_app.app_context():
+        yield tmp_path
+
+
+def test_preload_reference_data(data_folder):
+    timings = preload_reference_data(
+        ["chrom_lengths", "bim", "dbsnp"], ["hg38"], ["EUR"]
+    )
+    assert set(timings) == {"chrom_lengths:hg38", "bim:hg38:EUR", "dbsnp:hg38"}
+
+    plink_filepath = resolve_plink_filepath("hg38", "EUR", 1)
+    assert read_plink_bim(plink_filepath) is read_plink_bim(plink_filepath)
+    assert get_chrom_lengths("hg38") is get_chrom_lengths("hg38")
+    assert get_dbsnp_tabix("hg38") is get_dbsnp_tabix("GRCh38")
+    rows = list(get_dbsnp_tabix("hg38").fetch("1", 205000000, 205000001))
+    assert [row.split("\t")[2] for row in rows] == ["rs1"]
+
+
+def test_preload_skips_missing_data(data_folder):
+    # No hg19 dbSNP file or chain files in the data folder
+    timings = preload_reference_data(["dbsnp"], ["hg19", "hg38"])
+    assert list(timings) == ["dbsnp:hg38"]
+
+
+def test_preload_unknown_target(flask_app):
+    with pytest.raises(ValueError, match="refseq"):
+        preload_reference_data(["gencode", "refseq"], ["hg38"])
+
+
+def test_read_plink_bim_without_preload(data_folder):
+    plink_filepath = resolve_plink_filepath("hg38", "EUR", 1)
+    bim_df = read_plink_bim(plink_filepath)
+    assert list(bim_df.iloc[:, 3]) == [205000001]
+    assert read_plink_bim(plink_filepath) is not bim_df
@@ -0,0 +1,227 @@
+import os
+import shutil
+import signal
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.scripts import BASE_DIR, r_worker, run_r_script, set_based_test, simple_sum
+from app.scripts.r_worker import (
+    RWorkerError,
+    RWorkerPool,
+    get_r_worker_pool,
+    start_r_workers,
+)
+from app.utils import write_matrix
+
+# CI sets REQUIRE_RSCRIPT, so that these tests fail rather than skip there without R
+requires_r = pytest.mark.skipif(
+    shutil.which("Rscript") is None and not os.environ.get("REQUIRE_RSCRIPT"),
+    reason="Rscript is not installed",
+)
+FAKE_WORKER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "fake_r_worker.py")
+# Prints its arguments, and the pid of the worker running it; exits with its first argument
+ECHO_SCRIPT = """
+import os, sys
+print("args:", *sys.argv[1:])
+print("worker:", os.environ.get("FAKE_R_WORKER_PID"))
+print("caf\u00e9\tdone", file=sys.stderr)
+sys.exit(int(sys.argv[1]))
+"""
+# Kills the worker running it, as a crash of R would; prints when run by a one-shot "Rscript"
+CRASH_SCRIPT = """
+import os, signal
+if "FAKE_R_WORKER_PID" in os.environ:
+    os.kill(int(os.environ["FAKE_R_WORKER_PID"]), signal.SIGKILL)
+print("one-shot")
+"""
+
+
+@pytest.fixture()
+def r_workers(flask_app, monkeypatch):
+    """An app context with a pool of one R worker that is replaced after two jobs."""
+    monkeypatch.setitem(flask_app.config, "R_WORKERS", 1)
+    monkeypatch.setitem(flask_app.config, "R_WORKER_MAX_JOBS", 2)
+    monkeypatch.setattr(r_worker, "_pool", None)
+    with flask_app.app_context():
+        pool = get_r_worker_pool()
+        yield pool
+        pool.close()
+
+
+@pytest.fixture()
+def fake_r(flask_app, monkeypatch):
+    """
+    An app context whose "Rscript" and R worker are Python (see tests/fake_r_worker.py),
+    with a pool of one worker that is replaced after three jobs.
+    """
+    monkeypatch.setattr(r_worker, "RSCRIPT", sys.executable)
+    monkeypatch.setattr(r_worker, "WORKER_SCRIPT", FAKE_WORKER)
+    monkeypatch.setitem(flask_app.config, "R_WORKERS", 1)
+    monkeypatch.setitem(flask_app.config, "R_WORKER_MAX_JOBS", 3)
+    monkeypatch.setattr(r_worker, "_pool", None)
+    with flask_app.app_context():
+        pool = get_r_worker_pool()
+        yield pool
+        pool.close()
+
+
+def _script(tmp_path, name, code):
+    path = tmp_path / name
+    path.write_text(code)
+    return str(path)
+
+
+def _worker_pid(result):
+    return result.stdout.splitlines()[1].split(" ")[1]
+
+
+def _simple_sum_inputs(tmp_path, num_snps=60, num_genes=3):
+    rng = np.random.default_rng(0)
+    distance = np.abs(np.subtract.outer(np.arange(num_snps), np.arange(num_snps)))
+    ld_matrix = 0.9**distance
+    p_values = rng.uniform(1e-6, 1, (num_genes + 1, num_snps))
+    p_values[1, :10] = 1e-8
+    write_matrix(np.matrix(p_values), str(tmp_path / "Pvalues.txt"))
+    write_matrix(np.matrix(ld_matrix), str(tmp_path / "ldmat.txt"))
+    return str(tmp_path / "Pvalues.txt"), str(tmp_path / "ldmat.txt")
+
+
+def test_pool_without_worker(flask_app, tmp_path, monkeypatch):
+    pool = RWorkerPool(1, 10, worker_script=str(tmp_path / "missing.R"))
+    with pytest.raises(RWorkerError):
+        pool.run("script.R", [])
+    # Later jobs go to a one-shot Rscript for a while rather than waiting for a worker to start
+    with pytest.raises(RWorkerError, match="recently"):
+        pool.run("script.R", [])
+    with pytest.raises(RWorkerError, match="tabs or newlines"):
+        pool.run("script.R", ["a\tb"])
+
+    monkeypatch.setitem(flask_app.config, "R_WORKERS", 0)
+    with flask_app.app_context():
+        assert get_r_worker_pool() is None
+
+
+def test_fake_worker_jobs(fake_r, tmp_path):
+    echo = _script(tmp_path, "echo.py", ECHO_SCRIPT)
+    first = run_r_script(echo, ["0", "a b", tmp_path / "file.txt"])
+    assert first.returncode == 0
+    assert first.stdout.splitlines()[0] == f"args: 0 a b {tmp_path / 'file.txt'}"
+    assert first.stderr == "caf\u00e9\tdone\n"
+    worker = fake_r._idle[0]
+    assert _worker_pid(first) == str(worker.process.pid)
+
+    failed = run_r_script(echo, ["3"])
+    assert failed.returncode == 3 and _worker_pid(failed) == _worker_pid(first)
+    # Replaced after three jobs
+    third = run_r_script(echo, ["0"])
+    assert _worker_pid(third) == _worker_pid(first)
+    assert fake_r._idle == [] and not worker.is_alive()
+    assert _worker_pid(run_r_script(echo, ["0"])) != _worker_pid(first)
+
+
+def test_fake_worker_health_check(fake_r, tmp_path, monkeypatch):
+    echo = _script(tmp_path, "echo.py", ECHO_SCRIPT)
+    first = run_r_script(echo, ["0"])
+    worker = fake_r._idle[0]
+
+    # A worker that stopped answering is replaced before its next job
+    monkeypatch.setattr(r_worker, "HEALTH_CHECK_INTERVAL", 0)
+    monkeypatch.setattr(r_worker, "PING_TIMEOUT", 0.5)
+    os.kill(worker.process.pid, signal.SIGSTOP)
+    second = run_r_script(echo, ["0"])
+    assert _worker_pid(second) not in ("None", _worker_pid(first))
+    assert not worker.is_alive()
+
+
+def test_fake_worker_timeout(fake_r, tmp_path):
+    sleep = _script(tmp_path, "sleep.py", "import time\ntime.sleep(30)\n")
+    fake_r.run(_script(tmp_path, "echo.py", ECHO_SCRIPT), ["0"])
+    worker = fake_r._idle[0]
+    start = time.monotonic()
+    with pytest.raises(RWorkerError, match="in time"):
+        fake_r.run(sleep, [], timeout=0.5)
+    assert time.monotonic() - start < 5
+    assert fake_r._idle == [] and not worker.is_alive()
+
+
+def test_fake_worker_fallbacks(fake_r, tmp_path):
+    echo = _script(tmp_path, "echo.py", ECHO_SCRIPT)
+    # The worker dies during the job, which then runs with a one-shot "Rscript"
+    crashed = run_r_script(_script(tmp_path, "crash.py", CRASH_SCRIPT), [])
+    assert crashed.returncode == 0 and crashed.stdout == "one-shot\n"
+    assert fake_r._idle == []
+
+    # So do jobs that come while every worker is busy
+    assert fake_r._slots.acquire(blocking=False)
+    try:
+        assert _worker_pid(run_r_script(echo, ["0"])) == "None"
+    finally:
+        fake_r._slots.release()
+    assert _worker_pid(run_r_script(echo, ["0"])) != "None"
+
+
+def test_fake_worker_start(fake_r, tmp_path, monkeypatch):
+    start = time.monotonic()
+    start_r_workers()
+    # Returns before the worker is ready, without waiting for R to load
+    assert time.monotonic() - start < 1
+    deadline = time.monotonic() + 30
+    while not fake_r._idle and time.monotonic() < deadline:
+        time.sleep(0.05)
+    worker = fake_r._idle[0]
+    assert worker.jobs_run == 0
+
+    # A forked process starts a pool of its own, and leaves the parent's workers alone
+    monkeypatch.setattr(r_worker, "_pool_pid", -1)
+    child_pool = get_r_worker_pool()
+    assert child_pool is not fake_r
+    echo = _script(tmp_path, "echo.py", ECHO_SCRIPT)
+    assert _worker_pid(child_pool.run(echo, ["0"])) != str(worker.process.pid)
+    assert worker.is_alive()
+    child_pool.close()
+
+
+@requires_r
+def test_worker_matches_rscript(r_workers, flask_app, tmp_path, monkeypatch):
+    p_values_filepath, ldmatrix_filepath = _simple_sum_inputs(tmp_path)
+    r_workers.max_jobs = 10
+    in_worker = simple_sum(
+        p_values_filepath, ldmatrix_filepath, str(tmp_path / "worker.txt")
+    )
+    first_stage_in_worker = set_based_test(
+        p_values_filepath, ldmatrix_filepath, str(tmp_path / "worker_first_stage.txt")
+    )
+    # Both ran in the worker, rather than falling back to a one-shot Rscript
+    assert [worker.jobs_run for worker in r_workers._idle] == [2]
+
+    monkeypatch.setitem(flask_app.config, "R_WORKERS", 0)
+    one_shot = simple_sum(
+        p_values_filepath, ldmatrix_filepath, str(tmp_path / "rscript.txt")
+    )
+    first_stage_one_shot = set_based_test(
+        p_values_filepath, ldmatrix_filepath, str(tmp_path / "rscript_first_stage.txt")
+    )
+    pd.testing.assert_frame_equal(in_worker, one_shot)
+    pd.testing.assert_frame_equal(first_stage_in_worker, first_stage_one_shot)
+    assert len(first_stage_in_worker) == 4
+
+
+@requires_r
+def test_worker_recycling(r_workers, tmp_path):
+    p_values_filepath, ldmatrix_filepath = _simple_sum_inputs(tmp_path)
+    args = [p_values_filepath, ldmatrix_filepath, "--outfilename", str(tmp_path / "ss.txt")]
+    script = os.path.join(BASE_DIR, "getSimpleSumStats.R")
+
+    first = r_workers.run(script, args)
+    worker = r_workers._idle[0]
+    failed = r_workers.run(script, [p_values_filepath, str(tmp_path / "missing.txt")])
+    assert first.returncode == 0
+    assert failed.returncode == 1 and "missing.txt" in failed.stderr
+    # Replaced after two jobs, including the failed one
+    assert r_workers._idle == [] and not worker.is_alive()
+    assert r_workers.run(script, args).returncode == 0
+    assert r_workers._idle[0] is not worker
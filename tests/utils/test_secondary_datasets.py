@@ -0,0 +1,55 @@
+import io
+import tarfile
+
+import pandas as pd
+import pytest
+
+from app.utils.errors import InvalidUsage
+from app.utils.secondary_datasets import iter_parquet_tables, iter_tar_tables
+
+DATASETS = {
+    "FVC - 3062": pd.DataFrame(
+        {"CHROM": [1, 1], "BP": [205860191, 205860462], "SNP": ["rs1", "rs2"], "P": [0.2, 0.3]}
+    ),
+    "FEV1 - 3063": pd.DataFrame(
+        {"CHROM": [1], "BP": [205860191], "SNP": ["rs1"], "P": [0.03]}
+    ),
+}
+
+
+def test_iter_parquet_tables(tmp_path):
+    filepath = tmp_path / "merged.parquet"
+    pd.concat(
+        [df.assign(dataset_title=title) for title, df in DATASETS.items()],
+        ignore_index=True,
+    ).to_parquet(filepath, index=False)
+
+    tables = list(iter_parquet_tables(filepath))
+
+    assert [title for title, _ in tables] == list(DATASETS.keys())
+    for title, table in tables:
+        pd.testing.assert_frame_equal(table, DATASETS[title])
+
+
+def test_iter_parquet_tables_missing_title_column(tmp_path):
+    filepath = tmp_path / "merged.parquet"
+    DATASETS["FVC - 3062"].to_parquet(filepath, index=False)
+
+    with pytest.raises(InvalidUsage):
+        list(iter_parquet_tables(filepath))
+
+
+def test_iter_tar_tables(tmp_path):
+    filepath = tmp_path / "merged.tar"
+    with tarfile.open(filepath, "w") as tar:
+        for title, df in DATASETS.items():
+            data = df.to_csv(sep="\t", index=False).encode("utf-8")
+            info = tarfile.TarInfo(name=f"{title}.tsv")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+    tables = list(iter_tar_tables(filepath))
+
+    assert [title for title, _ in tables] == list(DATASETS.keys())
+    for title, table in tables:
+        pd.testing.assert_frame_equal(table, DATASETS[title])
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.utils.errors import InvalidUsage
+from app.utils.variant_index import VariantIndex
+
+GWAS_SNPS = ["1_100_A_G_b38", "1_200_C_T_b38", ".", "1_400_G_A_b38", "1_200_C_T_b38"]
+
+
+def test_positions():
+    index = VariantIndex(GWAS_SNPS)
+    secondary_snps = ["1_400_G_A_b38", ".", "1_200_C_T_b38", "1_400_G_A_b38", "1_999_T_C_b38"]
+
+    # First occurrence wins, '.' never matches, duplicated GWAS SNPs share a row
+    assert index.positions(secondary_snps).tolist() == [-1, 2, -1, 0, 2]
+    assert index.positions([]).tolist() == [-1] * len(GWAS_SNPS)
+
+
+def test_align():
+    index = VariantIndex(GWAS_SNPS)
+    secondary = pd.DataFrame(
+        {"SNP": ["rs4", "rs2", "rs9"], "P": [0.4, 0.2, 0.9]}, index=[10, 11, 12]
+    )
+
+    aligned = index.align(secondary, ["1_400_G_A_b38", "1_200_C_T_b38", "."])
+
+    assert list(aligned.index) == list(range(len(GWAS_SNPS)))
+    np.testing.assert_array_equal(aligned["P"], [np.nan, 0.2, np.nan, 0.4, 0.2])
+    assert aligned["SNP"].tolist()[1::2] == ["rs2", "rs4"]
+
+
+def test_uses_rsids():
+    assert VariantIndex(["rs1", ".", "rs2"]).uses_rsids
+    assert not VariantIndex(GWAS_SNPS).uses_rsids
+
+    with pytest.raises(InvalidUsage, match="mix"):
+        VariantIndex(["rs1", "1_100_A_G_b38"]).uses_rsids
+    with pytest.raises(InvalidUsage):
+        VariantIndex(["notavariant"]).uses_rsids